@@ -0,0 +1,187 @@
+"""
+A content-addressed cache of pipeline artifacts, keyed by the command
+that produced them and the contents of its input files, shared across
+pipeline runs and bounded in size by least-recently-used eviction.
+"""
+from __future__ import absolute_import, division, print_function
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+
+# content hashes of files, keyed by (path, size, mtime)
+_hashes = {}
+
+
+def content_hash(path):
+    """
+    Get an md5 hash of the contents of a file or directory (Ex. a CASA table).
+    Hashes are memoized on path, size and modification time.
+
+    Args:
+        path : str, path to file or directory
+
+    Returns:
+        str, hex digest, or None if path doesn't exist
+    """
+    if not os.path.exists(path):
+        return None
+    if os.path.isdir(path):
+        md5 = hashlib.md5()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for f in sorted(files):
+                # skip CASA table locks, which change on access
+                if f == 'table.lock':
+                    continue
+                fname = os.path.join(root, f)
+                md5.update("{}:{}\n".format(os.path.relpath(fname, path), content_hash(fname)).encode())
+        return md5.hexdigest()
+
+    st = os.stat(path)
+    memo = (os.path.abspath(path), st.st_size, st.st_mtime)
+    if memo not in _hashes:
+        md5 = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(2**20), b''):
+                md5.update(chunk)
+        _hashes[memo] = md5.hexdigest()
+
+    return _hashes[memo]
+
+
+def _path_size(path):
+    """Get the size of a file or directory in bytes"""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    size = 0
+    for root, dirs, files in os.walk(path):
+        size += sum([os.path.getsize(os.path.join(root, f)) for f in files])
+    return size
+
+
+def _copy(src, dst):
+    """Copy a file or directory, replacing dst"""
+    if os.path.isdir(dst):
+        shutil.rmtree(dst)
+    elif os.path.exists(dst):
+        os.remove(dst)
+    if os.path.isdir(src):
+        shutil.copytree(src, dst)
+    else:
+        shutil.copy2(src, dst)
+
+
+class ArtifactCache(object):
+    """
+    A directory of cached artifacts. Each entry is a subdirectory named
+    by its key, holding copies of the artifacts a command produced.
+    """
+    def __init__(self, cache_dir, max_size=None):
+        """
+        Args:
+            cache_dir : str, path to cache directory, created if it doesn't exist
+            max_size : float, maximum total size of cache in bytes, None for no limit
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def key(self, cmd, inputs=[]):
+        """
+        Get the cache key of a command.
+
+        Args:
+            cmd : list of command arguments (or any other description of how
+                artifacts are produced), stripped of anything that doesn't affect them
+            inputs : list of paths to input files of the command
+
+        Returns:
+            str, hex digest
+        """
+        desc = json.dumps([[str(c) for c in cmd], [content_hash(f) for f in inputs]])
+        return hashlib.md5(desc.encode()).hexdigest()
+
+    def fetch(self, key, outputs):
+        """
+        Copy cached artifacts to their output paths, if cached.
+
+        Args:
+            key : str, cache key
+            outputs : list of output paths, in the order they were stored
+
+        Returns:
+            bool, True if artifacts were found and copied
+        """
+        entry = os.path.join(self.cache_dir, key)
+        try:
+            with open(os.path.join(entry, 'outputs.json')) as f:
+                Noutputs = len(json.load(f))
+            if Noutputs != len(outputs):
+                return False
+            for i, out in enumerate(outputs):
+                _copy(os.path.join(entry, str(i)), out)
+            # mark as recently used
+            os.utime(entry, None)
+        except (IOError, OSError, ValueError):
+            # missing, or evicted by another process
+            return False
+
+        return True
+
+    def store(self, key, outputs):
+        """
+        Copy artifacts into the cache, and evict least recently used entries
+        if the cache is larger than max_size.
+
+        Args:
+            key : str, cache key
+            outputs : list of output paths
+
+        Returns:
+            bool, True if artifacts were stored
+        """
+        if not all([os.path.exists(out) for out in outputs]):
+            return False
+        entry = os.path.join(self.cache_dir, key)
+        tmp = tempfile.mkdtemp(prefix='.tmp', dir=self.cache_dir)
+        try:
+            for i, out in enumerate(outputs):
+                _copy(out, os.path.join(tmp, str(i)))
+            with open(os.path.join(tmp, 'outputs.json'), 'w') as f:
+                json.dump([os.path.basename(out) for out in outputs], f)
+            if os.path.exists(entry):
+                shutil.rmtree(entry)
+            os.rename(tmp, entry)
+        finally:
+            if os.path.exists(tmp):
+                shutil.rmtree(tmp)
+        self.evict()
+
+        return True
+
+    def entries(self):
+        """
+        Get cache entries, least recently used first.
+
+        Returns:
+            list of (key, size in bytes)
+        """
+        keys = [k for k in os.listdir(self.cache_dir) if not k.startswith('.')]
+        keys = sorted(keys, key=lambda k: os.path.getmtime(os.path.join(self.cache_dir, k)))
+        return [(k, _path_size(os.path.join(self.cache_dir, k))) for k in keys]
+
+    def evict(self):
+        """Remove least recently used entries until the cache is within max_size"""
+        if self.max_size is None:
+            return
+        entries = self.entries()
+        total = sum([size for k, size in entries])
+        for k, size in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(os.path.join(self.cache_dir, k), ignore_errors=True)
+            total -= size
@@ -12,6 +12,8 @@ import yaml
 from collections import OrderedDict as odict
 import datetime
 import sys
+import hashlib
+import threading
 
 
 def get_hdu_info(hdu):
@@ -257,6 +259,10 @@ def load_config(config_file):
     return cfg
 
 
+# serializes log writes of concurrent pipeline stages to a shared file
+_log_lock = threading.Lock()
+
+
 def log(msg, f=None, lvl=0, tb=None, verbose=True):
     """
     Add a message to the log.
@@ -287,14 +293,15 @@ def log(msg, f=None, lvl=0, tb=None, verbose=True):
     # form output
     output = "%s%s\n" % ("  "*lvl, msg)
     
-    # write
-    if f is not None:
-        f.write(output)
-        f.flush()
+    with _log_lock:
+        # write
+        if f is not None:
+            f.write(output)
+            f.flush()
 
-    # print
-    if verbose and sys.stdout != f:
-        print(output)
+        # print
+        if verbose and sys.stdout != f:
+            print(output)
 
 
 def get_direction(ra, dec):
@@ -312,12 +319,125 @@ def get_direction(ra, dec):
 
 
 def get_elapsed_time(time1, time2):
-    """Get elapsed time in seconds given two datetime
-    objects within the same month of the same year"""
-    start = time1.day*24*3600 + time1.hour*3600 + time1.minute*60 + time1.second
-    end = time2.day*24*3600 + time2.hour*3600 + time2.minute*60 + time2.second
+    """Get elapsed time in whole seconds given two datetime objects"""
+    return int((time2 - time1).total_seconds())
+
+
+def checksum(path):
+    """
+    Get a cheap stat-based checksum of a file or directory (Ex. a CASA MS),
+    from the size and modification time of each file in it, rather than
+    from its contents. CASA table locks, which change on access, are skipped.
+
+    Args:
+        path : str, path to file or directory
+
+    Returns:
+        str, hex digest, or None if path doesn't exist
+    """
+    if not os.path.exists(path):
+        return None
+    if os.path.isdir(path):
+        files = []
+        for root, dirs, fnames in os.walk(path):
+            files.extend([os.path.join(root, f) for f in fnames if f != 'table.lock'])
+    else:
+        files = [path]
+
+    md5 = hashlib.md5()
+    for f in sorted(files):
+        st = os.stat(f)
+        md5.update("{}:{}:{}\n".format(os.path.relpath(f, path), st.st_size, st.st_mtime).encode())
+
+    return md5.hexdigest()
+
+
+def parse_spw(spw, Nfreqs=None):
+    """
+    Parse a CASA spw selection string of a single spectral window
+    into frequency channel indices.
+
+    Args:
+        spw : str, CASA spw selection, Ex. '0:100~200;300~400' or '100~200'.
+            Channel ranges are inclusive. If None, '' or without a channel
+            selection (Ex. '0'), all channels are selected.
+        Nfreqs : int, number of channels in the spw, used to bound selections
+
+    Returns:
+        freq_chans : ndarray of selected channel indices, or None if all channels are selected
+    """
+    if spw in [None, '', 'None', 'none']:
+        return None
+    spw = str(spw).strip()
+    if ':' in spw:
+        window, spw = spw.split(':')
+        if window.strip() not in ['0', '*']:
+            raise ValueError("Only spw 0 is supported, got {}".format(window))
+    elif '~' not in spw:
+        if spw.strip() not in ['0', '*']:
+            raise ValueError("Only spw 0 is supported, got {}".format(spw))
+        return None
+
+    freq_chans = []
+    for chans in spw.split(';'):
+        chans = chans.split('~')
+        start, stop = int(chans[0]), int(chans[-1])
+        freq_chans.extend(range(start, stop + 1))
+    freq_chans = np.unique(freq_chans)
+    if Nfreqs is not None:
+        freq_chans = freq_chans[freq_chans < Nfreqs]
+
+    return freq_chans
+
+
+def parse_uvrange(uvrange, freqs=None):
+    """
+    Parse a CASA uvrange selection string into a range of baseline lengths.
+
+    Args:
+        uvrange : str, CASA uvrange selection, Ex. '10~100m', '>15', '<1klambda'.
+            Default units are meters. Accepted units are m, km, lambda and klambda.
+        freqs : ndarray of frequencies [Hz], required for lambda units. The returned
+            range includes baselines that fall within uvrange at any frequency.
+
+    Returns: (bl_min, bl_max)
+        bl_min : minimum baseline length in meters
+        bl_max : maximum baseline length in meters, inf if unbounded
+    """
+    if uvrange in [None, '', 'None', 'none']:
+        return 0.0, np.inf
+    uvrange = str(uvrange).strip().lower()
+
+    # get units
+    scale = 1.0
+    for unit, s in [('klambda', 1e3), ('lambda', 1.0), ('km', 1e3), ('m', 1.0)]:
+        if uvrange.endswith(unit):
+            uvrange = uvrange[:-len(unit)]
+            scale = s
+            lam = 'lambda' in unit
+            break
+    else:
+        lam = False
+
+    # get range
+    if uvrange.startswith('>'):
+        bl_min, bl_max = float(uvrange[1:]), np.inf
+    elif uvrange.startswith('<'):
+        bl_min, bl_max = 0.0, float(uvrange[1:])
+    elif '~' in uvrange:
+        bl_min, bl_max = map(float, uvrange.split('~'))
+    else:
+        raise ValueError("Couldn't parse uvrange {}".format(uvrange))
+    bl_min, bl_max = bl_min * scale, bl_max * scale
+
+    # convert from wavelengths to meters
+    if lam:
+        if freqs is None:
+            raise ValueError("freqs are required to parse uvrange in units of wavelength")
+        c = 2.99792458e8
+        bl_min, bl_max = bl_min * c / np.max(freqs), bl_max * c / np.min(freqs)
 
-    return end - start
+    return bl_min, bl_max
 
 
 ### Plotting Functions ###
@@ -0,0 +1,201 @@
+"""
+Client for a persistent CASA worker process (scripts/casa_server.py),
+which runs CASA scripts and commands without paying the CASA startup
+cost of a new process for each one.
+"""
+from __future__ import absolute_import, division, print_function
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+import binascii
+from multiprocessing.connection import Client
+
+
+class CasaWorker(object):
+    """
+    A long-lived CASA process that runs commands sent to it over a unix socket.
+
+    The worker is started on first use, and restarted if it dies. A command
+    that was running when the worker died raises a RuntimeError rather than
+    being rerun, since it may have partially modified data in place (Ex. uvsub
+    or applycal on an MS), unless retries is set for idempotent commands.
+    Commands are run one at a time: concurrent callers wait their turn, so
+    callers that run commands concurrently (Ex. pipeline stages on separate
+    threads) should each use their own worker.
+    """
+    def __init__(self, casa, server_script=None, timeout=300, retries=0, verbose=False):
+        """
+        Args:
+            casa : list of str, command to run casa, Ex. ['casa', '--nologger', '--nogui']
+            server_script : str, path to casa_server.py. Default is scripts/casa_server.py
+                next to the casa_imaging package.
+            timeout : float, seconds to wait for the worker to start
+            retries : int, number of times to rerun a command whose worker died.
+                Only set if every command run on the worker is idempotent.
+            verbose : bool, if True report worker starts and restarts
+        """
+        self.casa = list(casa)
+        if server_script is None:
+            server_script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                         'scripts', 'casa_server.py')
+        self.server_script = server_script
+        self.timeout = timeout
+        self.retries = retries
+        self.verbose = verbose
+        self.proc = None
+        self.conn = None
+        self.tmpdir = None
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def alive(self):
+        """Return True if the worker process is running"""
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self):
+        """Start the worker process and connect to it"""
+        self._stop()
+        self.tmpdir = tempfile.mkdtemp(prefix='casa_worker')
+        address = os.path.join(self.tmpdir, 'socket')
+        authkey = binascii.hexlify(os.urandom(16))
+        env = dict(os.environ)
+        env['CASA_SERVER_AUTHKEY'] = authkey.decode()
+        if self.verbose:
+            print("...starting CASA worker")
+        self.proc = subprocess.Popen(self.casa + ['-c', self.server_script, '--address', address], env=env)
+
+        # wait for the server to listen
+        start = time.time()
+        while True:
+            if not self.alive():
+                raise RuntimeError("CASA worker exited with status {} on startup".format(self.proc.returncode))
+            if os.path.exists(address):
+                try:
+                    self.conn = Client(address, family='AF_UNIX', authkey=authkey)
+                    break
+                except (IOError, OSError):
+                    pass
+            if time.time() - start > self.timeout:
+                self._stop()
+                raise RuntimeError("CASA worker did not start within {} sec".format(self.timeout))
+            time.sleep(0.2)
+
+    def _stop(self):
+        """Kill the worker process and clean up its socket"""
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except (IOError, OSError):
+                pass
+            self.conn = None
+        if self.alive():
+            self.proc.kill()
+        if self.proc is not None:
+            self.proc.wait()
+            self.proc = None
+        if self.tmpdir is not None:
+            shutil.rmtree(self.tmpdir, ignore_errors=True)
+            self.tmpdir = None
+
+    def close(self):
+        """Shut down the worker process"""
+        with self.lock:
+            if self.alive() and self.conn is not None:
+                try:
+                    self.conn.send_bytes(json.dumps(dict(shutdown=True)).encode())
+                    self.conn.recv_bytes()
+                    self.proc.wait()
+                except (EOFError, IOError, OSError):
+                    pass
+            self._stop()
+
+    def _request(self, request):
+        """Send a request to the worker, restarting it if it died, and return (status, log)"""
+        with self.lock:
+            for attempt in range(self.retries + 1):
+                if not self.alive() or self.conn is None:
+                    if attempt > 0 and self.verbose:
+                        print("...restarting CASA worker")
+                    self.start()
+                try:
+                    self.conn.send_bytes(json.dumps(request).encode())
+                    reply = json.loads(self.conn.recv_bytes().decode())
+                    return reply['status'], reply['log']
+                except (EOFError, IOError, OSError):
+                    # worker died mid-command
+                    self._stop()
+            raise RuntimeError("CASA worker died running {}".format(request))
+
+    def run_script(self, script, args=[]):
+        """
+        Run a CASA script, as casa -c <script> <args>.
+
+        Args:
+            script : str, path to script
+            args : list of arguments to script
+
+        Returns: (status, log)
+            status : int, exit status of script
+            log : str, captured stdout and stderr of script
+        """
+        return self._request(dict(script=script, args=[str(a) for a in args]))
+
+    def run_code(self, code):
+        """
+        Run a CASA command, as casa -c <code>.
+
+        Args:
+            code : str, python code to run in the CASA namespace
+
+        Returns: (status, log)
+            status : int, exit status of code
+            log : str, captured stdout and stderr of code
+        """
+        return self._request(dict(code=code))
+
+    def run(self, cmd):
+        """
+        Run a casa command line (Ex. casa + ['-c', 'script.py', '--arg', 1]) on the worker,
+        ignoring everything before -c.
+
+        Args:
+            cmd : list, casa command line
+
+        Returns: (status, log)
+            status : int, exit status of command
+            log : str, captured stdout and stderr of command
+        """
+        cmd = [str(c) for c in cmd]
+        target = cmd[cmd.index('-c') + 1]
+        args = cmd[cmd.index('-c') + 2:]
+        if target.endswith('.py') and os.path.exists(target):
+            return self.run_script(target, args)
+        return self.run_code(' '.join([target] + args))
+
+    def check_call(self, cmd):
+        """
+        Run a casa command line on the worker like subprocess.check_call.
+
+        Args:
+            cmd : list, casa command line
+
+        Returns:
+            int, 0
+
+        Raises:
+            subprocess.CalledProcessError if the command had a non-zero exit status
+        """
+        status, log = self.run(cmd)
+        if status != 0:
+            raise subprocess.CalledProcessError(status, cmd, log)
+        return 0
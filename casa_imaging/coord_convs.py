@@ -7,10 +7,87 @@ import warnings
 from astropy.time import Time
 from astropy import coordinates as crd
 from astropy import units as unt
+from astropy.utils import iers
 import os
 
 
-def RA2Time(ra, anchor_jd, latitude=-30.72, longitude=21.42, return_lst=True, tolerance=1e-5, maxiter=5):
+# sidereal table used by default in coord_convs functions, see use_sidereal_table
+_sidereal_table = None
+
+# IERS policies, see set_iers_policy
+IERS_POLICIES = ['offline', 'auto']
+_iers_policy = None
+
+
+def set_iers_policy(policy='offline', iers_file=None):
+    """
+    Configure how astropy gets IERS Earth orientation tables, which
+    are needed for UTC -> UT1 in sidereal time and frame transformations.
+
+    Parameters
+    ----------
+    policy : str
+        'offline' : never download IERS tables, using iers_file if provided,
+            otherwise the IERS-B table bundled with astropy. Times outside
+            of the table warn and use degraded accuracy rather than raise.
+        'auto' : astropy's default, downloading IERS-A tables when stale.
+
+    iers_file : str
+        Path to a pre-staged IERS-A (finals2000A) or IERS-B table to use.
+
+    Notes
+    -----
+    Importing coord_convs leaves the astropy configuration untouched:
+    pipelines and scripts call this, or set_iers_policy_from_env, explicitly.
+    """
+    global _iers_policy
+    if policy not in IERS_POLICIES:
+        raise ValueError("IERS policy {} not recognized, must be one of {}".format(policy, IERS_POLICIES))
+
+    # configuration items differ across astropy versions
+    if policy == 'offline':
+        for name, value in [('auto_download', False), ('auto_max_age', None), ('iers_degraded_accuracy', 'warn')]:
+            if hasattr(iers.conf, name):
+                setattr(iers.conf, name, value)
+    else:
+        for name in ['auto_download', 'auto_max_age', 'iers_degraded_accuracy']:
+            if hasattr(iers.conf, name):
+                iers.conf.reset(name)
+
+    # load a pre-staged table
+    if iers_file is not None:
+        try:
+            table = iers.IERS_A.open(iers_file)
+        except Exception:
+            table = iers.IERS_B.open(iers_file)
+        if hasattr(iers, 'earth_orientation_table'):
+            iers.earth_orientation_table.set(table)
+        else:
+            # astropy < 4.0
+            iers.IERS.iers_table = iers.IERS_Auto.iers_table = iers.IERS_B.iers_table = table
+
+    _iers_policy = policy
+
+
+def set_iers_policy_from_env():
+    """
+    Configure astropy IERS tables with set_iers_policy, using the policy in the
+    CASA_IMAGING_IERS_POLICY environment variable (default 'offline') and the
+    table in CASA_IMAGING_IERS_FILE, if set. Pipelines pass their policy on
+    to the scripts they call through these variables.
+
+    An unrecognized policy warns and falls back to 'offline'.
+    """
+    iers_file = os.environ.get('CASA_IMAGING_IERS_FILE', None) or None
+    try:
+        set_iers_policy(os.environ.get('CASA_IMAGING_IERS_POLICY', 'offline'), iers_file)
+    except ValueError as err:
+        warnings.warn("{}: using 'offline' IERS policy".format(err))
+        set_iers_policy('offline', iers_file)
+
+
+def RA2Time(ra, anchor_jd, latitude=-30.72152, longitude=21.42830, return_lst=True, tolerance=1e-5, maxiter=5,
+            table=None):
     """
     Given a right ascension coordinate in J2000 (ICRS), return the
     Local Sidereal Time (LST) or Julian Date on the day of anchor_jd given
@@ -18,12 +95,12 @@ def RA2Time(ra, anchor_jd, latitude=-30.72, longitude=21.42, return_lst=True, to
 
     Parameters
     ----------
-    ra : float
+    ra : float or array_like
         Right Ascension in J2000 (ICRS) frame.
 
-    anchor_jd : float
+    anchor_jd : float or array_like
         Julian Date to anchor the conversion from ra to time, because RA wraps with
-        respect to time.
+        respect to time. Must be broadcastable with ra.
 
     latitude : float
         Latitude on Earth of observer in degrees.
@@ -39,37 +116,71 @@ def RA2Time(ra, anchor_jd, latitude=-30.72, longitude=21.42, return_lst=True, to
 
     maxiter : int
         Maximum number of iterations in minimization.
+
+    table : dict or bool
+        Sidereal table from make_sidereal_table to interpolate, if it covers
+        anchor_jd +/- 1 day at this latitude and longitude. Default (None)
+        is the table set by use_sidereal_table. False forces use of astropy.
     
     Returns
     -------
-    time : float
-        LST [radian] or JD when ra is closest to zenith of an observer
+    time : float or ndarray
+        LST [radian] or JD when ra is closest to zenith of an observer.
+        Has the broadcasted shape of ra and anchor_jd if either is array_like.
+
+    Notes
+    -----
+    All ra and anchor_jd pairs are solved together, such that each
+    Newton iteration is a single vectorized frame transformation
+    of the pairs that have not yet converged.
     """
+    # get input type
+    _array = isinstance(ra, (list, np.ndarray)) or isinstance(anchor_jd, (list, np.ndarray))
+    ra, time = np.broadcast_arrays(np.atleast_1d(np.asarray(ra, dtype=np.float64)),
+                                   np.atleast_1d(np.asarray(anchor_jd, dtype=np.float64)))
+    shape = ra.shape
+    ra, time = ra.ravel(), time.ravel().copy()
+
+    # interpolate sidereal table if it covers the request
+    tab = _get_table(table, longitude, latitude)
+    if tab is not None and _table_covers(tab, time - 1, time + 1):
+        time = _table_RA2Time(tab, ra, time)
+        if return_lst:
+            time = JD2LST(time, longitude=longitude, table=tab)
+        time = time.reshape(shape)
+
+        if _array:
+            return time
+        else:
+            return time[0]
+
     # setup Earth Location
     loc = crd.EarthLocation(lat=latitude * unt.deg, lon=longitude * unt.deg)
 
     # Enter loop
     k = 0
-    time = anchor_jd
+    active = np.arange(len(ra))
     while True:
-        # setup Time object with initial Julian Date and a step forward
-        t1 = Time(time, format='jd', scale='utc')
-        t2 = Time(time+1e-4, format='jd', scale='utc')
+        # setup Time object with current Julian Dates and a step forward
+        N = len(active)
+        t = Time(np.concatenate([time[active], time[active] + 1e-4]), format='jd', scale='utc')
 
         # calculate derivative of d_ra / d_jd
-        ra1 = crd.SkyCoord(frame='altaz', alt=90 * unt.deg, az=0 * unt.deg, location=loc, obstime=t1).icrs.ra.degree
-        ra2 = crd.SkyCoord(frame='altaz', alt=90 * unt.deg, az=0 * unt.deg, location=loc, obstime=t2).icrs.ra.degree
+        zen = crd.SkyCoord(frame='altaz', alt=np.full(2 * N, 90.0) * unt.deg, az=np.zeros(2 * N) * unt.deg,
+                           location=loc, obstime=t)
+        zen_ra = zen.icrs.ra.degree
+        ra1, ra2 = zen_ra[:N], zen_ra[N:]
         d_ra_d_jd = (ra2 - ra1) / 1e-4
 
         # calculate d_jd from initial time to get desired RA
-        if ra < ra1 - 180:
-            ra1 -= 360
-        d_jd = (ra - ra1) / d_ra_d_jd
+        ra1 = np.where(ra[active] < ra1 - 180, ra1 - 360, ra1)
+        d_jd = (ra[active] - ra1) / d_ra_d_jd
 
         # get new time
-        time = time + d_jd
+        time[active] += d_jd
 
-        if np.abs(d_jd) <= tolerance:
+        active = active[np.abs(d_jd) > tolerance]
+        if len(active) == 0:
             break
         elif k >= maxiter:
             break
@@ -78,12 +189,16 @@ def RA2Time(ra, anchor_jd, latitude=-30.72, longitude=21.42, return_lst=True, to
 
     # convert to LST if desired
     if return_lst:
-        t = Time(time, format='jd', scale='utc')
-        time = t.sidereal_time('apparent', longitude=longitude * unt.deg).radian
+        time = JD2LST(time, longitude=longitude, table=table)
 
-    return time
+    time = time.reshape(shape)
+
+    if _array:
+        return time
+    else:
+        return time[0]
 
-def JD2LST(JD, longitude=21.42830):
+def JD2LST(JD, longitude=21.42830, table=None):
     """
     Input:
     ------
@@ -91,6 +206,10 @@ def JD2LST(JD, longitude=21.42830):
 
     longitude : type=float, longitude of observer in degrees East, default=HERA longitude
 
+    table : type=dict or bool, sidereal table from make_sidereal_table to interpolate
+        if it covers JD at this longitude. Default (None) is the table set by
+        use_sidereal_table. False forces use of astropy.
+
     Output:
     -------
     Local Apparent Sidreal Time [radians]
@@ -106,14 +225,19 @@ def JD2LST(JD, longitude=21.42830):
         _array = False
         JD = [JD]
 
-    # iterate over JD
-    LST = []
-    for jd in JD:
-        # construct astropy Time object
-        t = Time(jd, format='jd', scale='utc')
-        # get LST in radians at epoch of jd
-        LST.append(t.sidereal_time('apparent', longitude=longitude * unt.deg).radian)
-    LST = np.array(LST)
+    JD = np.asarray(JD, dtype=np.float64)
+
+    # interpolate sidereal table if it covers the request
+    tab = _get_table(table, longitude)
+    if tab is not None and _table_covers(tab, JD, JD):
+        LST = np.mod(np.interp(JD, tab['jd'], tab['lst']), 2 * np.pi)
+
+    else:
+        # construct a single astropy Time object for all JD
+        t = Time(JD, format='jd', scale='utc')
+
+        # get LST in radians at epoch of JD
+        LST = np.asarray(t.sidereal_time('apparent', longitude=longitude * unt.deg).radian)
 
     if _array:
         return LST
@@ -121,57 +245,95 @@ def JD2LST(JD, longitude=21.42830):
         return LST[0]
 
 
-def LST2JD(LST, start_jd, longitude=21.42830):
+def LST2JD(LST, start_jd, longitude=21.42830, maxiter=10, table=None):
     """
     Convert Local Apparent Sidereal Time -> Julian Date via a linear fit
     at the 'start_JD' anchor point.
 
     Input:
     ------
-    LST : type=float, local apparent sidereal time [radians]
+    LST : type=float or array of floats, local apparent sidereal time [radians]
 
-    start_jd : type=int, integer julian day to use as starting point for LST2JD conversion
+    start_jd : type=int or array of ints broadcastable with LST, integer julian day
+        to use as starting point for LST2JD conversion
 
     longitude : type=float, degrees East of observer, default=HERA longitude
 
+    maxiter : type=int, maximum number of whole-day anchor shifts
+
+    table : type=dict or bool, sidereal table from make_sidereal_table to interpolate
+        if it covers each start_jd day at this longitude. Default (None) is the table
+        set by use_sidereal_table. False forces use of astropy.
+
     Output:
     -------
     JD : type=float, Julian Date(s). accurate to ~1 milliseconds
+
+    Notes:
+    ------
+    The linear fit is computed once per unique anchor day, and all LSTs
+    are solved simultaneously. LSTs whose solution falls off of their
+    start_jd day have their anchor shifted by a whole day and are re-solved.
     """
     # get LST type
-    if isinstance(LST, list) or isinstance(LST, np.ndarray):
+    if isinstance(LST, (list, np.ndarray)) or isinstance(start_jd, (list, np.ndarray)):
         _array = True
     else:
-        LST = [LST]
         _array = False
 
-    # get start_JD
-    base_jd = float(start_jd)
-
-    # iterate over LST
-    jd_array = []
-    for lst in LST:
-        while True:
-            # calculate fit
-            jd1 = start_jd
-            jd2 = start_jd + 0.01
-            lst1, lst2 = JD2LST(jd1, longitude=longitude), JD2LST(jd2, longitude=longitude)
-            slope = (lst2 - lst1) / 0.01
-            offset = lst1 - slope * jd1
-
-            # solve y = mx + b for x
-            JD = (lst - offset) / slope
-
-            # redo if JD isn't on starting JD
-            if JD - base_jd < 0:
-                start_jd += 1
-            elif JD - base_jd > 1:
-                start_jd -= 1
-            else:
-                break
-        jd_array.append(JD)
-
-    jd_array = np.array(jd_array)
+    # broadcast LST and start_jd
+    lst, base_jd = np.broadcast_arrays(np.atleast_1d(np.asarray(LST, dtype=np.float64)),
+                                       np.atleast_1d(np.asarray(start_jd, dtype=np.float64)))
+    shape = lst.shape
+    lst, base_jd = lst.ravel(), base_jd.ravel()
+
+    # interpolate sidereal table if it covers the request
+    tab = _get_table(table, longitude)
+    if tab is not None and _table_covers(tab, base_jd, base_jd + 1):
+        # get first JD on or after base_jd with this LST
+        lst0 = np.interp(base_jd, tab['jd'], tab['lst'])
+        jd_array = np.interp(lst0 + np.mod(lst - lst0, 2 * np.pi), tab['lst'], tab['jd']).reshape(shape)
+
+        if _array:
+            return jd_array
+        else:
+            return jd_array[0]
+
+    # iterate until all JDs fall on their starting JD
+    anchor_jd = base_jd.copy()
+    jd_array = np.empty_like(lst)
+    todo = np.arange(lst.size)
+    fits = {}
+    for k in range(maxiter + 1):
+        # calculate fits for anchor days not already fit
+        anchors, inv = np.unique(anchor_jd[todo], return_inverse=True)
+        new = np.array([a for a in anchors if a not in fits])
+        if len(new) > 0:
+            lsts = JD2LST(np.concatenate([new, new + 0.01]), longitude=longitude, table=False)
+            slope = (lsts[len(new):] - lsts[:len(new)]) / 0.01
+            offset = lsts[:len(new)] - slope * new
+            fits.update(zip(new, zip(slope, offset)))
+        slope, offset = np.array([fits[a] for a in anchors]).T
+
+        # solve y = mx + b for x
+        JD = (lst[todo] - offset[inv]) / slope[inv]
+
+        # redo if JD isn't on starting JD
+        below = JD - base_jd[todo] < 0
+        above = JD - base_jd[todo] > 1
+        done = ~(below | above)
+        jd_array[todo[done]] = JD[done]
+        if done.all():
+            break
+        elif k == maxiter:
+            warnings.warn("LST2JD did not converge after {} iterations".format(maxiter))
+            jd_array[todo] = JD
+            break
+        anchor_jd[todo[below]] += 1
+        anchor_jd[todo[above]] -= 1
+        todo = todo[~done]
+
+    jd_array = jd_array.reshape(shape)
 
     if _array:
         return jd_array
@@ -179,7 +341,7 @@ def LST2JD(LST, start_jd, longitude=21.42830):
         return jd_array[0]
 
 
-def JD2RA(JD, longitude=21.42830, latitude=-30.72152, epoch='current'):
+def JD2RA(JD, longitude=21.42830, latitude=-30.72152, epoch='current', table=None):
     """
     Convert from Julian date to Equatorial Right Ascension at zenith
     during a specified epoch.
@@ -198,6 +360,10 @@ def JD2RA(JD, longitude=21.42830, latitude=-30.72152, epoch='current'):
             LST is defined as the zenith RA in the current epoch. Note that
             epoch='J2000' corresponds to the ICRS standard.
 
+    table : type=dict or bool, sidereal table from make_sidereal_table to interpolate
+            if it covers JD at this longitude (and latitude if epoch='J2000').
+            Default (None) is the table set by use_sidereal_table. False forces use of astropy.
+
     Output:
     -------
     RA : type=float, right ascension [degrees] at zenith JD times
@@ -209,32 +375,160 @@ def JD2RA(JD, longitude=21.42830, latitude=-30.72152, epoch='current'):
     else:
         _array = False
         JD = [JD]
+    JD = np.asarray(JD, dtype=np.float64)
 
-    # setup RA list
-    RA = []
-
-    # iterate over jd
-    for jd in JD:
+    # use current epoch calculation
+    if epoch == 'current':
+        RA = JD2LST(JD, longitude=longitude, table=table) * 180 / np.pi
 
-        # use current epoch calculation
-        if epoch == 'current':
-            ra = JD2LST(jd, longitude=longitude) * 180 / np.pi
-            RA.append(ra)
-
-        # use J2000 epoch
-        elif epoch == 'J2000':
-            loc = crd.EarthLocation(lat=latitude * unt.deg, lon=longitude * unt.deg)
-            t = Time(jd, format='jd', scale='utc')
-            zen = crd.SkyCoord(frame='altaz', alt=90 * unt.deg, az=0 * unt.deg, obstime=t, location=loc)
-            RA.append(zen.icrs.ra.degree)
+    # use J2000 epoch
+    elif epoch == 'J2000':
+        tab = _get_table(table, longitude, latitude)
+        if tab is not None and _table_covers(tab, JD, JD):
+            RA = np.mod(np.interp(JD, tab['jd'], tab['ra']), 360)
 
         else:
-            raise ValueError("didn't recognize {} epoch".format(epoch))
+            loc = crd.EarthLocation(lat=latitude * unt.deg, lon=longitude * unt.deg)
+            t = Time(JD, format='jd', scale='utc')
+            zen = crd.SkyCoord(frame='altaz', alt=np.full(len(JD), 90.0) * unt.deg, az=np.zeros(len(JD)) * unt.deg,
+                               obstime=t, location=loc)
+            RA = np.asarray(zen.icrs.ra.degree)
 
-    RA = np.array(RA)
+    else:
+        raise ValueError("didn't recognize {} epoch".format(epoch))
 
     if _array:
         return RA
     else:
         return RA[0]
 
+
+def make_sidereal_table(start_jd, end_jd, cadence=10.0, longitude=21.42830, latitude=-30.72152,
+                        outfile=None, overwrite=False):
+    """
+    Tabulate the Local Apparent Sidereal Time and the J2000 (ICRS) right
+    ascension at zenith for an observer over a range of Julian Dates, for
+    fast interpolation in JD2LST, JD2RA, LST2JD and RA2Time.
+
+    Parameters
+    ----------
+    start_jd : float
+        Starting Julian Date of the table.
+
+    end_jd : float
+        Ending Julian Date of the table.
+
+    cadence : float
+        Spacing of table entries in minutes.
+
+    longitude : float
+        Longitude on Earth of observer in degrees East.
+
+    latitude : float
+        Latitude on Earth of observer in degrees North.
+
+    outfile : str
+        If provided, write the table to this .npz filepath.
+
+    overwrite : bool
+        If True, overwrite outfile.
+
+    Returns
+    -------
+    table : dict
+        Holding 'jd', unwrapped 'lst' [radians] and unwrapped J2000 zenith 'ra' [degrees]
+        arrays, and the 'longitude', 'latitude' and 'cadence' of the table.
+
+    Notes
+    -----
+    Linear interpolation error scales as cadence^2. At the default cadence of 10 minutes,
+    measured errors are < 1e-7 seconds in LST and < 0.05 arcsec in J2000 zenith RA
+    (< 4 milliseconds in RA2Time transit times). LST2JD from the table is more
+    accurate than its linear fit, which differs from it by up to a few milliseconds.
+    """
+    if outfile is not None and os.path.exists(outfile) and not overwrite:
+        raise IOError("{} exists, not overwriting".format(outfile))
+
+    # get table times, ensuring end_jd is covered
+    step = cadence / (60. * 24)
+    jd = start_jd + np.arange(int(np.ceil((end_jd - start_jd) / step)) + 1) * step
+
+    # compute with astropy
+    lst = np.unwrap(JD2LST(jd, longitude=longitude, table=False))
+    ra = np.rad2deg(np.unwrap(np.deg2rad(JD2RA(jd, longitude=longitude, latitude=latitude,
+                                               epoch='J2000', table=False))))
+    table = dict(jd=jd, lst=lst, ra=ra, longitude=float(longitude), latitude=float(latitude),
+                 cadence=float(cadence))
+
+    if outfile is not None:
+        np.savez(outfile, **table)
+
+    return table
+
+
+def load_sidereal_table(fname):
+    """
+    Load a sidereal table written by make_sidereal_table.
+
+    Parameters
+    ----------
+    fname : str
+        Path to .npz sidereal table.
+
+    Returns
+    -------
+    table : dict
+        See make_sidereal_table for details.
+    """
+    with np.load(fname) as f:
+        table = dict((k, f[k]) for k in ['jd', 'lst', 'ra'])
+        for k in ['longitude', 'latitude', 'cadence']:
+            table[k] = float(f[k])
+
+    return table
+
+
+def use_sidereal_table(table):
+    """
+    Set the sidereal table used by default in JD2LST, JD2RA, LST2JD and RA2Time.
+
+    Parameters
+    ----------
+    table : dict or str or None
+        Sidereal table from make_sidereal_table, or a path to one on disk.
+        If None, stop using a sidereal table by default.
+    """
+    global _sidereal_table
+    if isinstance(table, six.string_types):
+        table = load_sidereal_table(table)
+    _sidereal_table = table
+
+
+def _get_table(table, longitude, latitude=None):
+    """Get sidereal table if it is computed at longitude (and latitude), else None"""
+    if table is None:
+        table = _sidereal_table
+    if table is None or table is False:
+        return None
+    if not np.isclose(table['longitude'], longitude, rtol=0, atol=1e-6):
+        return None
+    if latitude is not None and not np.isclose(table['latitude'], latitude, rtol=0, atol=1e-6):
+        return None
+
+    return table
+
+
+def _table_covers(table, jd1, jd2):
+    """Check if sidereal table covers all Julian Dates from jd1 to jd2"""
+    return np.all(jd1 >= table['jd'][0]) and np.all(jd2 <= table['jd'][-1])
+
+
+def _table_RA2Time(table, ra, anchor_jd):
+    """Interpolate sidereal table for the JD at which ra is at zenith, following RA2Time's wrapping"""
+    ra0 = np.interp(anchor_jd, table['jd'], table['ra'])
+
+    # same wrapping as the Newton step from anchor_jd in RA2Time
+    d_ra = ra - np.mod(ra0, 360)
+    d_ra = np.where(d_ra < -180, d_ra + 360, d_ra)
+
+    return np.interp(ra0 + d_ra, table['ra'], table['jd'])
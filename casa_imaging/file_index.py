@@ -0,0 +1,131 @@
+"""
+A persistent on-disk index of visibility file metadata (time range,
+LST range and polarizations), keyed by file path, size and modification
+time, such that files are only opened when they are new or have changed.
+"""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import os
+import json
+
+
+def file_key(fname):
+    """
+    Get the index key and stat signature of a file.
+
+    Args:
+        fname : str, path to file or directory (Ex. miriad)
+
+    Returns: (key, size, mtime)
+        key : str, absolute path of fname
+        size : int, size of fname in bytes, summed over files if a directory
+        mtime : float, latest modification time of fname
+    """
+    key = os.path.abspath(fname)
+    if os.path.isdir(key):
+        size, mtime = 0, os.path.getmtime(key)
+        for root, dirs, files in os.walk(key):
+            for f in files:
+                st = os.stat(os.path.join(root, f))
+                size += st.st_size
+                mtime = max(mtime, st.st_mtime)
+    else:
+        st = os.stat(key)
+        size, mtime = st.st_size, st.st_mtime
+
+    return key, size, mtime
+
+
+def read_file_info(fname, filetype='uvh5'):
+    """
+    Read time and polarization metadata of a visibility file.
+
+    Args:
+        fname : str, path to visibility file
+        filetype : str, filetype of fname. Data is only read for
+            filetypes that can't read metadata alone (miriad)
+
+    Returns:
+        info : dict holding unique 'times' [JD], 'time_range' [JD],
+            'lst_range' [radians] at the first and last time, and 'pols' strings
+    """
+    from pyuvdata import UVData
+    import pyuvdata.utils as uvutils
+
+    uv = UVData()
+    uv.read(fname, read_data=filetype.lower() == 'miriad')
+    times, inds = np.unique(uv.time_array, return_index=True)
+    lsts = uv.lst_array[inds]
+    pols = [uvutils.polnum2str(p) for p in uv.polarization_array]
+
+    return dict(times=times.tolist(), time_range=[times[0], times[-1]], lst_range=[lsts[0], lsts[-1]],
+                pols=pols)
+
+
+def load_file_index(index_file):
+    """
+    Load a file index from disk.
+
+    Args:
+        index_file : str, path to JSON file index
+
+    Returns:
+        index : dict of file info, keyed by absolute file path. Empty if index_file doesn't exist.
+    """
+    if index_file is None or not os.path.exists(index_file):
+        return {}
+    with open(index_file) as f:
+        return json.load(f)
+
+
+def write_file_index(index, index_file):
+    """
+    Write a file index to disk, via a temporary file such that
+    an interrupted write doesn't corrupt an existing index.
+
+    Args:
+        index : dict of file info, keyed by absolute file path
+        index_file : str, path to JSON file index
+    """
+    tmp_file = index_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(index, f)
+    os.rename(tmp_file, index_file)
+
+
+def index_files(files, index_file=None, filetype='uvh5', verbose=False):
+    """
+    Get metadata of visibility files, reading only those files that
+    are missing from the index or whose size or modification time
+    has changed, and updating the index on disk.
+
+    Args:
+        files : list of str, paths to visibility files
+        index_file : str, path to JSON file index. If None, don't persist index.
+        filetype : str, filetype of files
+        verbose : bool, if True report files that are read
+
+    Returns:
+        infos : list of file info dicts (see read_file_info) for each file in files,
+            with additional 'size' and 'mtime' keys
+    """
+    index = load_file_index(index_file)
+
+    infos, updated = [], False
+    for fname in files:
+        key, size, mtime = file_key(fname)
+        info = index.get(key, None)
+        if info is None or info['size'] != size or info['mtime'] != mtime:
+            if verbose:
+                print("...indexing {}".format(fname))
+            info = read_file_info(fname, filetype=filetype)
+            info.update(dict(size=size, mtime=mtime))
+            index[key] = info
+            updated = True
+        infos.append(info)
+
+    if updated and index_file is not None:
+        write_file_index(index, index_file)
+
+    return infos
@@ -0,0 +1,108 @@
+"""
+A persistent record of completed pipeline stages, used to skip stages
+on a rerun whose parameters are unchanged and whose files haven't
+changed since the pipeline last wrote them.
+"""
+from __future__ import absolute_import, division, print_function
+
+import os
+import json
+import threading
+
+from . import casa_utils
+
+
+class Manifest(object):
+    """
+    A JSON manifest holding, for each completed stage, the parameters it
+    ran with, the pipeline state it produced and the files it touched,
+    along with the latest checksum of every file recorded by any stage.
+    """
+    def __init__(self, path):
+        """
+        Args:
+            path : str, path to JSON manifest. Loaded if it exists.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = dict(stages={}, checksums={})
+
+    def _write(self):
+        """Write the manifest via a temporary file, such that an interrupted write doesn't corrupt it"""
+        tmp_file = self.path + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.rename(tmp_file, self.path)
+
+    def is_current(self, name, params):
+        """
+        Check whether a stage completed with the same parameters, and every
+        file it touched still exists unchanged since the pipeline last wrote it.
+
+        Args:
+            name : str, stage name
+            params : JSON-serializable dict of stage parameters
+
+        Returns:
+            bool
+        """
+        with self.lock:
+            entry = self.manifest['stages'].get(name, None)
+            if entry is None or entry['params'] != normalize(params):
+                return False
+            for path in entry['files']:
+                latest = self.manifest['checksums'].get(path, None)
+                if latest is None or casa_utils.checksum(path) != latest:
+                    return False
+            return True
+
+    def state(self, name):
+        """
+        Get the pipeline state a completed stage produced.
+
+        Args:
+            name : str, stage name
+
+        Returns:
+            dict of state variables
+        """
+        with self.lock:
+            return dict(self.manifest['stages'][name]['state'])
+
+    def start(self, name):
+        """
+        Forget a stage that is about to run, such that it isn't
+        considered complete if it fails.
+
+        Args:
+            name : str, stage name
+        """
+        with self.lock:
+            if self.manifest['stages'].pop(name, None) is not None:
+                self._write()
+
+    def record(self, name, params, state, files):
+        """
+        Record a completed stage and the checksums of the files it touched.
+
+        Args:
+            name : str, stage name
+            params : JSON-serializable dict of stage parameters
+            state : JSON-serializable dict of pipeline state the stage produced
+            files : list of paths the stage read or wrote
+        """
+        with self.lock:
+            files = sorted(set(os.path.abspath(f) for f in files))
+            for f in files:
+                self.manifest['checksums'][f] = casa_utils.checksum(f)
+            self.manifest['stages'][name] = dict(params=normalize(params), state=normalize(state), files=files)
+            self._write()
+
+
+def normalize(d):
+    """Round-trip a dict through JSON, such that it compares equal to its loaded form"""
+    return json.loads(json.dumps(d, default=str, sort_keys=True))
@@ -0,0 +1,218 @@
+"""
+Timing and resource usage of pipeline stages and the subprocesses they run,
+collected into a machine-readable JSON report.
+"""
+from __future__ import absolute_import, division, print_function
+
+import os
+import json
+import time
+import resource
+import threading
+import subprocess
+import contextlib
+from datetime import datetime
+
+from . import trace
+
+
+def path_size(path):
+    """
+    Get the size of a file, or of all files in a directory (Ex. a CASA MS).
+
+    Args:
+        path : str, path to file or directory
+
+    Returns:
+        int, size in bytes, or None if path doesn't exist
+    """
+    if not os.path.exists(path):
+        return None
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    size = 0
+    for root, dirs, files in os.walk(path):
+        size += sum([os.path.getsize(os.path.join(root, f)) for f in files])
+    return size
+
+
+def _usage(ru):
+    """Get a dict of resource usage from a resource.struct_rusage"""
+    return dict(user_time=ru.ru_utime, sys_time=ru.ru_stime, maxrss_kb=ru.ru_maxrss,
+                read_bytes=ru.ru_inblock * 512, write_bytes=ru.ru_oublock * 512)
+
+
+def _command_name(cmd):
+    """Get a short name of a command line for the trace, Ex. the script a casa -c command runs"""
+    cmd = [str(c) for c in cmd]
+    if '-c' in cmd[:-1]:
+        return os.path.basename(cmd[cmd.index('-c') + 1].split('(')[0])
+    return os.path.basename(cmd[0])
+
+
+class Profiler(object):
+    """
+    Records wall time and resource usage of stages and subprocesses.
+
+    Stages are timed with the stage context manager, which also records the
+    CPU time of this process and of the subprocesses it waited on during the
+    stage. Subprocesses run with check_call are timed individually, with their
+    CPU time, peak RSS and block I/O from os.wait4, and are attributed to the
+    stage running in the calling thread, and to any stage it is a sub-stage of
+    (Ex. di_img of di_img.mfs_corr). When stages run concurrently, the
+    process and children CPU times of a stage include those of the others.
+    """
+    def __init__(self):
+        self.start = datetime.utcnow()
+        self.stages = []
+        self.commands = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def current(self):
+        """Get the name of the stage running in this thread, or None"""
+        stack = getattr(self.local, 'stack', [])
+        return stack[-1] if len(stack) > 0 else None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Context manager that records the timing and resource usage of a stage.
+
+        Args:
+            name : str, stage name
+        """
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        self.local.stack.append(name)
+        record = dict(name=name, start=datetime.utcnow().isoformat(), status='running', outputs={})
+        with self.lock:
+            self.stages.append(record)
+        t0 = time.time()
+        self0 = resource.getrusage(resource.RUSAGE_SELF)
+        child0 = resource.getrusage(resource.RUSAGE_CHILDREN)
+        try:
+            yield record
+            record['status'] = 'done'
+        except BaseException:
+            record['status'] = 'failed'
+            raise
+        finally:
+            trace.complete(name, 'stage', t0, time.time() - t0,
+                           args=dict(status=record['status'], resumed=record.get('resumed', False)))
+            self1 = resource.getrusage(resource.RUSAGE_SELF)
+            child1 = resource.getrusage(resource.RUSAGE_CHILDREN)
+            self.local.stack.pop()
+            with self.lock:
+                # include commands of sub-stages, Ex. di_img.mfs_corr of di_img
+                cmds = [c for c in self.commands if c['stage'] is not None
+                        and (c['stage'] == name or c['stage'].startswith(name + '.'))]
+                record.update(dict(end=datetime.utcnow().isoformat(), wall_time=time.time() - t0,
+                                   cpu_time=(self1.ru_utime - self0.ru_utime) + (self1.ru_stime - self0.ru_stime),
+                                   children_cpu_time=(child1.ru_utime - child0.ru_utime) + (child1.ru_stime - child0.ru_stime),
+                                   maxrss_kb=max([self1.ru_maxrss] + [c['maxrss_kb'] for c in cmds]),
+                                   read_bytes=sum([c['read_bytes'] for c in cmds]),
+                                   write_bytes=sum([c['write_bytes'] for c in cmds]),
+                                   Ncommands=len(cmds)))
+
+    def wrap(self, name, func):
+        """
+        Wrap a function such that calls to it are recorded as a stage.
+
+        Args:
+            name : str, stage name
+            func : callable
+
+        Returns:
+            wrapped callable
+        """
+        def wrapped(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+        return wrapped
+
+    def add_outputs(self, name, paths):
+        """
+        Record the sizes of the outputs of a stage.
+
+        Args:
+            name : str, stage name
+            paths : list of output paths
+        """
+        with self.lock:
+            for record in self.stages:
+                if record['name'] == name:
+                    record['outputs'].update([(p, path_size(p)) for p in paths])
+
+    def record_command(self, cmd, wall_time, usage=None, returncode=0):
+        """
+        Record a command that was run, Ex. on a CASA worker,
+        and add it to the trace timeline if tracing is enabled.
+
+        Args:
+            cmd : list, command line
+            wall_time : float, wall time in seconds
+            usage : dict of resource usage, if known
+            returncode : int, exit status
+        """
+        record = dict(stage=self.current(), cmd=' '.join([str(c) for c in cmd]), wall_time=wall_time,
+                      returncode=returncode, user_time=None, sys_time=None, maxrss_kb=0,
+                      read_bytes=0, write_bytes=0)
+        if usage is not None:
+            record.update(usage)
+        with self.lock:
+            self.commands.append(record)
+        trace.complete(_command_name(cmd), 'subprocess', time.time() - wall_time, wall_time,
+                       args=dict(stage=record['stage'], cmd=record['cmd'], returncode=returncode))
+
+    def check_call(self, cmd, **kwargs):
+        """
+        Run a command like subprocess.check_call, recording its
+        wall time and resource usage.
+
+        Args:
+            cmd : list, command line
+            kwargs : kwargs for subprocess.Popen
+
+        Returns:
+            int, 0
+
+        Raises:
+            subprocess.CalledProcessError if the command had a non-zero exit status
+        """
+        t0 = time.time()
+        proc = subprocess.Popen(cmd, **kwargs)
+        pid, status, ru = os.wait4(proc.pid, 0)
+        # let Popen know the process was reaped
+        proc.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+        self.record_command(cmd, time.time() - t0, usage=_usage(ru), returncode=proc.returncode)
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
+        return 0
+
+    def report(self):
+        """
+        Get the report of the run so far.
+
+        Returns:
+            dict
+        """
+        end = datetime.utcnow()
+        ru = resource.getrusage(resource.RUSAGE_SELF)
+        ch = resource.getrusage(resource.RUSAGE_CHILDREN)
+        with self.lock:
+            return dict(start=self.start.isoformat(), end=end.isoformat(),
+                        wall_time=(end - self.start).total_seconds(),
+                        cpu_time=ru.ru_utime + ru.ru_stime, children_cpu_time=ch.ru_utime + ch.ru_stime,
+                        maxrss_kb=ru.ru_maxrss, children_maxrss_kb=ch.ru_maxrss,
+                        stages=[dict(s) for s in self.stages], commands=[dict(c) for c in self.commands])
+
+    def write(self, outfile):
+        """
+        Write the report to a JSON file.
+
+        Args:
+            outfile : str, output filepath
+        """
+        with open(outfile, 'w') as f:
+            json.dump(self.report(), f, indent=1)
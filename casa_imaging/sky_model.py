@@ -0,0 +1,442 @@
+"""
+Utility functions for making point source sky models,
+either as FITS image cubes or as tables of apparent
+source fluxes, without going through CASA.
+"""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import os
+import astropy.io.fits as fits
+from astropy.wcs import WCS
+from astropy import units as unt
+from astropy import coordinates as crd
+from astropy.time import Time
+from scipy import interpolate
+
+
+def load_srcs(srcfile):
+    """
+    Load a source table written by complist_gleam.py.
+
+    Args:
+        srcfile : str, path to a tab-delimited *.srcs.tab file holding
+            name, flux [Jy], spectral index, RA [deg] and Dec [deg] columns
+
+    Returns: (names, flux, spix, ra, dec)
+        names : list of source names
+        flux : ndarray of source fluxes [Jy] at the reference frequency
+        spix : ndarray of source spectral indices
+        ra : ndarray of source right ascension [deg]
+        dec : ndarray of source declination [deg]
+    """
+    names, flux, spix, ra, dec = [], [], [], [], []
+    with open(srcfile) as f:
+        for line in f:
+            if line.startswith('#') or line.strip() == '':
+                continue
+            l = line.rstrip('\n').split('\t')
+            names.append(l[0])
+            flux.append(float(l[1]))
+            spix.append(float(l[2]))
+            ra.append(float(l[3]))
+            dec.append(float(l[4]))
+
+    return names, np.array(flux), np.array(spix), np.array(ra), np.array(dec)
+
+
+def make_cube_header(point_ra, point_dec, cell, imsize, freqs):
+    """
+    Make a FITS header for a Stokes I image cube with the same
+    axes as a CASA image exported with stokeslast=False, i.e.
+    [RA, Dec, Stokes, Freq] in FITS axis order.
+
+    Args:
+        point_ra : pointing (image center) right ascension [deg]
+        point_dec : pointing (image center) declination [deg]
+        cell : pixel side-length [deg], or an astropy-parseable str, Ex. '300arcsec'
+        imsize : integer image side-length in pixels
+        freqs : ndarray of uniformly spaced frequencies [Hz]
+
+    Returns:
+        head : astropy.io.fits.Header object
+    """
+    if isinstance(cell, str):
+        cell = unt.Quantity(cell).to(unt.deg).value
+    freqs = np.atleast_1d(freqs)
+    if len(freqs) > 1:
+        dfreq = np.median(np.diff(freqs))
+    else:
+        dfreq = 1e6
+
+    head = fits.Header()
+    head['SIMPLE'] = True
+    head['BITPIX'] = -32
+    head['NAXIS'] = 4
+    head['NAXIS1'] = imsize
+    head['NAXIS2'] = imsize
+    head['NAXIS3'] = 1
+    head['NAXIS4'] = len(freqs)
+    head['EXTEND'] = True
+    head['BSCALE'] = 1.0
+    head['BZERO'] = 0.0
+    head['BUNIT'] = 'Jy/pixel'
+    head['EQUINOX'] = 2000.0
+    head['RADESYS'] = 'FK5'
+    head['SPECSYS'] = 'LSRK'
+    # CASA places the reference pixel at imsize // 2 (0-indexed)
+    head['CTYPE1'] = 'RA---SIN'
+    head['CRVAL1'] = point_ra
+    head['CDELT1'] = -cell
+    head['CRPIX1'] = imsize // 2 + 1.0
+    head['CUNIT1'] = 'deg'
+    head['CTYPE2'] = 'DEC--SIN'
+    head['CRVAL2'] = point_dec
+    head['CDELT2'] = cell
+    head['CRPIX2'] = imsize // 2 + 1.0
+    head['CUNIT2'] = 'deg'
+    head['CTYPE3'] = 'STOKES'
+    head['CRVAL3'] = 1.0
+    head['CDELT3'] = 1.0
+    head['CRPIX3'] = 1.0
+    head['CUNIT3'] = ''
+    head['CTYPE4'] = 'FREQ'
+    head['CRVAL4'] = freqs[0]
+    head['CDELT4'] = dfreq
+    head['CRPIX4'] = 1.0
+    head['CUNIT4'] = 'Hz'
+
+    return head
+
+
+def source_pixels(head, ra, dec):
+    """
+    Get the flattened image pixel index nearest to each source.
+
+    Args:
+        head : FITS header of image cube
+        ra : ndarray of source right ascension [deg]
+        dec : ndarray of source declination [deg]
+
+    Returns: (pix, inside)
+        pix : integer ndarray of flattened pixel indices (Dec-major) of sources within image
+        inside : boolean ndarray, True for sources that fall within the image
+    """
+    w = WCS(head, naxis=2)
+    x, y = w.all_world2pix(np.atleast_1d(ra), np.atleast_1d(dec), 0)
+    x, y = np.floor(x + 0.5), np.floor(y + 0.5)
+    inside = (x >= 0) & (x < head['NAXIS1']) & (y >= 0) & (y < head['NAXIS2'])
+    inside &= np.isfinite(x) & np.isfinite(y)
+    pix = (y[inside] * head['NAXIS1'] + x[inside]).astype(int)
+
+    return pix, inside
+
+
+def source_spectra(flux, spix, freqs, ref_freq=151e6):
+    """
+    Evaluate power law source spectra at all frequencies as an outer product.
+
+    Args:
+        flux : ndarray of source fluxes [Jy] at ref_freq
+        spix : ndarray of source spectral indices
+        freqs : ndarray of frequencies [Hz]
+        ref_freq : reference frequency [Hz] of flux
+
+    Returns:
+        spectra : ndarray of shape (Nsources, Nfreqs) holding fluxes [Jy]
+    """
+    flux, spix = np.atleast_1d(flux), np.atleast_1d(spix)
+    return flux[:, None] * (np.atleast_1d(freqs)[None, :] / ref_freq) ** spix[:, None]
+
+
+def _raster_chunk(args):
+    """
+    Rasterize a chunk of channels: args is (flux, spix, freqs, ref_freq, upix, inv, npix).
+    Spectra are computed here, such that only the chunk's frequencies are sent to a worker process.
+    """
+    flux, spix, freqs, ref_freq, upix, inv, npix = args
+    spectra = source_spectra(flux, spix, freqs, ref_freq=ref_freq)
+    # sum spectra of sources that fall on the same pixel
+    agg = np.zeros((len(upix), spectra.shape[1]), dtype=np.float64)
+    np.add.at(agg, inv, spectra)
+    chunk = np.zeros((spectra.shape[1], npix), dtype=np.float32)
+    chunk[:, upix] = agg.T
+
+    return chunk
+
+
+def rasterize_sources(outfile, flux, spix, ra, dec, point_ra, point_dec, cell, imsize,
+                      freqs, ref_freq=151e6, chunk_size=64, Nproc=1, overwrite=False):
+    """
+    Write a point source sky model to a FITS image cube in units of Jy/pixel,
+    placing each source in its nearest pixel with a power law spectrum.
+    The cube is computed and streamed to disk in chunks of frequency channels.
+
+    Args:
+        outfile : str, output FITS filepath
+        flux : ndarray of source fluxes [Jy] at ref_freq
+        spix : ndarray of source spectral indices
+        ra : ndarray of source right ascension [deg]
+        dec : ndarray of source declination [deg]
+        point_ra : pointing (image center) right ascension [deg]
+        point_dec : pointing (image center) declination [deg]
+        cell : pixel side-length [deg], or an astropy-parseable str, Ex. '300arcsec'
+        imsize : integer image side-length in pixels
+        freqs : ndarray of uniformly spaced frequencies [Hz]
+        ref_freq : reference frequency [Hz] of flux
+        chunk_size : number of frequency channels to compute and write at a time
+        Nproc : number of processes to use in computing channel chunks
+        overwrite : bool, if True overwrite outfile
+
+    Returns:
+        Nsources : number of sources that fell within the image
+    """
+    if os.path.exists(outfile):
+        if not overwrite:
+            raise IOError("{} exists, not overwriting".format(outfile))
+        os.remove(outfile)
+
+    freqs = np.atleast_1d(freqs)
+    head = make_cube_header(point_ra, point_dec, cell, imsize, freqs)
+
+    # get pixel index of each source and drop sources off the image
+    pix, inside = source_pixels(head, ra, dec)
+    upix, inv = np.unique(pix, return_inverse=True)
+    flux, spix = np.atleast_1d(flux)[inside], np.atleast_1d(spix)[inside]
+
+    # setup channel chunks
+    npix = imsize * imsize
+    chunks = ((flux, spix, freqs[i:i + chunk_size], ref_freq, upix, inv, npix)
+              for i in range(0, len(freqs), chunk_size))
+    if Nproc > 1:
+        from multiprocessing import Pool
+        pool = Pool(Nproc)
+        M = pool.imap
+    else:
+        pool = None
+        M = map
+
+    # stream channel chunks to disk
+    shdu = fits.StreamingHDU(outfile, head)
+    try:
+        for chunk in M(_raster_chunk, chunks):
+            shdu.write(chunk)
+    finally:
+        shdu.close()
+        if pool is not None:
+            pool.close()
+
+    return len(pix)
+
+
+def source_beam_response(uvb, ra, dec, freqs, time, longitude=21.42830, latitude=-30.72152,
+                         pols=('xx',), freq_interp_kind='cubic'):
+    """
+    Evaluate a primary beam model only at the topocentric position of
+    each source, rather than across an entire image.
+
+    Args:
+        uvb : pyuvdata.UVBeam object with its interpolation_function set
+        ra : ndarray of source right ascension [deg]
+        dec : ndarray of source declination [deg]
+        freqs : ndarray of frequencies [Hz] to interpolate beam onto
+        time : time of observation in Julian Date
+        longitude : longitude of observer in degrees East
+        latitude : latitude of observer in degrees North
+        pols : list of polarization strings of the beam to evaluate, Ex. ['xx', 'yy']
+        freq_interp_kind : interpolation method across frequency
+
+    Returns:
+        pb : ndarray of shape (Npols, Nsources, Nfreqs) holding the beam response,
+            which is zero for sources below the horizon
+    """
+    ra, dec = np.atleast_1d(ra), np.atleast_1d(dec)
+
+    # convert from equatorial to topocentric coordinates
+    loc = crd.EarthLocation(lat=latitude * unt.deg, lon=longitude * unt.deg)
+    t = Time(time, format='jd', scale='utc')
+    equatorial = crd.SkyCoord(ra=ra * unt.deg, dec=dec * unt.deg, frame='fk5', location=loc, obstime=t)
+    altaz = equatorial.transform_to('altaz')
+    theta = np.abs(altaz.alt.value - 90.0) * np.pi / 180
+    phi = altaz.az.value * np.pi / 180
+
+    # evaluate primary beam at native beam frequencies
+    beam_freqs = uvb.freq_array.squeeze()
+    pb, _ = uvb.interp(phi, theta, polarizations=list(pols), reuse_spline=True)
+    pb = np.abs(pb.reshape((len(pols), len(beam_freqs), len(ra))))
+
+    # interpolate onto requested frequencies
+    pb = interpolate.interp1d(beam_freqs, pb, axis=1, kind=freq_interp_kind,
+                              fill_value='extrapolate')(np.atleast_1d(freqs))
+    pb = np.moveaxis(pb, 1, 2)
+    pb[:, altaz.alt.value < 0, :] = 0.0
+
+    return pb
+
+
+def node_freqs(freqs, Nnodes):
+    """
+    Get uniformly spaced frequency nodes spanning the first and last frequency.
+
+    Args:
+        freqs : ndarray of frequencies [Hz]
+        Nnodes : integer number of frequency nodes
+
+    Returns:
+        nodes : ndarray of Nnodes frequencies [Hz]
+    """
+    freqs = np.atleast_1d(freqs)
+    if Nnodes < 2:
+        raise ValueError("Need at least 2 frequency nodes, got {}".format(Nnodes))
+
+    return np.linspace(freqs.min(), freqs.max(), Nnodes)
+
+
+def interp_freq_nodes(data, nodes, freqs, axis=0):
+    """
+    Interpolate data sampled at frequency nodes onto frequencies.
+    Interpolation is linear in log(flux) vs. log(freq) for samples
+    that are positive at all nodes, such that power law spectra are
+    exactly reproduced, and linear in log(freq) otherwise.
+
+    Args:
+        data : ndarray holding data at nodes along axis
+        nodes : ndarray of monotonically increasing node frequencies [Hz]
+        freqs : ndarray of frequencies [Hz] to interpolate onto
+        axis : integer frequency axis of data
+
+    Returns:
+        interp_data : ndarray of data interpolated onto freqs along axis
+    """
+    data = np.moveaxis(np.asarray(data, dtype=np.float64), axis, 0)
+    nodes, freqs = np.atleast_1d(nodes), np.atleast_1d(freqs)
+
+    # get bracketing nodes and log-frequency weights: extrapolate off the ends
+    idx = np.clip(np.searchsorted(nodes, freqs, side='right') - 1, 0, len(nodes) - 2)
+    lnodes = np.log(nodes)
+    w = (np.log(freqs) - lnodes[idx]) / (lnodes[idx + 1] - lnodes[idx])
+    w = w.reshape((-1,) + (1,) * (data.ndim - 1))
+    y0, y1 = data[idx], data[idx + 1]
+
+    positive = np.all(data > 0, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        logy0, logy1 = np.log(np.where(positive, y0, 1.0)), np.log(np.where(positive, y1, 1.0))
+    interp_data = np.where(positive, np.exp(logy0 + w * (logy1 - logy0)), y0 + w * (y1 - y0))
+
+    return np.moveaxis(interp_data, 0, axis)
+
+
+def cube_freqs(head):
+    """
+    Get the FITS frequency axis and frequencies of an image cube header.
+
+    Args:
+        head : FITS header of image cube with a FREQ axis
+
+    Returns: (freqax, freqs)
+        freqax : integer FITS axis (1-indexed) of frequency
+        freqs : ndarray of frequencies [Hz]
+    """
+    for freqax in range(1, head['NAXIS'] + 1):
+        if head['CTYPE{}'.format(freqax)] == 'FREQ':
+            break
+    else:
+        raise ValueError("Couldn't find a FREQ axis in FITS header")
+    freqs = (np.arange(head['NAXIS{}'.format(freqax)]) + 1 - head['CRPIX{}'.format(freqax)]) \
+            * head['CDELT{}'.format(freqax)] + head['CRVAL{}'.format(freqax)]
+
+    return freqax, freqs
+
+
+def _iter_interp_chunks(data, freqax, nodes, freqs, chunk_size):
+    """Yield chunks of a node cube interpolated onto freqs, in FITS write order"""
+    # numpy axis of frequency, and leading axes that are written before it
+    ax = data.ndim - freqax
+    for lead in np.ndindex(*data.shape[:ax]):
+        node_data = data[lead]
+        for i in range(0, len(freqs), chunk_size):
+            yield interp_freq_nodes(node_data, nodes, freqs[i:i + chunk_size], axis=0)
+
+
+def expand_freq_nodes(nodefile, outfile, freqs, chunk_size=64, overwrite=False):
+    """
+    Interpolate a FITS image cube made at frequency nodes onto
+    full-resolution frequencies, streaming the output to disk in
+    chunks of frequency channels.
+
+    Args:
+        nodefile : str, FITS image cube sampled at frequency nodes
+        outfile : str, output FITS filepath
+        freqs : ndarray of uniformly spaced frequencies [Hz]
+        chunk_size : number of frequency channels to compute and write at a time
+        overwrite : bool, if True overwrite outfile
+    """
+    if os.path.exists(outfile):
+        if not overwrite:
+            raise IOError("{} exists, not overwriting".format(outfile))
+        os.remove(outfile)
+
+    freqs = np.atleast_1d(freqs)
+    hdu = fits.open(nodefile)
+    try:
+        head = hdu[0].header.copy()
+        freqax, nodes = cube_freqs(head)
+
+        # update frequency axis
+        head['BITPIX'] = -32
+        head['NAXIS{}'.format(freqax)] = len(freqs)
+        head['CRVAL{}'.format(freqax)] = freqs[0]
+        head['CDELT{}'.format(freqax)] = np.median(np.diff(freqs)) if len(freqs) > 1 else head['CDELT{}'.format(freqax)]
+        head['CRPIX{}'.format(freqax)] = 1.0
+
+        shdu = fits.StreamingHDU(outfile, head)
+        try:
+            for chunk in _iter_interp_chunks(hdu[0].data, freqax, nodes, freqs, chunk_size):
+                shdu.write(chunk.astype(np.float32))
+        finally:
+            shdu.close()
+    finally:
+        hdu.close()
+
+
+def freq_node_error(nodefile, reffile, chunk_size=64):
+    """
+    Get the error of a FITS image cube made at frequency nodes, once
+    interpolated onto the frequencies of a full-resolution reference cube.
+
+    Args:
+        nodefile : str, FITS image cube sampled at frequency nodes
+        reffile : str, full-resolution FITS image cube with the same spatial axes
+        chunk_size : number of frequency channels to compare at a time
+
+    Returns: (max_abs_err, max_rel_err)
+        max_abs_err : maximum absolute error across the cube
+        max_rel_err : maximum absolute error relative to the peak
+            absolute value of the reference cube in each channel
+    """
+    nhdu, rhdu = fits.open(nodefile), fits.open(reffile)
+    try:
+        freqax, nodes = cube_freqs(nhdu[0].header)
+        rfreqax, freqs = cube_freqs(rhdu[0].header)
+        if freqax != rfreqax:
+            raise ValueError("FREQ axis of {} and {} do not match".format(nodefile, reffile))
+
+        # iterate over reference cube in the same chunks
+        ref = rhdu[0].data
+        ax = ref.ndim - freqax
+        ref_chunks = (ref[lead][i:i + chunk_size] for lead in np.ndindex(*ref.shape[:ax])
+                      for i in range(0, len(freqs), chunk_size))
+
+        max_abs_err, max_rel_err = 0.0, 0.0
+        for chunk, rchunk in zip(_iter_interp_chunks(nhdu[0].data, freqax, nodes, freqs, chunk_size), ref_chunks):
+            err = np.abs(chunk - rchunk).reshape(len(rchunk), -1).max(axis=1)
+            peak = np.abs(rchunk).reshape(len(rchunk), -1).max(axis=1)
+            max_abs_err = max(max_abs_err, err.max())
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rel = np.where(peak > 0, err / peak, 0.0)
+            max_rel_err = max(max_rel_err, rel.max())
+    finally:
+        nhdu.close()
+        rhdu.close()
+
+    return max_abs_err, max_rel_err
@@ -0,0 +1,148 @@
+"""
+A small dependency-graph scheduler for pipeline stages.
+
+Stages declare the resources (files, or names of pipeline state) they
+read as inputs, create as outputs and modify in place as mutates.
+Dependencies follow from the order stages are given in, as in a
+sequential script: a stage waits for every earlier stage that writes
+something it reads or writes, or that reads something it writes.
+Stages with no such hazard between them run concurrently on threads.
+"""
+from __future__ import absolute_import, division, print_function
+
+import sys
+import threading
+import traceback
+
+
+class StageError(Exception):
+    """Raised when a stage fails, holding the stage name and its formatted traceback"""
+    def __init__(self, name, tb):
+        self.name = name
+        self.tb = tb
+        super(StageError, self).__init__("stage {} failed:\n{}".format(name, tb))
+
+
+class Stage(object):
+    """
+    A pipeline stage.
+    """
+    def __init__(self, name, func, args=(), kwargs={}, inputs=[], outputs=[], mutates=[], after=[]):
+        """
+        Args:
+            name : str, unique stage name
+            func : callable to run
+            args : tuple of positional arguments to func
+            kwargs : dict of keyword arguments to func
+            inputs : list of resources the stage reads
+            outputs : list of resources the stage creates
+            mutates : list of resources the stage modifies in place (Ex. a Measurement Set)
+            after : list of names of stages that must finish first,
+                in addition to those implied by resources
+        """
+        self.name = name
+        self.func = func
+        self.args = tuple(args)
+        self.kwargs = dict(kwargs)
+        self.inputs = set(inputs)
+        self.outputs = set(outputs)
+        self.mutates = set(mutates)
+        self.after = set(after)
+
+    def reads(self):
+        return self.inputs | self.mutates
+
+    def writes(self):
+        return self.outputs | self.mutates
+
+    def run(self):
+        return self.func(*self.args, **self.kwargs)
+
+
+def stage_dependencies(stages):
+    """
+    Get the names of stages each stage depends on.
+
+    Args:
+        stages : list of Stage objects, in sequential order
+
+    Returns:
+        deps : dict of set of stage names, keyed by stage name
+    """
+    names = [s.name for s in stages]
+    if len(set(names)) != len(names):
+        raise ValueError("stage names are not unique: {}".format(names))
+
+    deps = {}
+    for i, s in enumerate(stages):
+        unknown = s.after - set(names)
+        if len(unknown) > 0:
+            raise ValueError("stage {} depends on unknown stages {}".format(s.name, sorted(unknown)))
+        deps[s.name] = set(s.after)
+        for prev in stages[:i]:
+            if (prev.writes() & (s.reads() | s.writes())) or (prev.reads() & s.writes()):
+                deps[s.name].add(prev.name)
+
+    return deps
+
+
+def run_stages(stages, nworkers=1, log=None):
+    """
+    Run stages on up to nworkers threads, each once all of its dependencies
+    have finished. If a stage fails, no new stages are started, running
+    stages are allowed to finish, and a StageError is raised.
+
+    Args:
+        stages : list of Stage objects, in sequential order
+        nworkers : int, maximum number of stages to run at once
+        log : callable taking a str message, to report stage starts and ends
+
+    Returns:
+        results : dict of return values of each stage, keyed by stage name
+    """
+    deps = stage_dependencies(stages)
+    nworkers = max(1, int(nworkers))
+    pending = list(stages)
+    running, done, results, errors = set(), set(), {}, []
+    cond = threading.Condition()
+
+    def work(stage):
+        try:
+            result = stage.run()
+            error = None
+        except Exception:
+            error = ''.join(traceback.format_exception(*sys.exc_info()))
+        with cond:
+            running.discard(stage.name)
+            if error is None:
+                results[stage.name] = result
+                done.add(stage.name)
+                if log is not None:
+                    log("...stage {} finished".format(stage.name))
+            else:
+                errors.append(StageError(stage.name, error))
+            cond.notify_all()
+
+    with cond:
+        while True:
+            if len(errors) == 0:
+                ready = [s for s in pending if deps[s.name] <= done]
+                for s in ready[:nworkers - len(running)]:
+                    pending.remove(s)
+                    running.add(s.name)
+                    if log is not None:
+                        log("...stage {} started".format(s.name))
+                    t = threading.Thread(target=work, args=(s,))
+                    t.daemon = True
+                    t.start()
+            if len(running) == 0:
+                if len(errors) > 0 or len(pending) == 0:
+                    break
+                raise ValueError("stages {} have circular dependencies".format([s.name for s in pending]))
+            # wait with a timeout such that the main thread remains interruptible
+            cond.wait(1.0)
+
+    if len(errors) > 0:
+        raise errors[0]
+
+    return results
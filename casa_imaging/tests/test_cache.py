@@ -0,0 +1,48 @@
+"""
+Test casa_imaging/cache.py
+"""
+import os
+import time
+from casa_imaging.cache import ArtifactCache, content_hash
+
+
+def test_artifact_cache(tmpdir):
+    cache = ArtifactCache(str(tmpdir.join('cache')), max_size=None)
+    inp = tmpdir.join('gleam.fits')
+    inp.write('catalogue')
+    out = tmpdir.mkdir('out')
+    cl = out.mkdir('gleam.cl')
+    cl.join('table.dat').write('components')
+    tab = out.join('gleam.cl.srcs.tab')
+    tab.write('sources')
+    outputs = [str(cl), str(tab)]
+
+    key = cache.key(['complist_gleam.py', '--radius', 20], [str(inp)])
+    assert not cache.fetch(key, outputs)
+    assert cache.store(key, outputs)
+
+    # fetch replaces outputs with cached copies
+    tab.write('changed')
+    assert cache.fetch(key, outputs)
+    assert tab.read() == 'sources'
+    assert cl.join('table.dat').read() == 'components'
+
+    # key depends on command and input contents
+    assert cache.key(['complist_gleam.py', '--radius', 10], [str(inp)]) != key
+    inp.write('new catalogue')
+    assert cache.key(['complist_gleam.py', '--radius', 20], [str(inp)]) != key
+    assert content_hash(str(inp)) == content_hash(str(inp))
+
+
+def test_artifact_cache_eviction(tmpdir):
+    cache = ArtifactCache(str(tmpdir.join('cache')), max_size=250)
+    out = tmpdir.join('model.fits')
+    keys = []
+    for i in range(3):
+        out.write('x' * 100)
+        keys.append(cache.key(['pbcorr.py', i]))
+        cache.store(keys[-1], [str(out)])
+        # entries are ordered by modification time
+        os.utime(os.path.join(cache.cache_dir, keys[-1]), (time.time() + i, time.time() + i))
+    cache.evict()
+    assert [k for k, size in cache.entries()] == keys[1:]
@@ -0,0 +1,45 @@
+"""
+Test casa_imaging/casa_utils.py
+"""
+import numpy as np
+import pytest
+from casa_imaging import casa_utils
+
+
+def test_parse_spw():
+    assert casa_utils.parse_spw('') is None
+    assert casa_utils.parse_spw('0') is None
+    assert np.all(casa_utils.parse_spw('0:100~103') == [100, 101, 102, 103])
+    assert np.all(casa_utils.parse_spw('2~3;10~11') == [2, 3, 10, 11])
+    assert np.all(casa_utils.parse_spw('0:5~20', Nfreqs=8) == [5, 6, 7])
+    with pytest.raises(ValueError):
+        casa_utils.parse_spw('1:10~20')
+
+
+def test_parse_uvrange():
+    assert casa_utils.parse_uvrange('') == (0.0, np.inf)
+    assert casa_utils.parse_uvrange('>15') == (15.0, np.inf)
+    assert casa_utils.parse_uvrange('<1km') == (0.0, 1000.0)
+    assert casa_utils.parse_uvrange('10~100m') == (10.0, 100.0)
+    bl_min, bl_max = casa_utils.parse_uvrange('10~20lambda', freqs=np.array([100e6, 200e6]))
+    assert np.isclose(bl_min, 10 * 2.99792458e8 / 200e6) and np.isclose(bl_max, 20 * 2.99792458e8 / 100e6)
+
+
+def test_checksum(tmpdir):
+    d = tmpdir.mkdir('data.ms')
+    d.join('table.f0').write('abc')
+    c1 = casa_utils.checksum(str(d))
+    assert c1 == casa_utils.checksum(str(d))
+    # CASA table locks change on access without changing the table
+    d.join('table.lock').write('lock')
+    assert c1 == casa_utils.checksum(str(d))
+    d.join('table.f1').write('x')
+    assert casa_utils.checksum(str(d)) != c1
+    assert casa_utils.checksum(str(tmpdir.join('missing'))) is None
+
+
+def test_get_elapsed_time():
+    import datetime
+    t1 = datetime.datetime(2018, 1, 31, 23, 59, 30)
+    t2 = datetime.datetime(2018, 2, 1, 0, 0, 45, 500000)
+    assert casa_utils.get_elapsed_time(t1, t2) == 75
@@ -0,0 +1,67 @@
+"""
+Test casa_imaging/casa_worker.py
+"""
+import os
+import sys
+import subprocess
+import pytest
+from casa_imaging.casa_worker import CasaWorker
+
+SCRIPT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'scripts')
+
+
+def test_worker_startup_failure():
+    # a casa command that exits immediately can't serve requests
+    worker = CasaWorker(['false'], timeout=10)
+    with pytest.raises(RuntimeError):
+        worker.run(['casa', '-c', "print('hello')"])
+    assert not worker.alive()
+    worker.close()
+
+
+def load_server():
+    """Import scripts/casa_server.py as a module"""
+    sys.path.insert(0, SCRIPT_DIR)
+    try:
+        import casa_server
+    finally:
+        sys.path.pop(0)
+    return casa_server
+
+
+def test_server_run(tmpdir):
+    casa_server = load_server()
+    # stub of the CASA namespace
+    namespace = dict(tclean=lambda vis: "imaged {}".format(vis))
+
+    status, log = casa_server.run(dict(code="print(tclean('data.ms'))"), namespace)
+    assert status == 0 and log == "imaged data.ms\n"
+
+    # scripts get their arguments as casa -c <script> <args>, and can't change the namespace or cwd
+    script = tmpdir.join('script.py')
+    script.write("import os, sys\nprint(sys.argv[3:])\ntclean = None\nos.chdir('/')\n")
+    cwd = os.getcwd()
+    status, log = casa_server.run(dict(script=str(script), args=['--msin', 'data.ms']), namespace)
+    assert status == 0 and log == "['--msin', 'data.ms']\n"
+    assert namespace['tclean'] is not None and os.getcwd() == cwd
+
+    # exit statuses and errors
+    assert casa_server.run(dict(code="import sys; sys.exit(3)"), namespace)[0] == 3
+    status, log = casa_server.run(dict(code="tclean()"), namespace)
+    assert status == 1 and 'TypeError' in log
+
+
+def test_worker_protocol(tmpdir):
+    # serve with python rather than casa, passing -c <script> on to the server's argparse
+    server = os.path.join(SCRIPT_DIR, 'casa_server.py')
+    with CasaWorker([sys.executable, server], server_script=server, timeout=30) as worker:
+        assert worker.run(['casa', '--nologger', '-c', "print('hello')"]) == (0, 'hello\n')
+        with pytest.raises(subprocess.CalledProcessError):
+            worker.check_call(['casa', '-c', "import sys; sys.exit(2)"])
+
+        # a command whose worker dies isn't rerun, and the next command restarts the worker
+        out = tmpdir.join('count')
+        with pytest.raises(RuntimeError):
+            worker.run_code("open('{}', 'a').write('x'); import os; os._exit(1)".format(out))
+        assert out.read() == 'x'
+        assert worker.run_code("print(1 + 1)") == (0, '2\n')
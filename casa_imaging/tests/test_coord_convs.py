@@ -0,0 +1,146 @@
+"""
+Test casa_imaging/coord_convs.py
+"""
+import numpy as np
+import os
+import pytest
+from casa_imaging import coord_convs
+
+
+def test_JD2LST_JD2RA():
+    jds = 2458101.3 + np.linspace(0, 0.5, 5)
+
+    # array input matches scalar input
+    lsts = coord_convs.JD2LST(jds)
+    assert lsts.shape == (5,)
+    assert np.allclose(lsts, [coord_convs.JD2LST(jd) for jd in jds], atol=1e-12)
+    assert np.allclose(coord_convs.JD2LST(list(jds)), lsts)
+
+    for epoch in ['current', 'J2000']:
+        ras = coord_convs.JD2RA(jds, epoch=epoch)
+        assert ras.shape == (5,)
+        assert np.allclose(ras, [coord_convs.JD2RA(jd, epoch=epoch) for jd in jds], atol=1e-10)
+    assert np.allclose(coord_convs.JD2RA(jds, epoch='current'), lsts * 180 / np.pi)
+
+    # J2000 zenith RA is close to the apparent LST
+    assert np.all(np.abs(coord_convs.JD2RA(jds, epoch='J2000') - lsts * 180 / np.pi) < 1)
+
+    with pytest.raises(ValueError):
+        coord_convs.JD2RA(jds, epoch='B1950')
+
+
+def test_LST2JD():
+    # round trip
+    lsts = np.linspace(0, 2 * np.pi, 24, endpoint=False)
+    jds = coord_convs.LST2JD(lsts, 2458101)
+    assert jds.shape == (24,)
+    assert np.all((jds >= 2458101) & (jds <= 2458102))
+    assert np.all(np.abs(np.angle(np.exp(1j * (coord_convs.JD2LST(jds) - lsts)))) < 1e-6)
+
+    # scalar input matches array input
+    assert np.isclose(coord_convs.LST2JD(lsts[5], 2458101), jds[5], atol=1e-10)
+
+    # start_jd can be an array
+    days = np.array([2458101, 2458150, 2458300])
+    jds = coord_convs.LST2JD(1.0, days)
+    assert np.all((jds >= days) & (jds <= days + 1))
+    assert np.allclose(coord_convs.JD2LST(jds), 1.0, atol=1e-6)
+
+
+def test_RA2Time():
+    ras = np.array([0.5, 30.0, 250.0])
+    days = np.array([2458101.0, 2458150.0])
+
+    # batch over sources and nights matches scalar calls
+    jds = coord_convs.RA2Time(ras[None, :], days[:, None], return_lst=False)
+    assert jds.shape == (2, 3)
+    assert np.isclose(jds[1, 1], coord_convs.RA2Time(30.0, 2458150.0, return_lst=False), atol=1e-8)
+
+    # source is at zenith at the solved time
+    zen_ra = coord_convs.JD2RA(jds.ravel(), epoch='J2000')
+    assert np.all(np.abs(np.angle(np.exp(1j * np.deg2rad(zen_ra - np.tile(ras, 2))))) < 1e-5)
+
+    # LST output
+    lsts = coord_convs.RA2Time(ras, 2458101.0, return_lst=True)
+    assert np.allclose(lsts, coord_convs.JD2LST(jds[0]))
+
+
+def test_sidereal_table(monkeypatch):
+    fname = "./_test_sidereal_table.npz"
+    table = coord_convs.make_sidereal_table(2458100.5, 2458103.5, cadence=10.0, outfile=fname, overwrite=True)
+    assert np.all(np.diff(table['lst']) > 0) and np.all(np.diff(table['ra']) > 0)
+    table = coord_convs.load_sidereal_table(fname)
+
+    # interpolated conversions agree with astropy
+    jds = np.linspace(2458101, 2458102, 7)
+    lsts = coord_convs.JD2LST(jds, table=table)
+    assert np.all(np.abs(np.angle(np.exp(1j * (lsts - coord_convs.JD2LST(jds, table=False))))) < 1e-8)
+    ras = coord_convs.JD2RA(jds, epoch='J2000', table=table)
+    assert np.all(np.abs(ras - coord_convs.JD2RA(jds, epoch='J2000', table=False)) < 0.05 / 3600)
+    jd = coord_convs.LST2JD(lsts, 2458101, table=table)
+    assert np.all(np.abs(jd - coord_convs.LST2JD(lsts, 2458101, table=False)) * 86400 < 0.01)
+    # RA2Time defaults to the observer the table is made for, and so uses it
+    table_RA2Time = coord_convs._table_RA2Time
+    calls = []
+    def spy(*args):
+        calls.append(args)
+        return table_RA2Time(*args)
+    monkeypatch.setattr(coord_convs, '_table_RA2Time', spy)
+    t = coord_convs.RA2Time(30.0, 2458102.0, return_lst=False, table=table)
+    assert len(calls) == 1
+    assert np.abs(t - coord_convs.RA2Time(30.0, 2458102.0, return_lst=False, table=False)) * 86400 < 0.01
+
+    # set as default
+    coord_convs.use_sidereal_table(fname)
+    try:
+        assert np.allclose(coord_convs.JD2LST(jds), lsts)
+        # observer at a different longitude or outside of table doesn't use it
+        assert np.isclose(coord_convs.JD2LST(2458101.0, longitude=0.0), coord_convs.JD2LST(2458101.0, longitude=0.0, table=False))
+        assert np.isclose(coord_convs.JD2LST(2458200.0), coord_convs.JD2LST(2458200.0, table=False))
+    finally:
+        coord_convs.use_sidereal_table(None)
+
+    if os.path.exists(fname):
+        os.remove(fname)
+
+
+@pytest.fixture
+def iers_state():
+    """Restore the astropy IERS configuration and table after a test changes them"""
+    from astropy.utils import iers
+    names = [n for n in ['auto_download', 'auto_max_age', 'iers_degraded_accuracy'] if hasattr(iers.conf, n)]
+    conf = dict([(n, getattr(iers.conf, n)) for n in names])
+    policy = coord_convs._iers_policy
+    table = iers.earth_orientation_table.get() if hasattr(iers, 'earth_orientation_table') else None
+    yield
+    for n, v in conf.items():
+        setattr(iers.conf, n, v)
+    coord_convs._iers_policy = policy
+    if table is not None:
+        iers.earth_orientation_table.set(table)
+
+
+def test_set_iers_policy(iers_state):
+    from astropy.utils import iers
+    coord_convs.set_iers_policy('auto')
+    assert iers.conf.auto_download
+    coord_convs.set_iers_policy('offline', iers_file=iers.IERS_B_FILE)
+    assert not iers.conf.auto_download
+    assert coord_convs._iers_policy == 'offline'
+    assert np.isfinite(coord_convs.JD2LST(2458101.3, table=False))
+    with pytest.raises(ValueError):
+        coord_convs.set_iers_policy('online')
+
+
+def test_set_iers_policy_from_env(iers_state, monkeypatch):
+    from astropy.utils import iers
+    monkeypatch.setenv('CASA_IMAGING_IERS_POLICY', 'auto')
+    coord_convs.set_iers_policy_from_env()
+    assert coord_convs._iers_policy == 'auto'
+    assert iers.conf.auto_download
+    # unrecognized policies fall back to offline
+    monkeypatch.setenv('CASA_IMAGING_IERS_POLICY', 'online')
+    with pytest.warns(UserWarning):
+        coord_convs.set_iers_policy_from_env()
+    assert coord_convs._iers_policy == 'offline'
+    assert not iers.conf.auto_download
@@ -0,0 +1,48 @@
+"""
+Test casa_imaging/file_index.py
+"""
+import os
+from casa_imaging import file_index
+
+
+def test_index_files(tmpdir, monkeypatch):
+    # record which files are opened, rather than reading them with pyuvdata
+    reads = []
+    def read_file_info(fname, filetype='uvh5'):
+        reads.append(os.path.basename(fname))
+        return dict(times=[2458101.1, 2458101.2], time_range=[2458101.1, 2458101.2], lst_range=[0.1, 0.2], pols=['xx'])
+    monkeypatch.setattr(file_index, 'read_file_info', read_file_info)
+
+    f1, f2 = tmpdir.join('zen.1.uvh5'), tmpdir.join('zen.2.uvh5')
+    f1.write('a')
+    f2.write('bb')
+    # miriad files are directories
+    f3 = tmpdir.mkdir('zen.3.uv')
+    f3.join('visdata').write('ccc')
+    files = [str(f1), str(f2), str(f3)]
+    index_file = str(tmpdir.join('index.json'))
+
+    # create index
+    infos = file_index.index_files(files, index_file=index_file)
+    assert reads == ['zen.1.uvh5', 'zen.2.uvh5', 'zen.3.uv']
+    assert [info['size'] for info in infos] == [1, 2, 3]
+    assert infos[0]['time_range'] == [2458101.1, 2458101.2]
+    assert sorted(file_index.load_file_index(index_file).keys()) == sorted([os.path.abspath(f) for f in files])
+
+    # reuse index without opening files
+    infos = file_index.index_files(files, index_file=index_file)
+    assert len(reads) == 3 and len(infos) == 3
+
+    # reindex files whose size or mtime changed
+    f1.write('aaaa')
+    os.utime(str(f2), (0, 0))
+    f3.join('visdata').write('c')
+    infos = file_index.index_files(files, index_file=index_file)
+    assert reads[3:] == ['zen.1.uvh5', 'zen.2.uvh5', 'zen.3.uv']
+    assert infos[0]['size'] == 4 and infos[1]['mtime'] == 0
+    file_index.index_files(files, index_file=index_file)
+    assert len(reads) == 6
+
+    # without an index file every file is read
+    file_index.index_files(files[:1])
+    assert len(reads) == 7
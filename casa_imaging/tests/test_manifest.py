@@ -0,0 +1,35 @@
+"""
+Test casa_imaging/manifest.py
+"""
+import os
+from casa_imaging.manifest import Manifest
+
+
+def test_manifest(tmpdir):
+    path = str(tmpdir.join('manifest.json'))
+    ms = tmpdir.mkdir('data.ms')
+    ms.join('table.dat').write('abc')
+    ms = str(ms)
+    params = dict(cal=dict(refant=53, gain_spw='0:100~900'))
+
+    m = Manifest(path)
+    assert not m.is_current('di_cal', params)
+    m.start('di_cal')
+    m.record('di_cal', params, dict(gaintables=['a.cal']), [ms])
+    assert m.is_current('di_cal', params)
+    assert not m.is_current('di_cal', dict(cal=dict(refant=54, gain_spw='0:100~900')))
+
+    # reload from disk
+    m = Manifest(path)
+    assert m.is_current('di_cal', params)
+    assert m.state('di_cal') == dict(gaintables=['a.cal'])
+
+    # modifying a file invalidates the stage
+    with open(os.path.join(ms, 'table.dat'), 'a') as f:
+        f.write('def')
+    assert not m.is_current('di_cal', params)
+
+    # a failed rerun forgets the stage
+    m.record('di_cal', params, {}, [ms])
+    m.start('di_cal')
+    assert not Manifest(path).is_current('di_cal', params)
@@ -0,0 +1,47 @@
+"""
+Test casa_imaging/profiling.py
+"""
+import json
+import subprocess
+import sys
+import threading
+import pytest
+from casa_imaging.profiling import Profiler
+
+
+def test_profiler(tmpdir):
+    prof = Profiler()
+    out = tmpdir.join('model.fits')
+    with prof.stage('gen_model'):
+        assert prof.current() == 'gen_model'
+        prof.check_call([sys.executable, '-c', "open('{}', 'w').write('x' * 1000)".format(out)])
+        with pytest.raises(subprocess.CalledProcessError):
+            prof.check_call([sys.executable, '-c', "import sys; sys.exit(2)"])
+    assert prof.current() is None
+    prof.add_outputs('gen_model', [str(out)])
+
+    outfile = str(tmpdir.join('profile.json'))
+    prof.write(outfile)
+    with open(outfile) as f:
+        report = json.load(f)
+    stage = report['stages'][0]
+    assert stage['name'] == 'gen_model' and stage['status'] == 'done'
+    assert stage['Ncommands'] == 2 and stage['maxrss_kb'] > 0
+    assert stage['outputs'][str(out)] == 1000
+    assert [c['returncode'] for c in report['commands']] == [0, 2]
+    assert report['commands'][0]['user_time'] >= 0
+
+
+def test_profiler_substages():
+    prof = Profiler()
+    with prof.stage('di_img'):
+        # sub-stages run on other threads, named after their parent stage
+        t = threading.Thread(target=prof.wrap('di_img.mfs_corr', prof.check_call), args=([sys.executable, '-c', 'pass'],))
+        t.start()
+        t.join()
+    with prof.stage('di_img2'):
+        pass
+    stages = dict([(s['name'], s) for s in prof.report()['stages']])
+    assert stages['di_img.mfs_corr']['Ncommands'] == 1
+    assert stages['di_img']['Ncommands'] == 1 and stages['di_img']['maxrss_kb'] > 0
+    assert stages['di_img2']['Ncommands'] == 0
@@ -14,6 +14,7 @@ import glob
 import copy
 import sys
 import subprocess
+import json
 import unittest
 
 ## Note! In order to debug this script, you should open 
@@ -26,6 +27,36 @@ def test_source2file():
                            "2458101"])
     nt.assert_equal(out, 0)
 
+def test_source2file_batch():
+    # plan transits of two sources over two nights
+    sys.path.insert(0, "../../scripts")
+    from source2file import plan_transits
+    sys.path.pop(0)
+    plan = plan_transits([30.05, 60.0], 2458101, end_jd=2458102, names=['a', 'b'], lon=21.42, duration=4)
+    nt.assert_equal(len(plan), 4)
+    nt.assert_equal([(p['name'], p['night']) for p in plan],
+                    [('a', 2458101), ('b', 2458101), ('a', 2458102), ('b', 2458102)])
+    for p in plan:
+        nt.assert_true(p['night'] <= p['transit_jd'] < p['night'] + 1.5)
+        nt.assert_true(p['files'] is None)
+    # a source transits ~4 minutes earlier each night
+    nt.assert_almost_equal((plan[2]['transit_jd'] - plan[0]['transit_jd']) * 24 * 60, 24 * 60 - 3.93, places=1)
+
+    # batch mode from the command line
+    if os.path.exists("transits.json"):
+        os.remove("transits.json")
+    out = subprocess.call(["../../scripts/source2file.py", "--ra", "30.05", "60.0",
+                           "--names", "a", "b", "--lon", "21.42", "--duration", "4",
+                           "--start_jd", "2458101", "--end_jd", "2458102", "--outfile", "transits.json"])
+    nt.assert_equal(out, 0)
+    with open("transits.json") as f:
+        nt.assert_equal(len(json.load(f)), 4)
+    os.remove("transits.json")
+
+    # batch mode requires a start_jd
+    out = subprocess.call(["../../scripts/source2file.py", "--ra", "30.05", "60.0", "--end_jd", "2458102"])
+    nt.assert_equal(out, 2)
+
 def test_model_image():
     # clean up space
     sfiles = glob.glob("gleam*")
@@ -0,0 +1,94 @@
+"""
+Test casa_imaging/sky_model.py
+"""
+import numpy as np
+import os
+import pytest
+from astropy.io import fits
+from astropy.wcs import WCS
+from casa_imaging import sky_model
+
+
+def test_load_srcs(tmpdir):
+    srcfile = tmpdir.join('gleam.cl.srcs.tab')
+    srcfile.write("# name\t flux [Jy]\t spix\t RA\t Dec\n"
+                  "GLEAM 02h00m12s -30d53m28s\t0.103491\t-0.812345\t30.051234\t-30.891234\n"
+                  "test\t100\t-1\t30.000000\t-30.000000")
+    names, flux, spix, ra, dec = sky_model.load_srcs(str(srcfile))
+    assert names == ['GLEAM 02h00m12s -30d53m28s', 'test']
+    # faint source fluxes keep their precision
+    assert np.allclose(flux, [0.103491, 100]) and np.allclose(spix, [-0.812345, -1])
+    assert np.allclose(ra, [30.051234, 30]) and np.allclose(dec, [-30.891234, -30])
+
+
+def test_rasterize_sources():
+    fname = "./_test_model.fits"
+    freqs = np.linspace(100e6, 200e6, 50, endpoint=False)
+    flux = np.array([1.0, 2.0, 3.0, 5.0])
+    spix = np.array([-0.8, 0.0, -1.0, 0.0])
+    ra = np.array([30.05, 31.0, 30.05, 200.0])
+    dec = np.array([-30.7, -29.5, -30.7, 0.0])
+
+    # last source is off the image, first and third fall on the same pixel
+    Nsrcs = sky_model.rasterize_sources(fname, flux, spix, ra, dec, 30.05, -30.7, '300arcsec', 64,
+                                        freqs, chunk_size=7, overwrite=True)
+    assert Nsrcs == 3
+
+    hdu = fits.open(fname)
+    data = np.array(hdu[0].data)
+    assert data.shape == (50, 1, 64, 64)
+
+    # ensure total flux in each channel matches source spectra
+    spectra = sky_model.source_spectra(flux[:3], spix[:3], freqs)
+    assert np.allclose(data.sum(axis=(1, 2, 3)), spectra.sum(axis=0), rtol=1e-5)
+
+    # ensure sources are at their nearest pixel
+    w = WCS(hdu[0].header, naxis=2)
+    x, y = w.all_world2pix(ra[:2], dec[:2], 0)
+    assert np.allclose(data[:, 0, int(np.round(y[0])), int(np.round(x[0]))], spectra[0] + spectra[2], rtol=1e-5)
+    assert np.allclose(data[:, 0, int(np.round(y[1])), int(np.round(x[1]))], spectra[1], rtol=1e-5)
+    assert (data[0] > 0).sum() == 2
+
+    # ensure worker processes, which compute their own chunk of spectra, give the same cube
+    sky_model.rasterize_sources(fname, flux, spix, ra, dec, 30.05, -30.7, '300arcsec', 64,
+                                freqs, chunk_size=7, Nproc=2, overwrite=True)
+    assert np.allclose(fits.getdata(fname), data)
+
+    # ensure overwrite check
+    with pytest.raises(IOError):
+        sky_model.rasterize_sources(fname, flux, spix, ra, dec, 30.05, -30.7, '300arcsec', 64, freqs)
+
+    if os.path.exists(fname):
+        os.remove(fname)
+
+
+def test_freq_nodes():
+    freqs = np.linspace(100e6, 200e6, 64, endpoint=False)
+    nodes = sky_model.node_freqs(freqs, 5)
+    assert np.isclose(nodes[0], freqs[0]) and np.isclose(nodes[-1], freqs[-1])
+
+    # power laws are exact, zeros stay zero
+    spectra = sky_model.source_spectra(np.array([1.0, 2.0, 0.0]), np.array([-0.8, 0.5, 0.0]), freqs)
+    node_spectra = sky_model.source_spectra(np.array([1.0, 2.0, 0.0]), np.array([-0.8, 0.5, 0.0]), nodes)
+    interp = sky_model.interp_freq_nodes(node_spectra, nodes, freqs, axis=1)
+    assert np.allclose(interp, spectra, rtol=1e-10)
+
+    # expand a node cube and compare to the full-resolution cube
+    nodefile, reffile, fullfile = "./_test_nodes.fits", "./_test_ref.fits", "./_test_full.fits"
+    flux, spix = np.array([1.0, 2.0, 3.0]), np.array([-0.8, 0.0, -1.0])
+    ra, dec = np.array([30.05, 31.0, 30.05]), np.array([-30.7, -29.5, -30.7])
+    sky_model.rasterize_sources(nodefile, flux, spix, ra, dec, 30.05, -30.7, '300arcsec', 32, nodes, overwrite=True)
+    sky_model.rasterize_sources(reffile, flux, spix, ra, dec, 30.05, -30.7, '300arcsec', 32, freqs, overwrite=True)
+    sky_model.expand_freq_nodes(nodefile, fullfile, freqs, chunk_size=10, overwrite=True)
+    full, ref = fits.getdata(fullfile), fits.getdata(reffile)
+    assert full.shape == ref.shape
+    assert np.allclose(fits.getheader(fullfile)['CDELT4'], np.diff(freqs)[0])
+
+    # the first pixel holds a sum of two power laws, so is inexact
+    abs_err, rel_err = sky_model.freq_node_error(nodefile, reffile, chunk_size=10)
+    assert np.isclose(abs_err, np.abs(full - ref).max(), atol=1e-5)
+    assert 0 < rel_err < 1e-2
+
+    for f in [nodefile, reffile, fullfile]:
+        if os.path.exists(f):
+            os.remove(f)
@@ -0,0 +1,57 @@
+"""
+Test casa_imaging/stages.py
+"""
+import threading
+import time
+import pytest
+from casa_imaging import stages
+
+
+def test_stage_dependencies():
+    s = [stages.Stage('prep', None, outputs=['ms']),
+         stages.Stage('cal', None, inputs=['model'], mutates=['ms'], outputs=['gaintables']),
+         stages.Stage('export', None, mutates=['gaintables']),
+         stages.Stage('img_model', None, inputs=['ms.model']),
+         stages.Stage('img_corr', None, inputs=['ms']),
+         stages.Stage('img_resid', None, mutates=['ms'], inputs=['gaintables'])]
+    deps = stages.stage_dependencies(s)
+    assert deps['prep'] == set()
+    assert deps['cal'] == set(['prep'])
+    assert deps['export'] == set(['cal'])
+    assert deps['img_model'] == set()
+    assert deps['img_corr'] == set(['prep', 'cal'])
+    assert deps['img_resid'] == set(['prep', 'cal', 'export', 'img_corr'])
+
+    with pytest.raises(ValueError):
+        stages.stage_dependencies([stages.Stage('a', None, after=['b'])])
+
+
+def test_run_stages():
+    lock = threading.Lock()
+    active, peak, order = [0], [0], []
+
+    def work(name):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+            order.append(name)
+        return name
+
+    s = [stages.Stage(n, work, args=(n,), inputs=['x']) for n in 'abcd']
+    s.append(stages.Stage('e', work, args=('e',), mutates=['x']))
+    results = stages.run_stages(s, nworkers=2)
+    assert results == dict((n, n) for n in 'abcde')
+    assert peak[0] == 2
+    assert order[-1] == 'e'
+
+    # failures stop dependent stages
+    def fail():
+        raise ValueError("bad")
+    s = [stages.Stage('a', fail, outputs=['x']), stages.Stage('b', work, args=('b',), inputs=['x'])]
+    order[:] = []
+    with pytest.raises(stages.StageError):
+        stages.run_stages(s, nworkers=2)
+    assert order == []
@@ -0,0 +1,40 @@
+"""
+Test casa_imaging/trace.py
+"""
+import json
+import sys
+from casa_imaging import trace
+from casa_imaging.profiling import Profiler
+
+
+def test_trace(tmpdir, monkeypatch):
+    # disabled by default
+    monkeypatch.delenv(trace.TRACE_ENV, raising=False)
+    assert not trace.enabled()
+    with trace.span('read', 'io'):
+        pass
+
+    tdir = str(tmpdir.join('trace'))
+    monkeypatch.setenv(trace.TRACE_ENV, tdir)
+    assert trace.enabled()
+    prof = Profiler()
+    with prof.stage('gen_model'):
+        with trace.span('read', 'io', file='zen.uvh5'):
+            pass
+        # subprocesses inherit the trace directory
+        code = "from casa_imaging import trace\nwith trace.span('source_extract', 'loop'): pass"
+        prof.check_call([sys.executable, '-c', code])
+
+    outfile = str(tmpdir.join('trace.json'))
+    Nevents = trace.merge(tdir, outfile)
+    with open(outfile) as f:
+        events = json.load(f)['traceEvents']
+    assert len(events) == Nevents
+    spans = dict([(e['name'], e) for e in events if e['ph'] == 'X'])
+    assert set(['gen_model', 'read', 'source_extract']) <= set(spans.keys())
+    assert spans['gen_model']['cat'] == 'stage' and spans['read']['args']['file'] == 'zen.uvh5'
+    # subprocess ran in its own process, within the stage
+    assert spans['source_extract']['pid'] != spans['gen_model']['pid']
+    assert spans['gen_model']['ts'] <= spans['source_extract']['ts'] <= spans['gen_model']['ts'] + spans['gen_model']['dur']
+    assert len([e for e in events if e.get('cat', None) == 'subprocess']) == 1
+    assert len([e for e in events if e['name'] == 'process_name']) == 2
@@ -0,0 +1,260 @@
+"""
+Test casa_imaging/uvdata_utils.py
+"""
+import copy
+import numpy as np
+import pytest
+from casa_imaging import uvdata_utils
+
+
+class MockUVData(object):
+    """A UVData-like object holding the attributes uvdata_utils uses, with select"""
+    blt_attrs = ['data_array', 'flag_array', 'nsample_array', 'time_array', 'lst_array', 'baseline_array',
+                 'ant_1_array', 'ant_2_array', 'uvw_array', 'integration_time']
+
+    def __init__(self, antpos, bls, Ntimes=4, Nfreqs=4, pols=[-5], dt=10.7):
+        self.antenna_numbers = np.arange(len(antpos))
+        self.antenna_positions = np.asarray(antpos, dtype=float)
+        self.polarization_array = np.array(pols)
+        self.phase_type = 'drift'
+        self.time_array = np.repeat(2458101.0 + np.arange(Ntimes) * dt / 86400., len(bls))
+        self.lst_array = np.repeat(1.0 + np.arange(Ntimes) * dt * 7.29e-5, len(bls))
+        self.ant_1_array = np.tile([bl[0] for bl in bls], Ntimes)
+        self.ant_2_array = np.tile([bl[1] for bl in bls], Ntimes)
+        self.baseline_array = self.ant_1_array * 1000 + self.ant_2_array
+        self.uvw_array = self.antenna_positions[self.ant_2_array] - self.antenna_positions[self.ant_1_array]
+        self.integration_time = np.full(len(self.time_array), dt)
+        self.freq_array = np.linspace(100e6, 200e6, Nfreqs, endpoint=False)[None]
+        self.channel_width = 100e6 / Nfreqs
+        shape = (len(self.time_array), 1, Nfreqs, len(pols))
+        self.data_array = np.ones(shape, dtype=np.complex128)
+        self.flag_array = np.zeros(shape, dtype=bool)
+        self.nsample_array = np.ones(shape)
+
+    @property
+    def Nblts(self):
+        return len(self.time_array)
+
+    @property
+    def Nfreqs(self):
+        return self.freq_array.shape[-1]
+
+    def select(self, blt_inds=None, freq_chans=None, inplace=True):
+        out = copy.deepcopy(self)
+        if blt_inds is not None:
+            for attr in self.blt_attrs:
+                setattr(out, attr, getattr(out, attr)[blt_inds])
+        if freq_chans is not None:
+            out.freq_array = out.freq_array[:, freq_chans]
+            for attr in ['data_array', 'flag_array', 'nsample_array']:
+                setattr(out, attr, getattr(out, attr)[:, :, freq_chans])
+        return out
+
+
+def test_concat_uvdata():
+    # pairwise concatenation preserves order for any addable objects
+    for N in [1, 2, 5, 8]:
+        objs = [[i] for i in range(N)]
+        assert uvdata_utils.concat_uvdata(objs) == list(range(N))
+
+    with pytest.raises(ValueError):
+        uvdata_utils.concat_uvdata([])
+
+
+def test_group_average():
+    data = np.array([1.0, 3.0, 5.0, 7.0, 9.0]) + 0j
+    flags = np.array([False, True, False, True, True])
+    nsamples = np.array([1.0, 1.0, 3.0, 1.0, 1.0])
+    avg, f, n = uvdata_utils._group_average(data, flags, nsamples, np.array([0, 2, 4]))
+    # flagged data are excluded, nsamples weight unflagged data
+    assert np.allclose(avg, [1.0, 5.0, 9.0])
+    assert np.all(f == [False, False, True])
+    assert np.allclose(n, [0.5, 1.5, 0.0])
+    assert avg.dtype == data.dtype
+
+    # summed nsamples, as for redundant averages
+    avg, f, n = uvdata_utils._group_average(data, flags, nsamples, np.array([0, 2, 4]), sum_nsamples=True)
+    assert np.allclose(n, [1.0, 3.0, 0.0])
+
+    # along a non-zero axis
+    data = np.arange(12, dtype=float).reshape(2, 6)
+    avg, f, n = uvdata_utils._group_average(data, np.zeros_like(data, bool), np.ones_like(data), np.array([0, 3]), axis=1)
+    assert np.allclose(avg, [[1, 4], [7, 10]])
+
+
+def test_average_uvdata():
+    uvd = MockUVData([[0, 0, 0], [14.6, 0, 0], [29.2, 0, 0]], [(0, 1), (0, 2)])
+    uvd.data_array[:, 0, :, 0] = np.arange(uvd.Nblts * 4).reshape(-1, 4)
+    # flag one of the two samples in an averaging cell, and both samples of another
+    uvd.flag_array[0, 0, 0] = True
+    uvd.flag_array[[1, 3], 0, 2:] = True
+    assert uvdata_utils.average_uvdata(uvd) is uvd
+
+    avg = uvdata_utils.average_uvdata(uvd, tavg=2, favg=2)
+    assert avg.data_array.shape == (4, 1, 2, 1)
+    assert avg.baseline_array.tolist() == [1, 2, 1, 2]
+    assert np.allclose(avg.freq_array, [[112.5e6, 162.5e6]])
+    assert np.isclose(avg.channel_width, 50e6)
+    assert np.allclose((avg.time_array - 2458101.0) * 86400, [5.35, 5.35, 26.75, 26.75])
+    assert np.allclose(avg.integration_time, 2 * 10.7)
+    # flagged data are excluded, and nsamples are averaged over each cell, as in UVData.downsample_in_time
+    assert np.isclose(avg.data_array[0, 0, 0, 0], np.mean([1, 8, 9]))
+    assert np.isclose(avg.nsample_array[0, 0, 0, 0], 0.75)
+    assert avg.flag_array[1, 0, 1, 0] and not avg.flag_array[1, 0, 0, 0]
+    assert np.allclose(avg.nsample_array[2:], 1.0)
+
+    with pytest.raises(ValueError):
+        uvdata_utils.average_uvdata(uvd, favg=8)
+
+
+def test_bda_average():
+    # a short baseline is averaged up to max_tavg, a long one is not averaged
+    uvd = MockUVData([[0, 0, 0], [14.6, 0, 0], [3000, 0, 0], [100, 0, 0]], [(0, 1), (0, 2), (0, 3)], Ntimes=8)
+    uvd.phase_type = 'phased'
+    avg = uvdata_utils.bda_average(uvd, 20.0, decorr=0.05, max_tavg=4)
+    assert avg.Nblts == 2 + 8 + 2
+    assert np.allclose(avg.integration_time[avg.baseline_array == 1], 4 * 10.7)
+    assert np.allclose(avg.integration_time[avg.baseline_array == 2], 10.7)
+    assert np.allclose(avg.integration_time[avg.baseline_array == 3], 4 * 10.7)
+    assert np.allclose((avg.time_array[avg.baseline_array == 1] - 2458101.0) * 86400, [1.5 * 10.7, 5.5 * 10.7])
+
+    # drift-scan data decorrelate faster, and are averaged less
+    uvd.phase_type = 'drift'
+    avg = uvdata_utils.bda_average(uvd, 20.0, decorr=0.05, max_tavg=4)
+    assert np.allclose(avg.integration_time[avg.baseline_array == 3], [3 * 10.7, 3 * 10.7, 2 * 10.7])
+
+
+def test_bda_tavg():
+    bl_lens = np.array([0.0, 14.6, 29.2, 3000.0])
+    tavg = uvdata_utils.bda_tavg(bl_lens, 200e6, 10.7, 20.0, decorr=0.05, max_tavg=16)
+    assert tavg.dtype == np.int64
+    assert tavg[0] == 16 and tavg[-1] == 1
+    assert np.all(np.diff(tavg) <= 0)
+
+    # drift-scan data are averaged less than phased data
+    drift_tavg = uvdata_utils.bda_tavg(bl_lens, 200e6, 10.7, 20.0, decorr=0.05, max_tavg=16, drift=True)
+    assert np.all(drift_tavg <= tavg) and np.any(drift_tavg < tavg)
+
+    # simulate drift-scan visibilities of a source transiting zenith on east-west baselines
+    lat = np.deg2rad(-30.72)
+    omega_e = 7.2921150e-5
+    for b in [14.6, 29.2, 100.0]:
+        Navg = uvdata_utils.bda_tavg([b], 200e6, 10.7, 20.0, decorr=0.05, max_tavg=1000, drift=True)[0]
+        # averaging window centered on transit, sampled finely within each integration
+        t = (np.arange(Navg * 100) - Navg * 50 + 0.5) * 10.7 / 100
+        vis = np.exp(2j * np.pi * b * 200e6 / 2.99792458e8 * np.sin(omega_e * t) * np.cos(lat))
+        assert 1 - np.abs(vis.mean()) <= 0.05
+        # the phased-data limit would exceed decorr
+        Navg = uvdata_utils.bda_tavg([b], 200e6, 10.7, 20.0, decorr=0.05, max_tavg=1000)[0]
+        t = (np.arange(Navg * 100) - Navg * 50 + 0.5) * 10.7 / 100
+        vis = np.exp(2j * np.pi * b * 200e6 / 2.99792458e8 * np.sin(omega_e * t) * np.cos(lat))
+        assert 1 - np.abs(vis.mean()) > 0.05
+
+
+def test_redundant_groups():
+    bl_vecs = np.array([[14.6, 0, 0], [14.7, 0.1, 0], [-14.6, 0, 0], [0, 14.6, 0], [0, 0, 0]])
+    groups, conj = uvdata_utils.redundant_groups(bl_vecs, tol=1.0)
+    assert groups[0] == groups[1] == groups[2]
+    assert len(np.unique(groups)) == 3
+    assert conj.tolist() == [False, False, True, False, False]
+
+    # baselines within tol are grouped even if they straddle a multiple of tol
+    bl_vecs = np.array([[14.49, 0, 0], [14.51, 0, 0], [-14.52, 0.01, 0], [0.01, 14.6, 0], [-0.01, -14.6, 0]])
+    groups, conj = uvdata_utils.redundant_groups(bl_vecs, tol=0.1)
+    assert groups.tolist() == [0, 0, 0, 1, 1]
+    assert conj.tolist() == [False, False, True, False, True]
+
+
+def test_redundant_average():
+    # (0, 1) and (2, 1) are redundant with opposite orientation, (0, 2) is unique
+    uvd = MockUVData([[0, 0, 0], [14.6, 0, 0], [29.2, 0, 0]], [(0, 1), (2, 1), (0, 2)], Ntimes=2,
+                     pols=[-5, -6, -7, -8])
+    b01, b21 = uvd.baseline_array == 1, uvd.baseline_array == 2001
+    uvd.data_array[b01] = [1, 2, 3 + 1j, 4 + 2j]
+    # conjugating swaps xy and yx
+    uvd.data_array[b21] = [1, 2, 4 - 2j, 3 - 1j]
+    uvd.flag_array[np.where(b21)[0][0], ..., 3] = True
+
+    red = uvdata_utils.redundant_average(uvd, tol=0.5)
+    assert red.baseline_array.tolist() == [1, 2, 1, 2]
+    assert np.allclose(red.data_array[red.baseline_array == 1], [1, 2, 3 + 1j, 4 + 2j])
+    # nsamples are summed over unflagged baselines of each group, as in UVData.compress_by_redundancy
+    assert np.allclose(red.nsample_array[red.baseline_array == 1][0, 0, 0], [2, 2, 1, 2])
+    assert np.allclose(red.nsample_array[red.baseline_array == 1][1], 2)
+    assert np.allclose(red.nsample_array[red.baseline_array == 2], 1)
+    assert not red.flag_array.any()
+
+    # the output keeps the orientation of the first baseline of the group in the data
+    uvd.flag_array[:] = False
+    red = uvdata_utils.redundant_average(uvd.select(blt_inds=[1, 0, 2, 4, 3, 5], inplace=False), tol=0.5)
+    assert red.baseline_array.tolist() == [2001, 2, 2001, 2]
+    assert np.allclose(red.data_array[red.baseline_array == 2001], [1, 2, 4 - 2j, 3 - 1j])
+
+    # cross-hand polarizations can't be conjugated without their pair
+    uvd = MockUVData([[0, 0, 0], [14.6, 0, 0], [29.2, 0, 0]], [(0, 1), (2, 1)], pols=[-7])
+    with pytest.raises(ValueError):
+        uvdata_utils.redundant_average(uvd, tol=0.5)
+
+
+def test_write_ms_requires_casa():
+    class Dummy(object):
+        pass
+    assert not uvdata_utils.can_write_ms(Dummy())
+    with pytest.raises(ValueError):
+        uvdata_utils.write_ms(Dummy(), 'nonexistent_file.ms')
+
+
+def test_write_ms_tables(tmpdir):
+    tables = pytest.importorskip('casacore.tables')
+
+    class UVD(object):
+        pass
+    uvd = UVD()
+    uvd.phase_type = 'phased'
+    uvd.Nspws = 1
+    uvd.telescope_name = 'HERA'
+    uvd.telescope_location = np.array([5109342.8, 2005241.9, -3239939.4])
+    uvd.antenna_numbers = np.array([0, 2])
+    uvd.antenna_names = ['HH0', 'HH2']
+    uvd.antenna_positions = np.array([[0.0, 0, 0], [14.6, 0, 0]])
+    uvd.ant_1_array = np.array([0, 0, 0, 0])
+    uvd.ant_2_array = np.array([2, 2, 0, 0])
+    uvd.time_array = np.array([2458101.0, 2458101.0001, 2458101.0, 2458101.0001])
+    uvd.integration_time = np.full(4, 10.7)
+    uvd.uvw_array = np.array([[14.6, 0, 0], [14.6, 0.1, 0], [0, 0, 0], [0, 0, 0]])
+    uvd.freq_array = np.linspace(100e6, 200e6, 3)[None]
+    uvd.channel_width = 50e6
+    uvd.polarization_array = np.array([-5, -6])
+    uvd.phase_center_ra, uvd.phase_center_dec = 0.5, -0.5
+    uvd.data_array = (np.arange(24) * (1 + 1j)).reshape(4, 1, 3, 2)
+    uvd.flag_array = np.zeros((4, 1, 3, 2), dtype=bool)
+    uvd.flag_array[0, 0, 1, 0] = True
+    uvd.nsample_array = np.full((4, 1, 3, 2), 2.0)
+
+    assert uvdata_utils.can_write_ms(uvd)
+    msfile = str(tmpdir.join('data.ms'))
+    assert uvdata_utils.write_ms(uvd, msfile)
+
+    ms = tables.table(msfile, ack=False)
+    # uvws flipped and data conjugated, as for uvfits
+    assert np.allclose(ms.getcol('UVW'), -uvd.uvw_array)
+    assert np.allclose(ms.getcol('DATA'), uvd.data_array[:, 0].conj())
+    assert np.all(ms.getcol('FLAG') == uvd.flag_array[:, 0])
+    assert np.allclose(ms.getcol('WEIGHT_SPECTRUM'), 2.0)
+    assert np.allclose(ms.getcol('TIME')[0], (2458101.0 - 2400000.5) * 86400)
+    assert ms.getcol('ANTENNA2').tolist() == [2, 2, 0, 0]
+    ms.close()
+    ant = tables.table(msfile + '/ANTENNA', ack=False)
+    assert ant.getcol('NAME') == ['HH0', 'ANT1', 'HH2']
+    assert ant.getcol('FLAG_ROW').tolist() == [False, True, False]
+    ant.close()
+    pol = tables.table(msfile + '/POLARIZATION', ack=False)
+    assert pol.getcol('CORR_TYPE').tolist() == [[9, 12]]
+    pol.close()
+    spw = tables.table(msfile + '/SPECTRAL_WINDOW', ack=False)
+    assert np.allclose(spw.getcol('CHAN_FREQ'), uvd.freq_array)
+    spw.close()
+
+    # drift data can't be written directly
+    uvd.phase_type = 'drift'
+    assert not uvdata_utils.can_write_ms(uvd)
@@ -0,0 +1,136 @@
+"""
+Timeline tracing of pipeline runs in the Chrome / Perfetto trace event format.
+
+Tracing is enabled by setting the CASA_IMAGING_TRACE environment variable
+to a directory, which is inherited by the scripts a pipeline calls. Each
+process appends its events to its own trace.<pid>.jsonl file in that
+directory, and merge collects them into a single JSON trace that can be
+opened in chrome://tracing or https://ui.perfetto.dev.
+"""
+from __future__ import absolute_import, division, print_function
+
+import os
+import sys
+import json
+import glob
+import time
+import threading
+import contextlib
+
+TRACE_ENV = 'CASA_IMAGING_TRACE'
+
+_lock = threading.Lock()
+# pid and thread idents whose metadata events have been written
+_named = set()
+
+
+def trace_dir():
+    """Get the trace directory, or None if tracing is disabled"""
+    return os.environ.get(TRACE_ENV, None) or None
+
+
+def enabled():
+    """Check whether tracing is enabled"""
+    return trace_dir() is not None
+
+
+def _now():
+    """Get the current time in microseconds. Wall clock, such that processes share a timeline."""
+    return time.time() * 1e6
+
+
+def _emit(event):
+    """Append an event to the trace file of this process, along with process and thread names"""
+    tdir = trace_dir()
+    if tdir is None:
+        return
+    pid = os.getpid()
+    thread = threading.current_thread()
+    event = dict(event, pid=pid, tid=thread.ident)
+    events = []
+    with _lock:
+        if pid not in _named:
+            _named.add(pid)
+            name = os.path.basename(sys.argv[0]) if len(sys.argv) > 0 and sys.argv[0] else 'python'
+            events.append(dict(name='process_name', ph='M', pid=pid, tid=thread.ident, args=dict(name=name)))
+        if (pid, thread.ident) not in _named:
+            _named.add((pid, thread.ident))
+            events.append(dict(name='thread_name', ph='M', pid=pid, tid=thread.ident, args=dict(name=thread.name)))
+        events.append(event)
+        if not os.path.exists(tdir):
+            try:
+                os.makedirs(tdir)
+            except OSError:
+                # created by another process
+                pass
+        with open(os.path.join(tdir, 'trace.{}.jsonl'.format(pid)), 'a') as f:
+            for e in events:
+                f.write(json.dumps(e, default=str) + '\n')
+
+
+def complete(name, cat, start, dur, args=None):
+    """
+    Record an event that has already finished.
+
+    Args:
+        name : str, event name
+        cat : str, event category, Ex. 'stage', 'subprocess', 'io' or 'loop'
+        start : float, start time in seconds since the epoch
+        dur : float, duration in seconds
+        args : dict of JSON-serializable event arguments
+    """
+    if not enabled():
+        return
+    _emit(dict(name=name, cat=cat, ph='X', ts=start * 1e6, dur=dur * 1e6, args=args or {}))
+
+
+@contextlib.contextmanager
+def span(name, cat, **args):
+    """
+    Context manager that records the time spent in its block as an event.
+    Does nothing if tracing is disabled.
+
+    Args:
+        name : str, event name
+        cat : str, event category, Ex. 'stage', 'subprocess', 'io' or 'loop'
+        args : JSON-serializable event arguments
+    """
+    if not enabled():
+        yield
+        return
+    t0 = _now()
+    try:
+        yield
+    except BaseException as e:
+        args['error'] = repr(e)
+        raise
+    finally:
+        _emit(dict(name=name, cat=cat, ph='X', ts=t0, dur=_now() - t0, args=args))
+
+
+def merge(tdir, outfile):
+    """
+    Merge the trace files of all processes in a trace directory
+    into one Chrome trace JSON file.
+
+    Args:
+        tdir : str, trace directory
+        outfile : str, output JSON filepath
+
+    Returns:
+        int, number of events written
+    """
+    events = []
+    for fname in sorted(glob.glob(os.path.join(tdir, 'trace.*.jsonl'))):
+        with open(fname) as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    # partial line of a process that was killed mid-write
+                    continue
+    events = sorted(events, key=lambda e: (e['ph'] != 'M', e.get('ts', 0)))
+    with open(outfile, 'w') as f:
+        json.dump(dict(traceEvents=events, displayTimeUnit='ms'), f)
+
+    return len(events)
@@ -0,0 +1,636 @@
+"""
+Utility functions for operating on pyuvdata.UVData objects.
+"""
+from __future__ import absolute_import, division, print_function
+
+import numpy as np
+import os
+import shutil
+import subprocess
+
+from . import trace
+
+
+def concat_uvdata(uvds, axis='blt'):
+    """
+    Concatenate a list of UVData objects in a single pass.
+
+    Uses UVData.fast_concat when available (pyuvdata >= 2.0), which
+    allocates the output once. Otherwise, or if the objects are not
+    compatible with fast_concat along axis, objects are added pairwise
+    in a balanced tree, such that each is copied O(log N) rather than
+    O(N) times as in reduce(operator.add, uvds).
+
+    Args:
+        uvds : list of UVData objects, in the order they should be concatenated
+        axis : str, axis to concatenate along for fast_concat,
+            one of ['blt', 'freq', 'polarization']
+
+    Returns:
+        uvd : concatenated UVData object
+    """
+    uvds = list(uvds)
+    if len(uvds) == 0:
+        raise ValueError("No UVData objects to concatenate")
+    if len(uvds) == 1:
+        return uvds[0]
+
+    if hasattr(uvds[0], 'fast_concat'):
+        try:
+            return uvds[0].fast_concat(uvds[1:], axis, inplace=False)
+        except ValueError:
+            pass
+
+    # add pairwise, preserving order
+    while len(uvds) > 1:
+        uvds = [uvds[i] + uvds[i + 1] if i + 1 < len(uvds) else uvds[i] for i in range(0, len(uvds), 2)]
+
+    return uvds[0]
+
+
+def load_uvdata(fname, flagfile=None, **read_kwargs):
+    """
+    Read a visibility file and optionally apply a UVFlag file to it.
+
+    Args:
+        fname : str, path to visibility file
+        flagfile : str, path to UVFlag file to apply to data
+        read_kwargs : kwargs for UVData.read. If freq_chans is provided,
+            flags are selected on the same channels.
+
+    Returns:
+        uvd : UVData object
+    """
+    from pyuvdata import UVData, UVFlag
+    import pyuvdata.utils as uvutils
+
+    uvd = UVData()
+    with trace.span('read', 'io', file=fname):
+        uvd.read(fname, **read_kwargs)
+
+    if flagfile is not None:
+        with trace.span('read', 'io', file=flagfile):
+            uvf = UVFlag(flagfile)
+        if read_kwargs.get('freq_chans', None) is not None:
+            uvf.select(freq_chans=read_kwargs['freq_chans'])
+        uvutils.apply_uvflag(uvd, uvf, force_pol=True, flag_missing=True, inplace=True)
+
+    return uvd
+
+
+def _load_uvdata(args):
+    """Unpack (fname, flagfile, read_kwargs) for load_uvdata"""
+    fname, flagfile, read_kwargs = args
+    return load_uvdata(fname, flagfile=flagfile, **read_kwargs)
+
+
+def load_uvdata_files(fnames, flagfiles=None, read_kwargs=None, nproc=1):
+    """
+    Read visibility files and apply flag files concurrently with a thread pool,
+    which overlaps I/O on network storage. Output order matches fnames.
+
+    Args:
+        fnames : list of str, paths to visibility files
+        flagfiles : list of str (or None) for each file in fnames, UVFlag files to apply
+        read_kwargs : list of dicts for each file in fnames, kwargs for UVData.read
+        nproc : int, number of threads to use
+
+    Returns:
+        uvds : list of UVData objects for each file in fnames
+    """
+    if flagfiles is None:
+        flagfiles = [None for f in fnames]
+    if read_kwargs is None:
+        read_kwargs = [{} for f in fnames]
+    jobs = list(zip(fnames, flagfiles, read_kwargs))
+
+    if nproc is None or nproc <= 1 or len(jobs) <= 1:
+        return [_load_uvdata(job) for job in jobs]
+
+    from multiprocessing.pool import ThreadPool
+    pool = ThreadPool(min(nproc, len(jobs)))
+    try:
+        uvds = pool.map(_load_uvdata, jobs)
+    finally:
+        pool.close()
+        pool.join()
+
+    return uvds
+
+
+def _group_average(data, flags, nsamples, bounds, axis=0, sum_nsamples=False):
+    """
+    Flag-aware, nsample-weighted average of contiguous groups along an axis.
+
+    Args:
+        data : ndarray of visibilities
+        flags : boolean ndarray of flags, same shape as data
+        nsamples : ndarray of nsamples, same shape as data
+        bounds : integer ndarray of the starting index of each group along axis
+        axis : integer axis to average along
+        sum_nsamples : bool, if True return the summed nsamples of each group,
+            rather than the sum divided by group size
+
+    Returns: (avg_data, avg_flags, avg_nsamples)
+        avg_data : nsample-weighted average of unflagged data in each group,
+            or the unweighted average if the entire group is flagged
+        avg_flags : True where the entire group is flagged
+        avg_nsamples : summed nsamples of unflagged data, divided by group size
+            unless sum_nsamples
+    """
+    w = nsamples * ~flags
+    wsum = np.add.reduceat(w, bounds, axis=axis)
+    dsum = np.add.reduceat(data * w, bounds, axis=axis)
+    counts = np.diff(np.append(bounds, data.shape[axis]))
+    shape = [1] * data.ndim
+    shape[axis] = -1
+    counts = counts.reshape(shape)
+
+    avg_flags = wsum == 0
+    avg_data = np.where(avg_flags, np.add.reduceat(data, bounds, axis=axis) / counts,
+                        dsum / np.where(avg_flags, 1, wsum))
+
+    if not sum_nsamples:
+        wsum = wsum / counts
+
+    return avg_data.astype(data.dtype), avg_flags, wsum.astype(nsamples.dtype)
+
+
+def average_uvdata(uvd, tavg=1, favg=1):
+    """
+    Average a UVData object in time and frequency, weighting unflagged data
+    by their nsamples. Output data are flagged only where all input
+    data in an averaging cell are flagged.
+
+    Args:
+        uvd : UVData object
+        tavg : int, number of integrations to average, per baseline
+        favg : int, number of frequency channels to average. Channels
+            beyond the last whole multiple of favg are dropped.
+
+    Returns:
+        uvd : averaged UVData object, or the input if tavg == favg == 1
+    """
+    if favg > 1:
+        uvd = _freq_average(uvd, int(favg))
+    if tavg > 1:
+        uvd = _time_average(uvd, int(tavg))
+
+    return uvd
+
+
+def _freq_average(uvd, favg):
+    """Average a UVData object across blocks of favg channels"""
+    Nout = uvd.Nfreqs // favg
+    if Nout == 0:
+        raise ValueError("Cannot average {} channels by {}".format(uvd.Nfreqs, favg))
+    bounds = np.arange(0, Nout * favg, favg)
+
+    # frequency is the second to last axis of the data arrays
+    ax = uvd.data_array.ndim - 2
+    chans = [slice(None)] * uvd.data_array.ndim
+    chans[ax] = slice(0, Nout * favg)
+    chans = tuple(chans)
+    data, flags, nsamples = _group_average(uvd.data_array[chans], uvd.flag_array[chans],
+                                           uvd.nsample_array[chans], bounds, axis=ax)
+
+    out = uvd.select(freq_chans=bounds, inplace=False)
+    out.data_array, out.flag_array, out.nsample_array = data, flags, nsamples
+    freqs = uvd.freq_array[..., :Nout * favg]
+    out.freq_array = freqs.reshape(freqs.shape[:-1] + (Nout, favg)).mean(axis=-1)
+    out.channel_width = out.channel_width * favg
+
+    return out
+
+
+def _contiguous_groups(key):
+    """
+    Get the sorting that makes baseline-times with equal key contiguous,
+    with groups ordered by first appearance.
+
+    Args:
+        key : integer ndarray of group key for each baseline-time
+
+    Returns: (first, sort, bounds)
+        first : sorted index of the first baseline-time in each group
+        sort : indexing array that sorts baseline-times by group
+        bounds : index of the start of each group in the sorted baseline-times
+    """
+    ukeys, first, inv = np.unique(key, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    groups = rank[inv.ravel()]
+    sort = np.argsort(groups, kind='mergesort')
+    bounds = np.flatnonzero(np.diff(np.append(-1, groups[sort])))
+
+    return np.sort(first), sort, bounds
+
+
+def _time_average(uvd, tavg):
+    """
+    Average a UVData object across blocks of tavg integrations of each baseline,
+    where tavg is an integer or an integer ndarray for each baseline-time
+    """
+    # get time bin of each baseline-time
+    times = np.unique(uvd.time_array)
+    dt = np.median(np.diff(times)) if len(times) > 1 else 1.0
+    tbins = np.round((uvd.time_array - times[0]) / dt).astype(np.int64) // tavg
+
+    # average baseline-times in each baseline and time bin
+    key = uvd.baseline_array.astype(np.int64) * (tbins.max() + 1) + tbins
+    first, sort, bounds = _contiguous_groups(key)
+    data, flags, nsamples = _group_average(uvd.data_array[sort], uvd.flag_array[sort],
+                                           uvd.nsample_array[sort], bounds, axis=0)
+
+    out = uvd.select(blt_inds=first, inplace=False)
+    out.data_array, out.flag_array, out.nsample_array = data, flags, nsamples
+    counts = np.diff(np.append(bounds, len(sort)))
+    out.time_array = np.add.reduceat(uvd.time_array[sort], bounds) / counts
+    out.uvw_array = np.add.reduceat(uvd.uvw_array[sort], bounds, axis=0) / counts[:, None]
+    out.lst_array = np.mod(np.angle(np.add.reduceat(np.exp(1j * uvd.lst_array[sort]), bounds)), 2 * np.pi)
+    out.integration_time = np.add.reduceat(uvd.integration_time[sort], bounds)
+    out.Ntimes = len(np.unique(out.time_array))
+
+    return out
+
+
+def bda_tavg(bl_lens, freq_max, dt, fov, decorr=0.05, max_tavg=16, drift=False):
+    """
+    Get the number of integrations each baseline can be averaged over
+    before time smearing decorrelates sources at the edge of the field of view
+    by more than decorr.
+
+    Averaging a fringe whose phase drifts by phi over the averaging window
+    reduces its amplitude by sinc(phi / 2) ~ 1 - phi^2 / 24, such that the
+    maximum phase drift is phi = sqrt(24 * decorr). In phased data, the fringe rate
+    of a source at an angle theta from the phase center is at most
+    omega_E * |b| / lambda * sin(theta). In drift-scan data every source,
+    including one at the pointing center, fringes at up to omega_E * |b| / lambda.
+
+    Args:
+        bl_lens : ndarray of baseline lengths [meters]
+        freq_max : maximum frequency [Hz]
+        dt : integration time [seconds]
+        fov : field of view diameter [degrees]
+        decorr : maximum fractional amplitude loss at the edge of the field of view
+        max_tavg : maximum number of integrations to average
+        drift : bool, if True the data are drift-scan rather than phased,
+            and fov doesn't limit the fringe rate
+
+    Returns:
+        tavg : integer ndarray of integrations to average for each baseline
+    """
+    omega_e = 7.2921150e-5
+    phi = np.sqrt(24 * decorr)
+    fringe_rate = 2 * np.pi * omega_e * np.asarray(bl_lens) * freq_max / 2.99792458e8
+    if not drift:
+        fringe_rate = fringe_rate * np.sin(np.deg2rad(fov / 2.0))
+    with np.errstate(divide='ignore'):
+        tmax = np.where(fringe_rate > 0, phi / fringe_rate, np.inf)
+
+    return np.clip(np.floor(tmax / dt), 1, max_tavg).astype(np.int64)
+
+
+def bda_average(uvd, fov, decorr=0.05, max_tavg=16):
+    """
+    Baseline-dependent time averaging of a UVData object, averaging each
+    baseline by as many integrations as its time smearing limit allows (see bda_tavg).
+    Short baselines are averaged more than long baselines, reducing the
+    number of baseline-times that have to be gridded. Drift-scan data
+    decorrelate much faster than phased data, so phase the data first.
+
+    Args:
+        uvd : UVData object
+        fov : field of view diameter [degrees] to limit decorrelation within
+        decorr : maximum fractional amplitude loss at the edge of the field of view
+        max_tavg : maximum number of integrations to average
+
+    Returns:
+        uvd : averaged UVData object with a different time sampling for each baseline
+    """
+    # get mean length of each baseline
+    bls, inv = np.unique(uvd.baseline_array, return_inverse=True)
+    inv = inv.ravel()
+    lens = np.bincount(inv, weights=np.linalg.norm(uvd.uvw_array, axis=1)) / np.bincount(inv)
+
+    # get integrations to average for each baseline
+    times = np.unique(uvd.time_array)
+    dt = np.median(np.diff(times)) * 24 * 3600 if len(times) > 1 else np.median(uvd.integration_time)
+    tavg = bda_tavg(lens, uvd.freq_array.max(), dt, fov, decorr=decorr, max_tavg=max_tavg,
+                    drift=uvd.phase_type == 'drift')
+
+    return _time_average(uvd, tavg[inv])
+
+
+def redundant_groups(bl_vecs, tol=1.0):
+    """
+    Group baseline vectors that are redundant to within a tolerance.
+
+    Baselines are assigned in order to the first group whose first baseline
+    lies within a distance tol of them or of their conjugate, or else start
+    a new group, oriented such that its first component larger than tol
+    is positive.
+
+    Args:
+        bl_vecs : ndarray of shape (Nbls, 3) of baseline vectors [meters]
+        tol : float, redundancy tolerance [meters]
+
+    Returns: (groups, conj)
+        groups : integer ndarray of redundant group index of each baseline
+        conj : boolean ndarray, True for baselines that are conjugated
+            with respect to their group orientation
+    """
+    vecs = np.asarray(bl_vecs, dtype=np.float64).reshape(-1, 3)
+    groups = np.zeros(len(vecs), dtype=np.int64)
+    conj = np.zeros(len(vecs), dtype=bool)
+    ref = np.empty((0, 3))
+    for i, v in enumerate(vecs):
+        # distance to the first baseline of each group, and its conjugate
+        d = np.linalg.norm(ref - v, axis=1)
+        dc = np.linalg.norm(ref + v, axis=1)
+        match = np.where((d <= tol) | (dc <= tol))[0]
+        if len(match) > 0:
+            groups[i] = match[0]
+            conj[i] = dc[match[0]] < d[match[0]]
+        else:
+            long_axes = np.where(np.abs(v) > tol)[0]
+            conj[i] = len(long_axes) > 0 and v[long_axes[0]] < 0
+            groups[i] = len(ref)
+            ref = np.vstack([ref, -v if conj[i] else v])
+
+    return groups, conj
+
+
+# pyuvdata polarization numbers of cross-hand pairs, xy and yx, and rl and lr
+_cross_pols = [(-7, -8), (-3, -4)]
+
+
+def _conj_pols(arr, conj, pols):
+    """
+    Swap cross-hand polarizations of conjugated baseline-times in a data,
+    flag or nsample array, since the conjugate of xy on a baseline is yx on
+    the reversed baseline.
+
+    Args:
+        arr : ndarray with baseline-time first and polarization last axes
+        conj : boolean ndarray of baseline-times to swap
+        pols : polarization numbers of the last axis of arr
+
+    Returns:
+        arr : ndarray with swapped polarizations
+    """
+    pols = list(pols)
+    arr = arr.copy()
+    for p1, p2 in _cross_pols:
+        if (p1 in pols) != (p2 in pols):
+            raise ValueError("Cannot conjugate polarization {} without {}".format(p1 if p1 in pols else p2,
+                                                                                  p2 if p1 in pols else p1))
+        if p1 in pols:
+            i1, i2 = pols.index(p1), pols.index(p2)
+            swap = arr[conj, ..., i1]
+            arr[conj, ..., i1] = arr[conj, ..., i2]
+            arr[conj, ..., i2] = swap
+    return arr
+
+
+def redundant_average(uvd, tol=1.0):
+    """
+    Average a UVData object over redundant baselines at each time,
+    weighting unflagged data by their nsamples, and summing nsamples
+    as in UVData.compress_by_redundancy. The output holds one
+    baseline per redundant group, taken as the first baseline of the group
+    to appear in the data, with data of conjugate baselines conjugated
+    onto its orientation and their cross-hand polarizations swapped.
+
+    Args:
+        uvd : UVData object
+        tol : float, redundancy tolerance [meters]
+
+    Returns:
+        uvd : redundantly averaged UVData object
+
+    Raises:
+        ValueError if uvd holds only one of a cross-hand polarization pair (Ex. xy without yx)
+    """
+    # group baselines by their vectors from antenna positions
+    bls, binds, inv = np.unique(uvd.baseline_array, return_index=True, return_inverse=True)
+    ant_inds = dict(zip(uvd.antenna_numbers, range(len(uvd.antenna_numbers))))
+    a1 = np.array([ant_inds[a] for a in uvd.ant_1_array[binds]])
+    a2 = np.array([ant_inds[a] for a in uvd.ant_2_array[binds]])
+    bl_vecs = uvd.antenna_positions[a2] - uvd.antenna_positions[a1]
+    groups, conj = redundant_groups(bl_vecs, tol=tol)
+    groups, conj = groups[inv.ravel()], conj[inv.ravel()]
+
+    # conjugate data onto the group orientation
+    shape = (-1,) + (1,) * (uvd.data_array.ndim - 1)
+    pols = uvd.polarization_array
+    data = _conj_pols(np.where(conj.reshape(shape), uvd.data_array.conj(), uvd.data_array), conj, pols)
+    flags = _conj_pols(uvd.flag_array, conj, pols)
+    nsamples = _conj_pols(uvd.nsample_array, conj, pols)
+
+    # average baseline-times in each redundant group and time
+    times, tinds = np.unique(uvd.time_array, return_inverse=True)
+    key = groups.astype(np.int64) * len(times) + tinds.ravel()
+    first, sort, bounds = _contiguous_groups(key)
+    data, flags, nsamples = _group_average(data[sort], flags[sort], nsamples[sort], bounds, axis=0,
+                                           sum_nsamples=True)
+
+    # conjugate back onto the orientation of the output baselines
+    out_conj = conj[sort][bounds]
+    data = _conj_pols(np.where(out_conj.reshape(shape), data.conj(), data), out_conj, pols)
+    flags = _conj_pols(flags, out_conj, pols)
+    nsamples = _conj_pols(nsamples, out_conj, pols)
+
+    out = uvd.select(blt_inds=first, inplace=False)
+    out.data_array, out.flag_array, out.nsample_array = data, flags, nsamples
+
+    return out
+
+
+# CASA Stokes enumeration of pyuvdata polarization numbers, and their receptor products
+_casa_stokes = {1: 1, 2: 2, 3: 3, 4: 4, -1: 5, -3: 6, -4: 7, -2: 8, -5: 9, -7: 10, -8: 11, -6: 12}
+_corr_products = {1: [0, 0], 2: [0, 1], 3: [1, 0], 4: [1, 1], 5: [0, 0], 6: [0, 1], 7: [1, 0], 8: [1, 1],
+                  9: [0, 0], 10: [0, 1], 11: [1, 0], 12: [1, 1]}
+
+
+def can_write_ms(uvd):
+    """
+    Check whether a UVData object can be written to a Measurement Set directly,
+    which requires python-casacore and phased data in a single spectral window.
+
+    Args:
+        uvd : UVData object
+
+    Returns:
+        bool
+    """
+    if getattr(uvd, 'phase_type', None) != 'phased' or getattr(uvd, 'Nspws', 1) != 1:
+        return False
+    try:
+        import casacore.tables
+    except ImportError:
+        return False
+
+    return True
+
+
+def _write_ms_tables(uvd, msfile):
+    """
+    Write a phased UVData object with a single spectral window to a
+    Measurement Set with python-casacore, for pyuvdata versions
+    without UVData.write_ms (Ex. on Python 2). As for uvfits, the MS
+    uvw convention is opposite that of UVData, so uvws are flipped
+    and visibilities conjugated.
+
+    Args:
+        uvd : phased UVData object
+        msfile : str, output MS filepath
+    """
+    from casacore import tables
+
+    # get arrays in (Nblts, Nfreqs, Npols) shape
+    data, flags, nsamples = uvd.data_array, uvd.flag_array, uvd.nsample_array
+    if data.ndim == 4:
+        data, flags, nsamples = data[:, 0], flags[:, 0], nsamples[:, 0]
+    freqs = np.asarray(uvd.freq_array, dtype=np.float64).ravel()
+    chan_width = np.broadcast_to(np.asarray(uvd.channel_width, dtype=np.float64).ravel(), freqs.shape)
+    Nblts, Nfreqs, Npols = data.shape
+    corr_type = [_casa_stokes[int(p)] for p in uvd.polarization_array]
+
+    # create MS with fixed-shape data columns
+    shape = [Nfreqs, Npols]
+    desc = tables.maketabdesc([tables.makearrcoldesc('DATA', 0j, shape=shape, valuetype='complex', options=4),
+                               tables.makearrcoldesc('FLAG', False, shape=shape, options=4),
+                               tables.makearrcoldesc('WEIGHT_SPECTRUM', 0.0, shape=shape, valuetype='float', options=4),
+                               tables.makearrcoldesc('WEIGHT', 0.0, shape=[Npols], valuetype='float', options=4),
+                               tables.makearrcoldesc('SIGMA', 0.0, shape=[Npols], valuetype='float', options=4)])
+    ms = tables.default_ms(msfile, desc)
+
+    # main table: MS times are UTC MJD seconds
+    times = (np.asarray(uvd.time_array) - 2400000.5) * 86400.0
+    int_time = np.broadcast_to(np.asarray(uvd.integration_time, dtype=np.float64), (Nblts,))
+    weight = np.where(flags, 0, nsamples).mean(axis=1)
+    ms.addrows(Nblts)
+    ms.putcol('UVW', -np.asarray(uvd.uvw_array, dtype=np.float64))
+    ms.putcol('ANTENNA1', np.asarray(uvd.ant_1_array, dtype=np.int32))
+    ms.putcol('ANTENNA2', np.asarray(uvd.ant_2_array, dtype=np.int32))
+    ms.putcol('TIME', times)
+    ms.putcol('TIME_CENTROID', times)
+    ms.putcol('INTERVAL', int_time)
+    ms.putcol('EXPOSURE', int_time)
+    ms.putcol('DATA', np.conj(data).astype(np.complex64))
+    ms.putcol('FLAG', flags)
+    ms.putcol('FLAG_ROW', np.all(flags, axis=(1, 2)))
+    ms.putcol('WEIGHT_SPECTRUM', nsamples.astype(np.float32))
+    ms.putcol('WEIGHT', weight.astype(np.float32))
+    ms.putcol('SIGMA', np.where(weight > 0, 1 / np.sqrt(np.where(weight > 0, weight, 1)), 1).astype(np.float32))
+    ms.putcol('SCAN_NUMBER', np.ones(Nblts, dtype=np.int32))
+    for col in ['STATE_ID', 'PROCESSOR_ID']:
+        ms.putcol(col, -np.ones(Nblts, dtype=np.int32))
+    ms.close()
+
+    def subtable(name, Nrows, cols):
+        tb = tables.table(os.path.join(msfile, name), readonly=False, ack=False)
+        tb.addrows(Nrows)
+        for col, val in cols.items():
+            tb.putcol(col, val)
+        tb.close()
+
+    # antenna table rows are indexed by antenna number
+    Nants = int(max(np.max(uvd.antenna_numbers), np.max(uvd.ant_1_array), np.max(uvd.ant_2_array))) + 1
+    names = ['ANT{}'.format(i) for i in range(Nants)]
+    positions = np.zeros((Nants, 3))
+    present = np.zeros(Nants, dtype=bool)
+    for num, name, pos in zip(uvd.antenna_numbers, uvd.antenna_names, uvd.antenna_positions):
+        names[num] = name
+        positions[num] = np.asarray(uvd.telescope_location) + pos
+        present[num] = True
+    diameters = getattr(uvd, 'antenna_diameters', None)
+    subtable('ANTENNA', Nants, dict(NAME=names, STATION=names, POSITION=positions, OFFSET=np.zeros((Nants, 3)),
+                                    TYPE=['GROUND-BASED'] * Nants, MOUNT=['ALT-AZ'] * Nants, FLAG_ROW=~present,
+                                    DISH_DIAMETER=np.full(Nants, 14.0 if diameters is None else np.median(diameters))))
+
+    # linear or circular feeds
+    feed_pols = ['R', 'L'] if np.any([5 <= c <= 8 for c in corr_type]) else ['X', 'Y']
+    subtable('FEED', Nants, dict(ANTENNA_ID=np.arange(Nants, dtype=np.int32), FEED_ID=np.zeros(Nants, dtype=np.int32),
+                                 SPECTRAL_WINDOW_ID=-np.ones(Nants, dtype=np.int32), BEAM_ID=-np.ones(Nants, dtype=np.int32),
+                                 TIME=np.full(Nants, times.mean()), INTERVAL=np.zeros(Nants),
+                                 NUM_RECEPTORS=np.full(Nants, 2, dtype=np.int32), POSITION=np.zeros((Nants, 3)),
+                                 BEAM_OFFSET=np.zeros((Nants, 2, 2)), RECEPTOR_ANGLE=np.zeros((Nants, 2)),
+                                 POLARIZATION_TYPE=np.array([feed_pols] * Nants),
+                                 POL_RESPONSE=np.tile(np.eye(2, dtype=np.complex64), (Nants, 1, 1))))
+
+    subtable('SPECTRAL_WINDOW', 1, dict(CHAN_FREQ=freqs[None], CHAN_WIDTH=chan_width[None],
+                                        EFFECTIVE_BW=chan_width[None], RESOLUTION=chan_width[None],
+                                        NUM_CHAN=np.array([Nfreqs], dtype=np.int32), REF_FREQUENCY=freqs[:1],
+                                        TOTAL_BANDWIDTH=np.array([chan_width.sum()]),
+                                        MEAS_FREQ_REF=np.array([5], dtype=np.int32), NAME=['SPW0'],
+                                        NET_SIDEBAND=np.array([1], dtype=np.int32)))
+    subtable('POLARIZATION', 1, dict(NUM_CORR=np.array([Npols], dtype=np.int32), CORR_TYPE=np.array([corr_type]),
+                                     CORR_PRODUCT=np.array([[_corr_products[c] for c in corr_type]], dtype=np.int32)))
+    subtable('DATA_DESCRIPTION', 1, dict(SPECTRAL_WINDOW_ID=np.array([0], dtype=np.int32),
+                                         POLARIZATION_ID=np.array([0], dtype=np.int32)))
+
+    # phase center, in J2000
+    phase_dir = np.array([[[uvd.phase_center_ra, uvd.phase_center_dec]]])
+    subtable('FIELD', 1, dict(NAME=[getattr(uvd, 'object_name', None) or 'FIELD0'], CODE=[''],
+                              PHASE_DIR=phase_dir, DELAY_DIR=phase_dir, REFERENCE_DIR=phase_dir,
+                              NUM_POLY=np.array([0], dtype=np.int32), SOURCE_ID=-np.ones(1, dtype=np.int32),
+                              TIME=np.array([times.mean()])))
+    subtable('OBSERVATION', 1, dict(TELESCOPE_NAME=[uvd.telescope_name], TIME_RANGE=np.array([[times.min(), times.max()]]),
+                                    OBSERVER=[''], PROJECT=[''], SCHEDULE_TYPE=['']))
+
+
+def write_ms(uvd, msfile, casa=None, run=subprocess.check_call, uvfits_file=None, keep_uvfits=False, direct=True,
+             clobber=False, clobber_uvfits=None):
+    """
+    Write a phased UVData object to a Measurement Set.
+
+    If direct and possible (see can_write_ms), the MS is written directly,
+    with UVData.write_ms if available (pyuvdata >= 2.2) and otherwise with
+    python-casacore. Otherwise the data are written to uvfits and converted
+    with CASA importuvfits.
+
+    Args:
+        uvd : phased UVData object
+        msfile : str, output MS filepath
+        casa : list of str, command to run casa, needed if not writing directly
+        run : function that runs a casa command line, Ex. subprocess.check_call or CasaWorker.check_call
+        uvfits_file : str, intermediate uvfits filepath. Default is msfile with .ms replaced by .uvfits.
+            If it already exists and clobber_uvfits is False, it is used as is.
+        keep_uvfits : bool, if False, remove the intermediate uvfits file once imported
+        direct : bool, if True write directly if possible
+        clobber : bool, overwrite an existing MS
+        clobber_uvfits : bool, overwrite an existing intermediate uvfits file. Default is clobber.
+
+    Returns:
+        bool, True if the MS was written directly
+    """
+    if os.path.exists(msfile):
+        if not clobber:
+            raise IOError("{} exists, not overwriting".format(msfile))
+        shutil.rmtree(msfile)
+
+    if direct and can_write_ms(uvd):
+        with trace.span('write_ms', 'io', file=msfile):
+            if hasattr(uvd, 'write_ms'):
+                uvd.write_ms(msfile, clobber=clobber)
+            else:
+                _write_ms_tables(uvd, msfile)
+        return True
+
+    if casa is None:
+        raise ValueError("casa command is required to import uvfits into {}".format(msfile))
+    if uvfits_file is None:
+        uvfits_file = os.path.splitext(msfile)[0] + '.uvfits'
+    if clobber_uvfits is None:
+        clobber_uvfits = clobber
+    if not os.path.exists(uvfits_file) or clobber_uvfits:
+        with trace.span('write_uvfits', 'io', file=uvfits_file):
+            uvd.write_uvfits(uvfits_file, spoof_nonessential=True)
+    run(list(casa) + ["-c", "importuvfits('{}', '{}')".format(uvfits_file, msfile)])
+    if not keep_uvfits:
+        os.remove(uvfits_file)
+
+    return False
@@ -18,6 +18,14 @@ from pyuvdata import UVData, UVFlag
 import pyuvdata.utils as uvutils
 import casa_imaging
 from casa_imaging import casa_utils as utils
+from casa_imaging import file_index
+from casa_imaging import uvdata_utils
+from casa_imaging.casa_worker import CasaWorker
+from casa_imaging import stages
+from casa_imaging.manifest import Manifest
+from casa_imaging.cache import ArtifactCache
+from casa_imaging.profiling import Profiler
+from casa_imaging import trace
 import os
 import sys
 import glob
@@ -30,8 +38,11 @@ from collections import OrderedDict as odict
 from astropy.time import Time
 import copy
 import operator
+import atexit
 import subprocess
 import argparse
+import threading
+import Queue
 
 # get casa_imaging path
 casa_scripts = casa_imaging.__path__[0]
@@ -68,9 +79,8 @@ for v in ['data_root', 'data_file', 'source', 'source_ra', 'source_dec']:
 if cf['io']['casa_scripts'] is None:
     cf['io']['casa_scripts'] = casa_scripts
 
-# Get algorithm dictionary
+# Get algorithm dictionary: read-only once stages start, as they may run concurrently
 algs = cf['algorithm']
-datafile = os.path.join(params['data_root'], params['data_file'])
 
 # Get parameters used globally in the pipeline
 verbose = params['verbose']
@@ -83,6 +93,16 @@ source_ra = params['source_ra']
 source_dec = params['source_dec']
 source = params['source']
 
+# configure astropy IERS tables, passing the policy on to subprocesses through the environment
+for v in ['iers_policy', 'iers_file']:
+    if params.get(v, None) is not None:
+        os.environ['CASA_IMAGING_{}'.format(v.upper())] = params[v]
+casa_imaging.coord_convs.set_iers_policy_from_env()
+
+# use a precomputed sidereal table for time conversions
+if params.get('sidereal_table', None) is not None:
+    casa_imaging.coord_convs.use_sidereal_table(params['sidereal_table'])
+
 # Change to working dir
 os.chdir(params['work_dir'])
 
@@ -99,9 +119,80 @@ casa += ['--logfile', logfile]
 sys.stdout = lf
 sys.stderr = ef
 
-# Setup (Small) Global Variable Dictionary
-varlist = ['datafile', 'verbose', 'overwrite', 'out_dir', 'casa', 'source_ra', 'source_dec', 'source',
-           'longitude', 'latitude', 'lf', 'gaintables']
+# run up to this many independent pipeline stages at once
+nworkers = params.get('nworkers', 1)
+
+# run CASA commands on persistent CASA processes if desired. A worker runs one command
+# at a time, so each concurrent stage gets its own, started on first use
+casa_workers = None
+if params.get('casa_worker', False):
+    casa_workers = Queue.Queue()
+    for i in range(max(1, nworkers)):
+        casa_worker = CasaWorker(casa, server_script=os.path.join(casa_scripts, 'casa_server.py'), verbose=verbose)
+        atexit.register(casa_worker.close)
+        casa_workers.put(casa_worker)
+
+# record timing and resource usage of stages and commands
+profiler = Profiler()
+
+# write a timeline of stages, commands, file I/O and script inner loops if desired,
+# passing the trace directory on to subprocesses through the environment
+if params.get('trace', False) and not trace.enabled():
+    os.environ[trace.TRACE_ENV] = os.path.abspath(os.path.join(out_dir, 'trace'))
+    for f in glob.glob(os.path.join(trace.trace_dir(), 'trace.*.jsonl')):
+        os.remove(f)
+
+def check_call(cmd):
+    """Run a command line like subprocess.check_call, recording its resource usage"""
+    return profiler.check_call(cmd)
+
+def run_casa(cmd):
+    """Run a casa command line like subprocess.check_call, on a free CASA worker if enabled"""
+    if casa_workers is not None:
+        t0 = datetime.utcnow()
+        casa_worker = casa_workers.get()
+        try:
+            status, log = casa_worker.run(cmd)
+        finally:
+            casa_workers.put(casa_worker)
+        profiler.record_command(cmd, (datetime.utcnow() - t0).total_seconds(), returncode=status)
+        if status != 0:
+            raise subprocess.CalledProcessError(status, cmd, log)
+        return 0
+    return profiler.check_call(cmd)
+
+# reuse model products of previous runs from a shared cache if desired
+artifact_cache = None
+if params.get('cache_dir', None) is not None:
+    cache_size = params.get('cache_size', None)
+    artifact_cache = ArtifactCache(params['cache_dir'], max_size=None if cache_size is None else cache_size * 1e9)
+
+def cached_call(key_cmd, inputs, outputs, func, *args):
+    """
+    Call func(*args) to make outputs, unless outputs of the same key_cmd and inputs
+    are in the artifact cache, in which case they are copied from the cache instead.
+    key_cmd is stripped of the casa command, --overwrite flags and out_dir.
+    """
+    if artifact_cache is None:
+        return func(*args)
+    key_cmd = [str(c) for c in key_cmd]
+    if key_cmd[:len(casa)] == casa:
+        key_cmd = key_cmd[len(casa):]
+    key = artifact_cache.key([c.replace(out_dir, '') for c in key_cmd if c != '--overwrite'], inputs)
+    if artifact_cache.fetch(key, outputs):
+        utils.log("...restored {} from cache".format(', '.join(outputs)), f=lf, verbose=verbose)
+        return 0
+    ecode = func(*args)
+    artifact_cache.store(key, outputs)
+    return ecode
+
+def stage_log(msg):
+    utils.log(msg, f=lf, verbose=verbose)
+
+# Setup (Small) Global Variable Dictionary of parameters fixed for the whole run.
+# Pipeline state that stages produce is passed to them explicitly instead.
+varlist = ['verbose', 'overwrite', 'out_dir', 'casa', 'source_ra', 'source_dec', 'source',
+           'longitude', 'latitude', 'lf']
 
 def global_vars(varlist=[]):
     d = []
@@ -128,7 +219,12 @@ class Dict2Obj:
 #-------------------------------------------------------------------------------
 # Search for a Source and Prepare Data for MS Conversion
 #-------------------------------------------------------------------------------
-if params['prep_data']:
+def prep_data_stage(datafile):
+    """
+    Prepare data for calibration and imaging, and return the new pipeline state and the list of files written
+    """
+    img_datafile, transit_jd = None, None
+    outputs = []
     # start block
     time = datetime.utcnow()
     utils.log("\n{}\n...Starting PREP_DATA: {}\n".format("-"*60, time), 
@@ -153,7 +249,7 @@ if params['prep_data']:
     else:
         # Iterate over polarizations
         if p.pols is None: p.pols = [None]
-        uvds = []
+        loads = []
         for pol in p.pols:
             if pol is None:
                 pol = ''
@@ -170,7 +266,8 @@ if params['prep_data']:
                 (lst, transit_jd, utc_range, utc_center, source_files,
                  source_utc_range) = source2file.source2file(source_ra, lon=longitude, lat=latitude,
                                                              duration=p.duration, start_jd=p.start_jd, get_filetimes=p.get_filetimes,
-                                                             verbose=verbose, jd_files=copy.copy(datafiles))
+                                                             verbose=verbose, jd_files=copy.copy(datafiles),
+                                                             index_file=getattr(p, 'index_file', None))
                 timerange = utc_range
 
                 # ensure source_utc_range and utc_range are similar
@@ -205,26 +302,66 @@ if params['prep_data']:
             else:
                 flagfiles = None
 
-            # load data into UVData
-            utils.log("...loading data", f=lf, verbose=verbose)
-            _uvds = []
-            for i, sf in enumerate(list(source_files)):
-                # read data
-                _uvd = UVData()
-                _uvd.read(sf, antenna_nums=p.antenna_nums)
-
-                # read and apply flagfile if fed
+            # get read-time selections, such that unneeded data is never loaded
+            source_files = list(source_files)
+            filetype = 'miriad' if os.path.isdir(source_files[0]) else 'uvh5'
+            read_kwargs = dict(antenna_nums=p.antenna_nums)
+            read_times = [None for sf in source_files]
+            index_file = getattr(p, 'index_file', None)
+            if source_ra is not None and (index_file is not None or filetype != 'miriad'):
+                # get times within duration of transit from file metadata
+                infos = file_index.index_files(source_files, index_file=index_file, filetype=filetype)
+                all_times = np.unique(np.concatenate([info['times'] for info in infos]))
+                transit_jd = np.mean(all_times)
+                window = all_times[np.abs(all_times - transit_jd) < (p.duration / (24. * 60. * 2))]
+                read_times = [np.intersect1d(info['times'], window) for info in infos]
+
+                # drop files without any times in window
+                keep = [i for i, t in enumerate(read_times) if len(t) > 0]
+                source_files = [source_files[i] for i in keep]
+                read_times = [read_times[i] for i in keep]
                 if flagfiles is not None:
-                    ff = flagfiles[i]
+                    flagfiles = [flagfiles[i] for i in keep]
+                assert len(source_files) > 0, "No times found in source_files given transit JD {} and duration {}".format(transit_jd, p.duration)
+
+            freq_chans = utils.parse_spw(getattr(p, 'read_spw', None))
+            if freq_chans is not None:
+                read_kwargs['freq_chans'] = freq_chans
+
+            if getattr(p, 'read_uvrange', None) is not None:
+                # get baselines within uvrange from file metadata
+                meta = UVData()
+                meta.read(source_files[0], read_data=filetype == 'miriad', antenna_nums=p.antenna_nums)
+                bl_min, bl_max = utils.parse_uvrange(p.read_uvrange, freqs=meta.freq_array)
+                antpos, ants = meta.get_ENU_antpos()
+                antpos = dict(zip(ants, antpos))
+                read_kwargs['bls'] = [bl for bl in meta.get_antpairs()
+                                      if bl_min <= np.linalg.norm(antpos[bl[1]] - antpos[bl[0]]) <= bl_max]
+                utils.log("...selecting {} baselines within uvrange {}".format(len(read_kwargs['bls']), p.read_uvrange),
+                          f=lf, verbose=verbose)
+
+            # queue files of this pol for loading
+            loads.append(dict(files=source_files, flagfiles=flagfiles,
+                              read_kwargs=[dict(read_kwargs, times=t) for t in read_times]))
+
+        # load data of all pols and files concurrently, and assemble in order
+        utils.log("...loading data", f=lf, verbose=verbose)
+        for l in loads:
+            if l['flagfiles'] is not None:
+                for ff in l['flagfiles']:
                     utils.log("...applying flags {}".format(ff), f=lf, verbose=verbose)
-                    uvf = UVFlag(ff)
-                    uvutils.apply_uvflag(_uvd, uvf, force_pol=True, flag_missing=True, inplace=True)
+        loaded = uvdata_utils.load_uvdata_files([sf for l in loads for sf in l['files']],
+                                                flagfiles=[ff for l in loads for ff in (l['flagfiles'] or [None] * len(l['files']))],
+                                                read_kwargs=[rk for l in loads for rk in l['read_kwargs']],
+                                                nproc=getattr(p, 'nproc', 1))
 
-                # append to list
-                _uvds.append(_uvd)
+        uvds = []
+        for l in loads:
+            _uvds, loaded = loaded[:len(l['files'])], loaded[len(l['files']):]
+            source_files = l['files']
 
             # concatenate source files
-            uvd = reduce(operator.add, _uvds)
+            uvd = uvdata_utils.concat_uvdata(_uvds, axis='blt')
 
             # isolate only relevant times
             times = np.unique(uvd.time_array)
@@ -238,7 +375,7 @@ if params['prep_data']:
             uvds.append(uvd)
 
         # concatenate uvds
-        uvd = reduce(operator.add, uvds)
+        uvd = uvdata_utils.concat_uvdata(uvds, axis='polarization')
 
         # get output filepath w/o uvfits extension if provided
         outfile = os.path.join(params['out_dir'], p.outfile.format(uvd.time_array.min()))
@@ -279,68 +416,139 @@ if params['prep_data']:
             np.savez("{}.renumber.npz".format(outfile),
                      renumber=dict(zip(renumber_dict.values(), renumber_dict.keys())),
                      history="Access dictionary via f['renumber'].item()")
-
-        # write to file
-        if uvd.phase_type == 'phased':
-            # write uvfits
-            uvfits_outfile = outfile + '.uvfits'
-            if not os.path.exists(uvfits_outfile) or overwrite:
-                utils.log("...writing {}".format(uvfits_outfile), f=lf, verbose=verbose)
-                uvd.write_uvfits(uvfits_outfile, spoof_nonessential=True)
-            # unphase to drift
-            uvd.unphase_to_drift()
-            # write miriad
-            if not os.path.exists(outfile) or overwrite:
-                utils.log("...writing {}".format(outfile), f=lf, verbose=verbose)
-                uvd.write_miriad(outfile, clobber=True)
-        elif uvd.phase_type == 'drift':
-            # write miriad
-            if not os.path.exists(outfile) or overwrite:
-                utils.log("...writing {}".format(outfile), f=lf, verbose=verbose)
+            outputs.append("{}.renumber.npz".format(outfile))
+
+        # average data for imaging and calibration products
+        img_avg = (getattr(p, 'img_tavg', None) or 1, getattr(p, 'img_favg', None) or 1)
+        cal_avg = (getattr(p, 'cal_tavg', None) or 1, getattr(p, 'cal_favg', None) or 1)
+        img_uvd = None
+        img_bda = getattr(p, 'img_bda', False)
+        if getattr(p, 'img_tavg', None) is not None or getattr(p, 'img_favg', None) is not None or img_bda:
+            if img_avg != cal_avg or img_bda:
+                utils.log("...averaging imaging data by {} integrations and {} channels".format(*img_avg), f=lf, verbose=verbose)
+                img_uvd = uvdata_utils.average_uvdata(uvd, tavg=img_avg[0], favg=img_avg[1])
+        if img_bda:
+            # baseline-dependent time averaging within the decorrelation limit of the field of view,
+            # which only applies once drift-scan data are phased to the field center
+            if img_uvd.phase_type == 'drift':
+                img_uvd.phase_to_time(Time(np.mean(img_uvd.time_array), format='jd'))
+            Nblts = img_uvd.Nblts
+            img_uvd = uvdata_utils.bda_average(img_uvd, getattr(p, 'bda_fov', 20.0), decorr=getattr(p, 'bda_decorr', 0.05),
+                                               max_tavg=getattr(p, 'bda_max_tavg', 16))
+            utils.log("...baseline-dependent averaging reduced imaging data from {} to {} baseline-times".format(Nblts, img_uvd.Nblts),
+                      f=lf, verbose=verbose)
+        if cal_avg != (1, 1):
+            utils.log("...averaging data by {} integrations and {} channels".format(*cal_avg), f=lf, verbose=verbose)
+            uvd = uvdata_utils.average_uvdata(uvd, tavg=cal_avg[0], favg=cal_avg[1])
+
+        # get intermediate products needed downstream: export_gains reads metadata from the miriad file
+        write_miriad = getattr(p, 'write_miriad', None)
+        if write_miriad is None:
+            write_miriad = (params['di_cal'] and dict(algs['gen_cal'].items() + algs['di_cal'].items()).get('export_gains', False)) \
+                           or (params['dd_cal'] and dict(algs['gen_cal'].items() + algs['dd_cal'].items()).get('export_gains', False))
+        write_uvfits = getattr(p, 'write_uvfits', False)
+        direct_ms = getattr(p, 'direct_ms', True)
+
+        # write imaging data to ms
+        if img_uvd is not None:
+            img_datafile = outfile + '.img.ms'
+            if not os.path.exists(img_datafile) or overwrite:
+                if img_uvd.phase_type == 'drift':
+                    img_uvd.phase_to_time(Time(np.mean(img_uvd.time_array), format='jd'))
+                utils.log("...writing {}".format(img_datafile), f=lf, verbose=verbose)
+                uvdata_utils.write_ms(img_uvd, img_datafile, casa=casa, run=run_casa, keep_uvfits=write_uvfits,
+                                      direct=direct_ms, clobber=True)
+            del img_uvd
+
+        # write drift miriad before phasing
+        phased = uvd.phase_type == 'phased'
+        if write_miriad and not phased and (not os.path.exists(outfile) or overwrite):
+            utils.log("...writing {}".format(outfile), f=lf, verbose=verbose)
+            with trace.span('write_miriad', 'io', file=outfile):
                 uvd.write_miriad(outfile, clobber=True)
-            # write uvfits
-            uvfits_outfile = outfile + '.uvfits'
-            if not os.path.exists(uvfits_outfile) or overwrite:
-                uvd.phase_to_time(Time(transit_jd, format='jd'))
-                utils.log("...writing {}".format(uvfits_outfile), f=lf, verbose=verbose)
-                uvd.write_uvfits(uvfits_outfile, spoof_nonessential=True)
+        if not phased:
+            uvd.phase_to_time(Time(transit_jd, format='jd'))
+        if direct_ms and not uvdata_utils.can_write_ms(uvd):
+            utils.log("...python-casacore unavailable, converting to MS via uvfits", f=lf, verbose=verbose)
 
-        # convert the uvfits file to ms
+        # write to ms, and uvfits if desired
         ms_outfile = outfile + '.ms'
-        utils.log("...converting to Measurement Set")
+        uvfits_outfile = outfile + '.uvfits'
+        if write_uvfits and (not os.path.exists(uvfits_outfile) or overwrite):
+            utils.log("...writing {}".format(uvfits_outfile), f=lf, verbose=verbose)
+            with trace.span('write_uvfits', 'io', file=uvfits_outfile):
+                uvd.write_uvfits(uvfits_outfile, spoof_nonessential=True)
         if not os.path.exists(ms_outfile) or overwrite:
-            if os.path.exists(ms_outfile):
-                shutil.rmtree(ms_outfile)
             utils.log("...writing {}".format(ms_outfile), f=lf, verbose=verbose)
-            ecode = subprocess.check_call(casa + ["-c", "importuvfits('{}', '{}')".format(uvfits_outfile, ms_outfile)])
+            uvdata_utils.write_ms(uvd, ms_outfile, casa=casa, run=run_casa, uvfits_file=uvfits_outfile,
+                                  keep_uvfits=write_uvfits, direct=direct_ms, clobber=True, clobber_uvfits=not write_uvfits)
+
+        # write miriad of data that were already phased
+        if write_miriad and phased and (not os.path.exists(outfile) or overwrite):
+            uvd.unphase_to_drift()
+            utils.log("...writing {}".format(outfile), f=lf, verbose=verbose)
+            with trace.span('write_miriad', 'io', file=outfile):
+                uvd.write_miriad(outfile, clobber=True)
 
         # overwrite relevant parameters for downstream analysis
         datafile = ms_outfile
+        if write_miriad:
+            outputs.append(outfile)
+        if write_uvfits:
+            outputs.append(uvfits_outfile)
 
         del uvds, uvd
 
-    # overwrite downstream parameters
-    algs['gen_model']['time'] = transit_jd
-
     # end block
     time2 = datetime.utcnow()
     utils.log("...finished PREP_DATA: {:d} sec elapsed".format(utils.get_elapsed_time(time, time2)), f=lf, verbose=verbose)
 
+    return dict(datafile=datafile, img_datafile=img_datafile, transit_jd=transit_jd), outputs
+
 #-------------------------------------------------------------------------------
 # Generate Flux Model
 #-------------------------------------------------------------------------------
 
+# Interpolate a frequency node model cube
+def expand_freq_nodes(fitsfile, p):
+    """
+    Interpolate a frequency node FITS cube onto p.freqs and return the output filepath
+    """
+    utils.log("...interpolating {} from frequency nodes".format(fitsfile), f=p.lf, verbose=p.verbose)
+    outfile = fitsfile.replace('.fits', '') + '.full.fits'
+    cmd = ["expand_freq_nodes.py", fitsfile, "--freqs", p.freqs, "--outfile", outfile]
+    if p.overwrite:
+        cmd += ['--overwrite']
+    cmd = map(str, cmd)
+    ecode = check_call(cmd)
+
+    return outfile
+
 # Make a Model Generation Function
 def gen_model(**kwargs):
+    """
+    Make a flux model, and return its filepath and the list of files made along the way
+    """
     p = Dict2Obj(**kwargs)
     utils.log("\n{}\n...Generating a Flux Model", f=p.lf, verbose=p.verbose)
 
+    # attenuate each source by the PB and make a component list, rather than an image cube
+    pb_sources = p.pbcorr and getattr(p, 'pb_sources', False)
+    image = p.image and not pb_sources
+
+    # rasterize image cube in Python rather than with CASA's ia.modify
+    rasterize = image and getattr(p, 'rasterize', False)
+
+    # make image cube at frequency nodes, and optionally interpolate back to full resolution
+    freq_nodes = getattr(p, 'freq_nodes', None) if rasterize else None
+    expand_nodes = freq_nodes is not None and getattr(p, 'expand_nodes', True)
+
     # compile complist_gleam.py command
     cmd = casa + ["-c", "{}/complist_gleam.py".format(casa_scripts)]
     cmd += ['--point_ra', p.source_ra, '--point_dec', p.latitude, '--outdir', p.out_dir, 
             '--gleamfile', p.gleamfile, '--radius', p.radius, '--min_flux', p.min_flux,
             '--freqs', p.freqs, '--cell', p.cell, '--imsize', p.imsize]
-    if p.image:
+    if image and not rasterize:
         cmd += ['--image']
     if p.use_peak:
         cmd += ['--use_peak']
@@ -353,15 +561,66 @@ def gen_model(**kwargs):
     else:
         p.file_ext = ''
     cmd = map(str, cmd)
-    ecode = subprocess.check_call(cmd)
 
     modelstem = os.path.join(p.out_dir, "gleam{}.cl".format(p.file_ext))
     model = modelstem
-    if p.image:
+    if image:
         model += ".image"
 
+    inputs = [p.gleamfile]
+    if hasattr(p, 'regions') and os.path.exists(p.regions):
+        inputs.append(p.regions)
+    outputs = [modelstem, modelstem + '.srcs.tab']
+    if image and not rasterize:
+        outputs += [modelstem + '.image', modelstem + '.fits']
+    ecode = cached_call(cmd, inputs, outputs, run_casa, cmd)
+
+    # rasterize source table into a FITS image cube
+    if rasterize:
+        utils.log("...rasterizing {} into an image cube".format(modelstem + '.srcs.tab'), f=p.lf, verbose=p.verbose)
+        cmd = ["srcs2cube.py", modelstem + '.srcs.tab', '--point_ra', p.source_ra, '--point_dec', p.latitude,
+               '--freqs', p.freqs, '--cell', p.cell, '--imsize', p.imsize]
+        if freq_nodes is not None:
+            cmd += ['--freq_nodes', freq_nodes]
+            if getattr(p, 'validate_nodes', False):
+                cmd += ['--validate']
+        if p.overwrite:
+            cmd += ['--overwrite']
+        cmd = map(str, cmd)
+        ecode = check_call(cmd)
+        outputs.append(modelstem + '.fits')
+
+        # importfits if not pbcorrecting
+        if not p.pbcorr:
+            fitsfile = modelstem + '.fits'
+            if expand_nodes:
+                fitsfile = expand_freq_nodes(fitsfile, p)
+                outputs.append(fitsfile)
+            cmd = p.casa + ["-c", "importfits('{}', '{}', overwrite={})".format(fitsfile, model, p.overwrite)]
+            ecode = run_casa(cmd)
+            outputs.append(model)
+
+    # attenuate sources by PB and make a component list
+    if pb_sources:
+        utils.log("...applying PB to model sources", f=p.lf, verbose=p.verbose)
+        cmd = ["pbcorr_srcs.py", modelstem + '.srcs.tab', "--lon", p.longitude, "--lat", p.latitude, "--time", p.time,
+               "--freqs", p.freqs, "--beamfile", p.beamfile, "--pols"] + [uvutils.polstr2num(pol) for pol in p.pols]
+        if p.overwrite:
+            cmd.append("--overwrite")
+        cmd = map(str, cmd)
+        ecode = cached_call(cmd, [modelstem + '.srcs.tab', p.beamfile], [modelstem + '.pbcorr.srcs.npz'],
+                            check_call, cmd)
+
+        # make component list
+        cmd = p.casa + ["-c", "{}/srcs2complist.py".format(casa_scripts), "--srcfile", modelstem + '.pbcorr.srcs.npz']
+        if p.overwrite:
+            cmd.append("--overwrite")
+        ecode = run_casa(cmd)
+        model = modelstem + ".pbcorr.cl"
+        outputs += [modelstem + '.pbcorr.srcs.npz', model]
+
     # pbcorrect
-    if p.pbcorr:
+    elif p.pbcorr:
         utils.log("...applying PB to model", f=p.lf, verbose=p.verbose)
         assert p.image, "Cannot pbcorrect flux model without image == True"
         cmd = ["pbcorr.py", "--lon", p.longitude, "--lat", p.latitude, "--time", p.time, "--pols"] \
@@ -373,33 +632,45 @@ def gen_model(**kwargs):
 
         # generate component list and / or image cube flux model
         cmd = map(str, cmd)
-        ecode = subprocess.check_call(cmd)
+        ecode = cached_call(cmd, [modelstem + '.fits', p.beamfile], [modelstem + '.pbcorr.fits', modelstem + '.pb.fits'],
+                            check_call, cmd)
         modelstem = os.path.join(p.out_dir, modelstem)
 
         # importfits
-        cmd = p.casa + ["-c", "importfits('{}', '{}', overwrite={})".format(modelstem + '.pbcorr.fits', modelstem + '.pbcorr.image', p.overwrite)]
-        ecode = subprocess.check_call(cmd)
+        fitsfile = modelstem + '.pbcorr.fits'
+        if expand_nodes:
+            fitsfile = expand_freq_nodes(fitsfile, p)
+            outputs.append(fitsfile)
+        cmd = p.casa + ["-c", "importfits('{}', '{}', overwrite={})".format(fitsfile, modelstem + '.pbcorr.image', p.overwrite)]
+        ecode = run_casa(cmd)
         model = modelstem + ".pbcorr.image"
+        outputs += [modelstem + '.pbcorr.fits', modelstem + '.pb.fits', model]
 
-    return model
+    return model, outputs
 
-if params['gen_model']:
+def gen_model_stage(transit_jd=None):
+    """
+    Generate a flux model at the transit time found in prep_data if available,
+    and return the new pipeline state and the list of files written
+    """
     # start block
     time = datetime.utcnow()
     utils.log("\n{}\n...Starting GEN_MODEL: {}\n".format("-"*60, time), 
                  f=lf, verbose=verbose)
-    utils.log(json.dumps(algs['gen_model'], indent=1) + '\n', f=lf, verbose=verbose)
+    model_kwargs = copy.deepcopy(algs['gen_model'])
+    if transit_jd is not None:
+        model_kwargs['time'] = transit_jd
+    utils.log(json.dumps(model_kwargs, indent=1) + '\n', f=lf, verbose=verbose)
 
     # Generate Model
-    model = gen_model(**dict(algs['gen_model'].items() + global_vars(varlist).items()))
-
-    # update di_cal model path
-    algs['di_cal']['model'] = model
+    model, outputs = gen_model(**dict(model_kwargs.items() + global_vars(varlist).items()))
 
     # end block
     time2 = datetime.utcnow()
     utils.log("...finished GEN_MODEL: {:d} sec elapsed".format(utils.get_elapsed_time(time, time2)), f=lf, verbose=verbose)
 
+    return dict(model=model), outputs
+
 #-------------------------------------------------------------------------------
 # Calibration and Imaging Functions
 #-------------------------------------------------------------------------------
@@ -445,13 +716,33 @@ def calibrate(**cal_kwargs):
     cmd = [' '.join(_cmd) if type(_cmd) == list else str(_cmd) for _cmd in cmd]
 
     utils.log("...starting calibration", f=p.lf, verbose=p.verbose)
-    ecode = subprocess.check_call(cmd)
+    ecode = run_casa(cmd)
+
+    # append to gaintables
+    gtables += gather_gaintables(p.datafile, p.gain_ext)
+
+    return gtables
 
-    # Gather gaintables
+def gather_gaintables(datafile, gain_ext):
+    """Get the gaintables of datafile made by sky_cal.py"""
+    gext = ''
+    if gain_ext not in ['', None]:
+        gext = '.{}'.format(gain_ext)
+    return sorted(glob.glob("{}{}.?.cal".format(datafile, gext)) + glob.glob("{}{}.????.cal".format(datafile, gext)))
+
+# Define a gain export function
+def export_gains(**cal_kwargs):
+    """
+    Export the gaintables of a calibration to calfits, optionally smoothing them,
+    and return the gaintables that should replace them and the list of files exported
+    """
+    kwargs = dict(cal_kwargs.items() + global_vars(varlist).items())
+    p = Dict2Obj(**kwargs)
     gext = ''
     if p.gain_ext not in ['', None]:
         gext = '.{}'.format(p.gain_ext)
-    gts = sorted(glob.glob("{}{}.?.cal".format(p.datafile, gext)) + glob.glob("{}{}.????.cal".format(p.datafile, gext)))
+    gts = gather_gaintables(p.datafile, p.gain_ext)
+    outputs = []
 
     # export to calfits if desired
     if p.export_gains:
@@ -508,7 +799,8 @@ def calibrate(**cal_kwargs):
                 cmd += ['--silence']
 
             cmd = map(str, cmd)
-            ecode = subprocess.check_call(cmd)
+            ecode = check_call(cmd)
+            outputs.append(os.path.join(p.out_dir, calfits_fname))
 
             # convert calfits back to a single Btotal.cal table
             if np.any(matchB):
@@ -518,14 +810,20 @@ def calibrate(**cal_kwargs):
                 cmd = p.casa + ["-c", "{}/calfits_to_Bcal.py".format(casa_scripts), "--cfits", os.path.join(p.out_dir, calfits_fname), "--inp_cfile", bfile,"--out_cfile", btot_file]
                 if overwrite:
                     cmd += ["--overwrite"]
-                ecode = subprocess.check_call(cmd)
+                ecode = run_casa(cmd)
                 # replace gaintables with Btotal.cal
                 gts = [btot_file]
 
-    # append to gaintables
-    gtables += gts
+    return gts, outputs
 
-    return gtables
+def replace_gaintables(gtables, cal_kwargs):
+    """
+    Replace the gaintables of a calibration in gtables with their exported versions,
+    returning the new gaintables and the list of files exported
+    """
+    gts = gather_gaintables(cal_kwargs['datafile'], cal_kwargs.get('gain_ext', None))
+    new_gts, outputs = export_gains(**cal_kwargs)
+    return [gt for gt in gtables if gt not in gts] + [gt for gt in new_gts if gt not in gtables], outputs
 
 # Define imaging functions
 def img_cmd(**kwargs):
@@ -548,6 +846,14 @@ def img_cmd(**kwargs):
     cmd = reduce(operator.add, [i if type(i) == list else [i] for i in cmd])
     return cmd, p
 
+def image_files(p, source_ext):
+    """Get the images and FITS files sky_image.py made of p.datafile with source_ext"""
+    im_stem = os.path.join(p.out_dir, os.path.basename(p.datafile))
+    sourcename = (p.source or '') + source_ext
+    if sourcename != '':
+        im_stem += '.{}'.format(sourcename)
+    return sorted(glob.glob(im_stem + '.*image') + glob.glob(im_stem + '.*fits'))
+
 def mfs_image(**kwargs):
     cmd, p = img_cmd(**kwargs)
 
@@ -566,13 +872,16 @@ def mfs_image(**kwargs):
         mfstype = '_{}'.format(p.mfstype)
     icmd += ['--source_ext', "{}{}".format(source_ext, mfstype)]
 
-    ecode = subprocess.check_call(icmd)
+    ecode = run_casa(icmd)
+    outputs = image_files(p, "{}{}".format(source_ext, mfstype))
 
     if p.mfstype == 'resid':
         # Apply gaintables to make CORRECTED column as it was
         utils.log("...reapplying gaintables to CORRECTED data", f=p.lf, verbose=p.verbose)
         cmd2 = p.casa + ["-c", "{}/sky_cal.py".format(casa_scripts), "--msin", p.datafile, "--gaintables"] + p.gaintables
-        ecode = subprocess.check_call(cmd2)
+        ecode = run_casa(cmd2)
+
+    return outputs
 
 def spec_image(**kwargs):
     cmd, p = img_cmd(**kwargs)
@@ -588,7 +897,8 @@ def spec_image(**kwargs):
         source_ext = '{}_'.format(p.source_ext)
     icmd += ['--source_ext', "{}spec".format(source_ext)]
 
-    ecode = subprocess.check_call(icmd)
+    ecode = run_casa(icmd)
+    outputs = image_files(p, "{}spec".format(source_ext))
 
     # Collate output images and run a source extraction
     img_cube_template = "{}.{}spec.chan????.image.fits".format(p.datafile, source_ext)
@@ -607,71 +917,169 @@ def spec_image(**kwargs):
                 cmd += ["--plot_fit"]
             cmd += img_cube
             cmd = map(str, cmd)
-            ecode = subprocess.check_call(cmd)
+            ecode = check_call(cmd)
+
+    return outputs
 
 # generalized MFS + spectral imaging function
-def image(**img_kwargs):
+def redundant_compress(msfile, tol=1.0):
+    """Export CORRECTED data of msfile, average it over redundant baselines and import it as an MS"""
+    uvfile = "{}.corr.uvfits".format(msfile)
+    red_uvfile = "{}.red.uvfits".format(msfile)
+    red_msfile = "{}.red.ms".format(msfile)
+    for f in [uvfile, red_uvfile]:
+        if os.path.exists(f):
+            os.remove(f)
+    if os.path.exists(red_msfile):
+        shutil.rmtree(red_msfile)
+
+    utils.log("...compressing redundant baselines of {}".format(msfile), f=lf, verbose=verbose)
+    ecode = run_casa(casa + ["-c", "exportuvfits('{}', '{}', datacolumn='corrected')".format(msfile, uvfile)])
+    ecode = check_call(["redundant_compress.py", uvfile, "--outfile", red_uvfile, "--tol", str(tol)])
+    utils.log("...writing {}".format(red_msfile), f=lf, verbose=verbose)
+    ecode = run_casa(casa + ["-c", "importuvfits('{}', '{}')".format(red_uvfile, red_msfile)])
+
+    return red_msfile
+
+def image(img_kwargs, datafile, img_datafile=None, gaintables=None):
+    """
+    Make the imaging products of img_kwargs from datafile, or from img_datafile if it was made,
+    and return the list of images, FITS files and Measurement Sets made
+    """
+    outputs = []
+    gaintables = gaintables or []
+    # apply gaintables to the separately averaged imaging data, and image it instead
+    img_file = datafile
+    if img_datafile is not None:
+        if gaintables:
+            utils.log("...applying gaintables to {}".format(img_datafile), f=lf, verbose=verbose)
+            cmd = casa + ["-c", "{}/sky_cal.py".format(casa_scripts), "--msin", img_datafile, "--gaintables"] + gaintables
+            ecode = run_casa(cmd)
+        img_file = img_datafile
+
+    # average corrected data over redundant baselines for imaging corrected data
+    corr_file = img_file
+    if img_kwargs.get('redundant_compress', False) and (img_kwargs['image_mfs'] or img_kwargs['image_spec']):
+        corr_file = redundant_compress(img_file, tol=img_kwargs.get('redundant_tol', 1.0))
+        outputs.append(corr_file)
+
+    # run imaging products as stages, concurrently if they don't modify the same MS
+    mfile = "{}.model".format(datafile)
+    img_stages = []
+    prefix = '' if profiler.current() is None else profiler.current() + '.'
+
     # Perform MFS of corrected data
     if img_kwargs['image_mfs']:
-        kwargs = dict(img_kwargs.items() + global_vars(varlist).items())
+        kwargs = dict(img_kwargs.items() + global_vars(varlist).items(), gaintables=gaintables)
+        kwargs['datafile'] = corr_file
         kwargs['mfstype'] = 'corr'
-        mfs_image(**kwargs)
+        img_stages.append(stages.Stage('mfs_corr', profiler.wrap(prefix + 'mfs_corr', mfs_image), kwargs=kwargs, inputs=[corr_file]))
 
     # Perform MFS of model data
     if img_kwargs['image_mdl']:
-        kwargs = dict(img_kwargs.items() + global_vars(varlist).items())
-        mfile = "{}.model".format(datafile)
+        kwargs = dict(img_kwargs.items() + global_vars(varlist).items(), gaintables=gaintables)
         if not os.path.exists(mfile):
             utils.log("Didn't split model from datafile, which is required to image the model", f=lf, verbose=verbose)
         else:
             kwargs['datafile'] = mfile
             kwargs['mfstype'] = 'model'
-            mfs_image(**kwargs)
+            img_stages.append(stages.Stage('mfs_model', profiler.wrap(prefix + 'mfs_model', mfs_image), kwargs=kwargs, inputs=[mfile]))
 
-    # Perform MFS of residual data
+    # Perform MFS of residual data: this uvsubs and reapplies gaintables to the MS
     if img_kwargs['image_res']:
-        kwargs = dict(img_kwargs.items() + global_vars(varlist).items())
+        kwargs = dict(img_kwargs.items() + global_vars(varlist).items(), gaintables=gaintables)
+        kwargs['datafile'] = img_file
         kwargs['mfstype'] = 'resid'
-        mfs_image(**kwargs)
+        img_stages.append(stages.Stage('mfs_resid', profiler.wrap(prefix + 'mfs_resid', mfs_image), kwargs=kwargs, mutates=[img_file]))
 
     # Get spectral cube of corrected data
     if img_kwargs['image_spec']:
-        kwargs = dict(img_kwargs.items() + global_vars(varlist).items())
-        spec_image(**kwargs)
+        kwargs = dict(img_kwargs.items() + global_vars(varlist).items(), gaintables=gaintables)
+        kwargs['datafile'] = corr_file
+        img_stages.append(stages.Stage('spec_corr', profiler.wrap(prefix + 'spec_corr', spec_image), kwargs=kwargs, inputs=[corr_file]))
 
     # Get spectral cube of model data
     if img_kwargs['image_mdl_spec']:
-        kwargs = dict(img_kwargs.items() + global_vars(varlist).items())
-        mfile = "{}.model".format(datafile)
+        kwargs = dict(img_kwargs.items() + global_vars(varlist).items(), gaintables=gaintables)
         if not os.path.exists(mfile):
             utils.log("Didn't split model from datafile, which is required to image the model", f=lf, verbose=verbose)
         else:
             kwargs['datafile'] = mfile
-            spec_image(**kwargs)
+            img_stages.append(stages.Stage('spec_model', profiler.wrap(prefix + 'spec_model', spec_image), kwargs=kwargs, inputs=[mfile]))
+
+    results = stages.run_stages(img_stages, nworkers=nworkers, log=stage_log)
+    for s in img_stages:
+        outputs += results[s.name]
+
+    return outputs
+
+def image_resources(img_kwargs):
+    """Get the pipeline state an imaging stage reads and modifies"""
+    inputs, mutates = ['datafile'], []
+    # gaintables are applied to the imaging MS, and reapplied after residual imaging
+    img_ms = np.any([algs['prep_data'].get(k, None) not in [None, False] for k in ['img_tavg', 'img_favg', 'img_bda']])
+    if img_ms or img_kwargs['image_res']:
+        inputs.append('gaintables')
+    if img_ms:
+        mutates.append('img_datafile')
+    if img_kwargs['image_res']:
+        mutates.append('img_datafile' if img_ms else 'datafile')
+    return inputs, mutates
 
 #-------------------------------------------------------------------------------
 # Direction Independent Calibration
 #-------------------------------------------------------------------------------
-if params['di_cal']:
+def di_cal_stage(datafile, model=None):
+    """
+    Calibrate datafile against the model made by gen_model if available,
+    and return the new pipeline state and the list of files written
+    """
     # start block
     time = datetime.utcnow()
     utils.log("\n{}\n...Starting DI_CAL: {}\n".format("-"*60, time), f=lf, verbose=verbose)
     cal_kwargs = copy.deepcopy(dict(algs['gen_cal'].items() + algs['di_cal'].items()))
+    if model is not None:
+        cal_kwargs['model'] = model
     utils.log(json.dumps(cal_kwargs, indent=1) + '\n', f=lf, verbose=verbose)
 
     # Perform Calibration
     kwargs = global_vars(varlist)
     kwargs.update(cal_kwargs)
+    kwargs['datafile'] = datafile
     gaintables = calibrate(**kwargs)
 
     # end block
     time2 = datetime.utcnow()
     utils.log("...finished DI_CAL: {:d} sec elapsed".format(utils.get_elapsed_time(time, time2)), f=lf, verbose=verbose)
 
+    return dict(gaintables=gaintables), []
+
+def di_export_stage(datafile, gaintables=None):
+    """
+    Export the gaintables of DI_CAL, and return the new pipeline state and the list of files written
+    """
+    # start block
+    time = datetime.utcnow()
+    utils.log("\n{}\n...Starting DI_EXPORT: {}\n".format("-"*60, time), f=lf, verbose=verbose)
+    cal_kwargs = copy.deepcopy(dict(algs['gen_cal'].items() + algs['di_cal'].items()))
+    cal_kwargs['datafile'] = datafile
+
+    # Export gains, replacing gaintables with any smoothed versions
+    gaintables, outputs = replace_gaintables(gaintables or [], cal_kwargs)
+
+    # end block
+    time2 = datetime.utcnow()
+    utils.log("...finished DI_EXPORT: {:d} sec elapsed".format(utils.get_elapsed_time(time, time2)), f=lf, verbose=verbose)
+
+    return dict(gaintables=gaintables), outputs
+
 #-------------------------------------------------------------------------------
 # Imaging
 #-------------------------------------------------------------------------------
-if params['di_img']:
+def di_img_stage(datafile, img_datafile=None, gaintables=None):
+    """
+    Image the calibrated data, and return the new pipeline state and the list of files written
+    """
     # start block
     time = datetime.utcnow()
     utils.log("\n{}\n...Starting DI_IMG: {}\n".format("-"*60, time), f=lf, verbose=verbose)
@@ -679,16 +1087,22 @@ if params['di_img']:
     utils.log(json.dumps(img_kwargs, indent=1) + '\n', f=lf, verbose=verbose)
 
     # Peform Imaging
-    image(**img_kwargs)
+    outputs = image(img_kwargs, datafile, img_datafile=img_datafile, gaintables=gaintables)
 
     # end block
     time2 = datetime.utcnow()
     utils.log("...finished DI_IMG: {:d} sec elapsed".format(utils.get_elapsed_time(time, time2)), f=lf, verbose=verbose)
 
+    return {}, outputs
+
 #-------------------------------------------------------------------------------
 # Direction Dependent Calibration
 #-------------------------------------------------------------------------------
-if params['dd_cal']:
+def dd_cal_stage(datafile, model=None, gaintables=None):
+    """
+    Calibrate datafile against a new model of its imaged sources, appending to the gaintables
+    of DI_CAL, and return the new pipeline state and the list of files written
+    """
     # start block
     time = datetime.utcnow()
     utils.log("\n{}\n...Starting DD_CAL: {}\n".format("-"*60, time), f=lf, verbose=verbose)
@@ -698,24 +1112,30 @@ if params['dd_cal']:
 
     # make a proper CASA spectral cube
     imname = '{}.{}'.format(datafile, p.model_ext)
-    utils.log("...making a dummmy CASA spectral cube {}".format(imname), f=lf, verbose=verbose)
-    cmd = casa + ['-c', "tclean(vis='{}', imagename='{}', niter=0, cell='{}arcsec', " \
-                            "imsize={}, spw='', specmode='cube', start=0, width=300, stokes='{}')" \
-                            "".format(datafile, imname, p.pxsize, p.imsize, p.stokes)]
-    ecode = subprocess.check_call(cmd)
-
-    # export to fits
-    utils.log("...exporting to fits", f=lf, verbose=verbose)
-    cmd = casa + ['-c', "exportfits('{}', '{}', overwrite={}, stokeslast=False)".format(imname+'.image', imname+".image.fits", overwrite)]
-    ecode = subprocess.check_call(cmd)
-
-    # erase all the original CASA files
-    files = [f for f in glob.glob("{}*".format(imname)) if '.fits' not in f]
-    for f in files:
-        try:
-            shutil.rmtree(f)
-        except:
-            os.remove(f)
+    def make_cube():
+        utils.log("...making a dummmy CASA spectral cube {}".format(imname), f=lf, verbose=verbose)
+        cmd = casa + ['-c', "tclean(vis='{}', imagename='{}', niter=0, cell='{}arcsec', " \
+                                "imsize={}, spw='', specmode='cube', start=0, width=300, stokes='{}')" \
+                                "".format(datafile, imname, p.pxsize, p.imsize, p.stokes)]
+        ecode = run_casa(cmd)
+
+        # export to fits
+        utils.log("...exporting to fits", f=lf, verbose=verbose)
+        cmd = casa + ['-c', "exportfits('{}', '{}', overwrite={}, stokeslast=False)".format(imname+'.image', imname+".image.fits", overwrite)]
+        ecode = run_casa(cmd)
+
+        # erase all the original CASA files
+        files = [f for f in glob.glob("{}*".format(imname)) if '.fits' not in f]
+        for f in files:
+            try:
+                shutil.rmtree(f)
+            except:
+                os.remove(f)
+
+    # the empty cube only depends on the frequencies and phase center of the data
+    key_cmd = ['dd_cal_cube', p.pxsize, p.imsize, p.stokes]
+    inputs = [os.path.join(datafile, 'SPECTRAL_WINDOW'), os.path.join(datafile, 'FIELD')]
+    cached_call(key_cmd, inputs, [imname + '.image.fits'], make_cube)
 
     # make a spectral model of the imaged sources
     utils.log("...making spectral model of {}".format(p.inp_images), f=lf, verbose=verbose)
@@ -735,12 +1155,12 @@ if params['dd_cal']:
     cmd += ['--exclude_sources'] + p.exclude_sources
     cmd = map(str, cmd)
 
-    ecode = subprocess.check_call(cmd)
+    ecode = check_call(cmd)
 
     # importfits
     utils.log("...importing from FITS", f=lf, verbose=verbose)
     cmd = casa +  ['-c', "importfits('{}', '{}', overwrite={})".format(imname+'.image.fits', imname+'.image', overwrite)]
-    ecode = subprocess.check_call(cmd)
+    ecode = run_casa(cmd)
  
     # make a new flux model
     utils.log("...making new flux model for peeled visibilities, drawing parameters from gen_model", f=lf, verbose=verbose)
@@ -754,43 +1174,51 @@ if params['dd_cal']:
 
     # Generate a New Model
     cal_kwargs['sourcefile'] = secondary_sourcefile
-    model = gen_model(**dict(cal_kwargs + global_vars(varlist).items()))
+    model, outputs = gen_model(**dict(cal_kwargs + global_vars(varlist).items()))
+    outputs += [imname + '.image.fits', imname + '.image', secondary_sourcefile]
 
     # uvsub model from corrected data
     utils.log("...uvsub CORRECTED - MODEL --> CORRECTED", f=lf, verbose=verbose)
     cmd = casa + ["-c", "uvsub('{}')".format(datafile)]
-    ecode = subprocess.check_call(cmd)
+    ecode = run_casa(cmd)
 
     # split corrected
     split_datafile = "{}{}{}".format(os.path.splitext(datafile)[0], p.file_ext, os.path.splitext(datafile)[1])
     utils.log("...split CORRECTED to {}".format(split_datafile))
     cmd = casa + ["-c", "split('{}', '{}', datacolumn='corrected')".format(datafile, split_datafile)]
-    ecode = subprocess.check_call(cmd)
+    ecode = run_casa(cmd)
+    outputs.append(split_datafile)
 
-    # Recalibrate
+    # Recalibrate, applying the existing gaintables first
     utils.log("...recalibrating with peeled visibilities", f=lf, verbose=verbose)
+    gaintables = list(gaintables or [])
     kwargs = dict(global_vars(varlist).items() + cal_kwargs.items())  # add order here is important
+    kwargs.update(datafile=datafile, gaintables=list(gaintables))
     dd_gtables = calibrate(**kwargs)
+    dd_gtables, calfits = replace_gaintables(dd_gtables, kwargs)
+    outputs += calfits
 
     # append new gaintables
-    try:
-        gaintables += dd_gtables
-    except NameError:
-        gaintables = dd_gtables
+    gaintables += [gt for gt in dd_gtables if gt not in gaintables]
 
     # apply gaintables to datafile
     utils.log("...applying all gaintables \n\t{}\nto {}".format('\n\t'.join(gaintables), datafile), f=lf, verbose=verbose)
     cmd = casa + ['-c', '{}/sky_cal.py'.format(casa_scripts), '--msin', datafile, '--gaintables'] + gaintables
-    ecode = subprocess.check_call(cmd)
+    ecode = run_casa(cmd)
 
     # end block
     time2 = datetime.utcnow()
     utils.log("...finished DD_CAL: {:d} sec elapsed".format(utils.get_elapsed_time(time, time2)), f=lf, verbose=verbose)
 
+    return dict(gaintables=gaintables, model=model), outputs
+
 #-------------------------------------------------------------------------------
 # Imaging
 #-------------------------------------------------------------------------------
-if params['dd_img']:
+def dd_img_stage(datafile, img_datafile=None, gaintables=None):
+    """
+    Image the calibrated data, and return the new pipeline state and the list of files written
+    """
     # start block
     time = datetime.utcnow()
     utils.log("\n{}\n...Starting DD_IMG: {}\n".format("-"*60, time), f=lf, verbose=verbose)
@@ -798,9 +1226,173 @@ if params['dd_img']:
     utils.log(json.dumps(img_kwargs, indent=1) + '\n', f=lf, verbose=verbose)
 
     # Peform Imaging
-    image(**img_kwargs)
+    outputs = image(img_kwargs, datafile, img_datafile=img_datafile, gaintables=gaintables)
 
     # end block
     time2 = datetime.utcnow()
     utils.log("...finished DD_IMG: {:d} sec elapsed".format(utils.get_elapsed_time(time, time2)), f=lf, verbose=verbose)
 
+    return {}, outputs
+
+#-------------------------------------------------------------------------------
+# Checkpoint and Resume
+#-------------------------------------------------------------------------------
+# pipeline state passed between stages. Each stage is called with the state it reads
+# as keyword arguments, and returns the state it writes, such that stages running on
+# separate threads only share state through the scheduler
+state_vars = ['datafile', 'img_datafile', 'transit_jd', 'model', 'gaintables']
+pipe_state = dict([(v, None) for v in state_vars])
+pipe_state['datafile'] = os.path.join(params['data_root'], params['data_file'])
+state_lock = threading.Lock()
+
+def run_stage(stage):
+    """
+    Call a stage function with the pipeline state it reads, update the pipeline
+    state it writes, and return the list of files it wrote
+    """
+    with state_lock:
+        kwargs = copy.deepcopy(dict([(v, pipe_state[v]) for v in state_vars if v in stage.reads()]))
+    kwargs.update(stage.kwargs)
+    state, outputs = stage.func(*stage.args, **kwargs)
+    undeclared = set(state) - stage.writes()
+    if len(undeclared) > 0:
+        raise ValueError("stage {} returned undeclared state {}".format(stage.name, sorted(undeclared)))
+    with state_lock:
+        pipe_state.update(state)
+    return outputs
+
+# algorithm parameters used by each stage
+stage_algs = {'prep_data': ['prep_data'], 'gen_model': ['gen_model'], 'di_cal': ['gen_cal', 'di_cal'],
+              'di_export': ['gen_cal', 'di_cal'], 'di_img': ['imaging', 'di_img'],
+              'dd_cal': ['gen_cal', 'dd_cal', 'gen_model'], 'dd_img': ['imaging', 'dd_img']}
+
+def stage_params(name):
+    """Get the parameters a stage runs with"""
+    d = dict(obs=cf['obs'], data=cf['data'])
+    d.update([(k, algs[k]) for k in stage_algs[name]])
+    return d
+
+# algorithm parameters naming input files, as glob-parseable paths or lists of them
+file_params = ['index_file', 'gleamfile', 'beamfile', 'regions', 'model', 'gaintables', 'mask',
+               'sourcefile', 'inp_images']
+
+def glob_files(patterns):
+    """Get the existing files matching glob-parseable paths, ignoring empty and None paths"""
+    files = []
+    for pat in patterns:
+        if isinstance(pat, (str, unicode)) and pat not in ['', 'None', 'none']:
+            files.extend(glob.glob(pat))
+    return sorted(set(files))
+
+def stage_input_files(name):
+    """Get the files outside of pipeline state that a stage reads, Ex. data, flags and catalogues"""
+    patterns = [params.get('sidereal_table', None), params.get('iers_file', None)]
+    for k in stage_algs[name]:
+        for fp in file_params:
+            val = algs[k].get(fp, None)
+            patterns.extend(val if isinstance(val, list) else [val])
+    files = glob_files(patterns)
+    if name == 'prep_data':
+        datafiles = glob_files([os.path.join(params['data_root'], params['data_file'])])
+        flag_ext = algs['prep_data'].get('flag_ext', None)
+        if flag_ext not in [None, '', 'None', 'none']:
+            # either glob-parseable from data_root or an extension to each data file stem
+            flagfiles = glob_files([os.path.join(params['data_root'], flag_ext)])
+            if len(flagfiles) == 0:
+                flagfiles = glob_files([os.path.splitext(df)[0] + flag_ext for df in datafiles])
+            datafiles += flagfiles
+        files += datafiles
+    return files
+
+def existing_files(paths):
+    """Get the paths in a list that exist, ignoring anything that isn't a path"""
+    return [f for f in paths if isinstance(f, (str, unicode)) and os.path.exists(f)]
+
+def state_files(names):
+    """Get the existing files referred to by pipeline state variables"""
+    files = []
+    with state_lock:
+        vals = [pipe_state[v] for v in names]
+    for val in vals:
+        files.extend(existing_files(val if isinstance(val, list) else [val]))
+    return files
+
+def restore_state(state):
+    """Restore pipeline state from the manifest"""
+    with state_lock:
+        pipe_state.update([(k, v) for k, v in state.items() if k in state_vars])
+
+def checkpoint_stages(pipe_stages, resume=True):
+    """
+    Wrap stages such that each is skipped if resume, it completed on a previous run with the
+    same parameters and input files, its files are unchanged and none of the stages it depends on reran.
+    Completed stages are recorded in the manifest, along with the files they return as
+    their outputs, such that a deleted or overwritten output also reruns its stage.
+    """
+    deps = stages.stage_dependencies(pipe_stages)
+    rerun = set()
+
+    def wrap(stage):
+        names = [v for v in state_vars if v in stage.reads() | stage.writes()]
+        def run():
+            with profiler.stage(stage.name) as record:
+                sp = stage_params(stage.name)
+                # a changed set of input files, Ex. a new data file matching data_file, also reruns the stage
+                inputs = stage_input_files(stage.name)
+                sp['input_files'] = inputs
+                if resume and len(deps[stage.name] & rerun) == 0 and manifest.is_current(stage.name, sp):
+                    utils.log("...{} is unchanged since the last run, restoring its outputs from {}".format(stage.name, manifest.path),
+                              f=lf, verbose=verbose)
+                    restore_state(manifest.state(stage.name))
+                    record['resumed'] = True
+                    return
+                rerun.add(stage.name)
+                files = state_files(names)
+                manifest.start(stage.name)
+                result = run_stage(stage)
+                with state_lock:
+                    state = dict([(v, pipe_state[v]) for v in names if v in stage.writes()])
+                outputs = state_files([v for v in names if v in stage.writes()]) + existing_files(result)
+                manifest.record(stage.name, sp, state, inputs + files + state_files(names) + outputs)
+                profiler.add_outputs(stage.name, outputs)
+                return result
+        return stages.Stage(stage.name, run, inputs=stage.inputs, outputs=stage.outputs,
+                            mutates=stage.mutates, after=stage.after)
+
+    return [wrap(s) for s in pipe_stages]
+
+#-------------------------------------------------------------------------------
+# Run Pipeline Stages
+#-------------------------------------------------------------------------------
+# stages wait on earlier stages that write pipeline state they use, and otherwise run concurrently
+pipe_stages = []
+if params['prep_data']:
+    pipe_stages.append(stages.Stage('prep_data', prep_data_stage, mutates=['datafile'], outputs=['img_datafile', 'transit_jd']))
+if params['gen_model']:
+    pipe_stages.append(stages.Stage('gen_model', gen_model_stage, inputs=['transit_jd'], outputs=['model']))
+if params['di_cal']:
+    pipe_stages.append(stages.Stage('di_cal', di_cal_stage, inputs=['model'], mutates=['datafile'], outputs=['gaintables']))
+    if dict(algs['gen_cal'].items() + algs['di_cal'].items()).get('export_gains', False):
+        pipe_stages.append(stages.Stage('di_export', di_export_stage, inputs=['datafile'], mutates=['gaintables']))
+if params['di_img']:
+    inputs, mutates = image_resources(dict(algs['imaging'].items() + algs['di_img'].items()))
+    pipe_stages.append(stages.Stage('di_img', di_img_stage, inputs=inputs, mutates=mutates))
+if params['dd_cal']:
+    pipe_stages.append(stages.Stage('dd_cal', dd_cal_stage, mutates=['datafile', 'gaintables', 'model']))
+if params['dd_img']:
+    inputs, mutates = image_resources(dict(algs['imaging'].items() + algs['dd_img'].items()))
+    pipe_stages.append(stages.Stage('dd_img', dd_img_stage, inputs=inputs, mutates=mutates))
+
+# skip stages that completed on a previous run with the same parameters and unchanged files
+manifest = Manifest(os.path.join(out_dir, params.get('manifest', 'skycal_manifest.json')))
+pipe_stages = checkpoint_stages(pipe_stages, resume=params.get('resume', True))
+
+# write a timing and resource report, and the merged trace timeline, even if a stage fails
+try:
+    stages.run_stages(pipe_stages, nworkers=nworkers, log=stage_log)
+finally:
+    profiler.write(os.path.join(out_dir, params.get('profile_report', 'skycal_profile.json')))
+    if trace.enabled():
+        trace_file = os.path.join(out_dir, params.get('trace_file', 'skycal_trace.json'))
+        Nevents = trace.merge(trace.trace_dir(), trace_file)
+        utils.log("...wrote {} trace events to {}".format(Nevents, trace_file), f=lf, verbose=verbose)
@@ -0,0 +1,113 @@
+"""
+casa_server.py
+--------------
+
+A long-lived CASA process that runs CASA scripts
+and commands sent to it over a local socket, such
+that a pipeline pays the CASA startup cost once.
+
+Requests and replies are JSON strings. A request is
+one of
+    {"script": path, "args": [...]}  : run a script as casa -c <script> <args>
+    {"code": str}                    : run a command as casa -c <code>
+    {"shutdown": true}               : stop the server
+and the reply is {"status": int, "log": str}, where
+status is the exit status the command would have had
+as its own CASA process, and log is its captured stdout
+and stderr.
+
+The socket authentication key is read from the
+CASA_SERVER_AUTHKEY environment variable.
+
+Run with casa as: casa -c casa_server.py --address <socket path>
+"""
+import os
+import sys
+import json
+import argparse
+import traceback
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+from multiprocessing.connection import Listener
+
+args = argparse.ArgumentParser(description="Run with casa as: casa -c casa_server.py <args>")
+args.add_argument("-c", type=str, help="Name of this script")
+args.add_argument("--address", type=str, help="Path of unix socket to listen on", required=True)
+
+
+class Tee(object):
+    """Write to a stream while also capturing what was written"""
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = StringIO()
+
+    def write(self, s):
+        self.stream.write(s)
+        self.buffer.write(s)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def run(request, namespace):
+    """Run a request in a copy of namespace and return its (status, log)"""
+    ns = dict(namespace)
+    ns['__name__'] = '__main__'
+    cwd = os.getcwd()
+    argv = sys.argv
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = Tee(stdout), Tee(stderr)
+    status = 0
+    try:
+        if 'script' in request:
+            ns['__file__'] = request['script']
+            sys.argv = ['casa', '-c', str(request['script'])] + [str(a) for a in request.get('args', [])]
+            with open(request['script']) as f:
+                exec(compile(f.read(), request['script'], 'exec'), ns)
+        else:
+            sys.argv = ['casa', '-c', request['code']]
+            exec(request['code'], ns)
+    except SystemExit as e:
+        if e.code is None:
+            status = 0
+        elif isinstance(e.code, int):
+            status = e.code
+        else:
+            print(e.code)
+            status = 1
+    except Exception:
+        traceback.print_exc()
+        status = 1
+    finally:
+        log = sys.stdout.buffer.getvalue() + sys.stderr.buffer.getvalue()
+        sys.stdout, sys.stderr = stdout, stderr
+        sys.argv = argv
+        os.chdir(cwd)
+
+    return status, log
+
+
+if __name__ == "__main__":
+    a = args.parse_args()
+
+    # snapshot of the CASA namespace, including its tasks and tools
+    namespace = dict(globals())
+
+    listener = Listener(a.address, family='AF_UNIX', authkey=os.environ.get('CASA_SERVER_AUTHKEY', '').encode())
+    conn = listener.accept()
+    try:
+        while True:
+            try:
+                request = json.loads(conn.recv_bytes().decode())
+            except EOFError:
+                break
+            if request.get('shutdown', False):
+                conn.send_bytes(json.dumps(dict(status=0, log='')).encode())
+                break
+            status, log = run(request, namespace)
+            conn.send_bytes(json.dumps(dict(status=status, log=log)).encode())
+    finally:
+        conn.close()
+        listener.close()
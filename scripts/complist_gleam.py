@@ -7,7 +7,8 @@ CASA component list and/or FITS image
 given the GLEAM point source catalogue.
 http://cdsarc.u-strasbg.fr/viz-bin/Cat?VIII/100
 
-Warning: Do not use CASA 5.3 to run this script, as it has a bug in ia.modify().
+Warning: Do not use CASA 5.3 to run this script with --image, as it has a bug in ia.modify().
+Use srcs2cube.py on the output *.srcs.tab file to make the image cube instead.
 
 Nick Kern
 Sept. 2018
@@ -48,11 +49,85 @@ args.add_argument("--exclude", default=False, action='store_true', help="If prov
 args.add_argument("--complists", type=str, nargs='*', default=None, help="Additional CASA component list strings or filepath to complist scripts.")
 args.add_argument("--exclude_nan_spix", default=False, action='store_true', help='If a source has a NaN spix, exclude it from complist, otherwise try to estimate it from photometry.')
 
+def fit_spix(data, rows, fstr, bands=(122, 130, 143, 151, 158, 166, 174)):
+    """
+    Estimate the spectral index of many GLEAM sources at once from
+    their photometry with a single weighted least-squares fit in
+    log-log space. Bands with NaN or non-positive flux are given zero weight.
+
+    Args:
+        data : GLEAM catalogue FITS table data
+        rows : integer ndarray of row indices of sources to fit
+        fstr : column format string of the photometric bands, Ex. "Fint{:03d}"
+        bands : photometric bands [MHz] to use if present in the catalogue
+
+    Returns: (spix, valid)
+        spix : ndarray of spectral indices, set to 0 if unreasonable (< -3 or > 1)
+        valid : boolean ndarray, False for sources with fewer than 2 usable bands
+    """
+    # get photometric bands present in the catalogue
+    bands = [b for b in bands if fstr.format(b) in data.dtype.fields]
+    x = np.log10(np.asarray(bands, dtype=np.float))
+
+    # form log-flux photometry matrix of shape (Nsources, Nbands)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        y = np.log10(np.array([data[fstr.format(b)][rows] for b in bands], dtype=np.float).T)
+    w = np.isfinite(y).astype(np.float)
+    y[w == 0] = 0.0
+
+    # solve all weighted linear regressions simultaneously
+    Sw = w.sum(axis=1)
+    Sx = (w * x).sum(axis=1)
+    Sy = (w * y).sum(axis=1)
+    Sxx = (w * x**2).sum(axis=1)
+    Sxy = (w * x * y).sum(axis=1)
+    valid = Sw >= 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        spix = (Sw * Sxy - Sx * Sy) / (Sw * Sxx - Sx**2)
+
+    # if this is unreasonable, set to 0
+    spix[valid & ((spix < -3) | (spix > 1))] = 0.0
+
+    return spix, valid
+
+def cl_record(labels, fluxes, spixs, ras, decs, ref_freq=151e6):
+    """
+    Build a CASA componentlist record of point sources with
+    power law spectra, for bulk insertion via cl.fromrecord().
+
+    Args:
+        labels : list of component labels
+        fluxes : ndarray of Stokes I fluxes [Jy] at ref_freq
+        spixs : ndarray of spectral indices
+        ras : ndarray of J2000 right ascensions [deg]
+        decs : ndarray of J2000 declinations [deg]
+        ref_freq : reference frequency of the fluxes [Hz]
+
+    Returns:
+        rec : componentlist record
+    """
+    rec = {'nelements': len(labels)}
+    for i, (label, flux, spix, ra, dec) in enumerate(zip(labels, fluxes, spixs, ras, decs)):
+        rec['component{}'.format(i)] = {
+            'label': label,
+            'flux': {'value': np.array([flux, 0.0, 0.0, 0.0]), 'unit': 'Jy',
+                     'polarisation': 'Stokes', 'error': np.zeros(4)},
+            'shape': {'type': 'Point',
+                      'direction': {'type': 'direction', 'refer': 'J2000',
+                                    'm0': {'value': ra * np.pi / 180, 'unit': 'rad'},
+                                    'm1': {'value': dec * np.pi / 180, 'unit': 'rad'}}},
+            'spectrum': {'type': 'Spectral Index', 'index': spix,
+                         'frequency': {'type': 'frequency', 'refer': 'LSRK',
+                                       'm0': {'value': ref_freq, 'unit': 'Hz'}}}}
+
+    return rec
+
+
 if __name__ == "__main__":
     a = args.parse_args()
 
     # check version:
-    if '5.3.' in casa['version']:
+    if a.image and '5.3.' in casa['version']:
         raise ValueError("Cannot run this script with CASA 5.3.* because it has a bug in its ia.modify() task!")
 
     basename = os.path.join(a.outdir, "gleam{}.cl".format(a.ext))
@@ -74,7 +149,7 @@ if __name__ == "__main__":
         return direction
 
     direction = "J2000 {}".format(deg2eq(a.point_ra, a.point_dec))
-    ref_freq = "151MHz"
+    ref_freq = 151e6  # Hz
 
     # Select all sources around pointing
     hdu = pyfits.open(a.gleamfile)
@@ -107,57 +182,45 @@ if __name__ == "__main__":
 
     # if regions provided, load them
     if a.regions is not None:
-        mask_ra, mask_dec = np.loadtxt(a.regions, dtype=np.float, usecols=(2, 3), unpack=True)
+        mask_ra, mask_dec = np.loadtxt(a.regions, dtype=np.float, usecols=(2, 3), unpack=True, ndmin=2)
         assert a.region_radius is not None, "if providing a list of sources, must specify region radius [deg]"
         mask_rad = a.region_radius
 
-    # iterate over sources and add to complist
+    # sort sources by distance from pointing
     select = select[np.argsort(dist[select])]
-    for s in select:
-        # get source info
-        flux = fluxes[s]
-        spix = data['alpha'][s]
-        s_ra, s_dec = data['RAJ2000'][s], data['DEJ2000'][s]
-        s_dir = deg2eq(s_ra, s_dec)
-        name = "GLEAM {}".format(s_dir)
-
-        # exclude or include if fed regions
-        if a.regions is not None:
-            mask_dists = np.sqrt((mask_ra - s_ra)**2 + (mask_dec - s_dec)**2)
-            if a.exclude:
-                if mask_dists.min() < mask_rad:
-                    continue
-            else:
-                if mask_dists.min() >= mask_rad:
-                    continue
-
-        # if spectral index is a nan, try to derive it by hand
-        if np.isnan(spix):
-            if a.exclude_nan_spix:
-                continue
-            frq = np.array([122., 130., 143., 151., 158., 166., 174.])
-            x = []
-            xstr = []
-            for f in frq:
-                xst = fstr.format(int(f))
-                if xst in data.dtype.fields:
-                    x.append(f)
-                    xstr.append(xst)
-            x = np.asarray(x, dtype=np.float)
-            y = np.log10([data[s][xs] for xs in xstr])
-            if sum(~np.isnan(y)) < 2:
-                # skip this source b/c all but 1 bins are negative or nan...
-                continue
-            spix = np.polyfit(np.log10(x)[~np.isnan(y)], y[~np.isnan(y)], deg=1)[0]
-
-            # if this is unreasonable, set to 0
-            if spix < -3 or spix > 1:
-                spix = 0
-
-        # create component list
-        cl.addcomponent(label=name, flux=flux, fluxunit="Jy", 
-                        dir="J2000 {}".format(s_dir), freq=ref_freq, shape='point',
-                        spectrumtype='spectral index', index=spix)
+
+    # get spectral indices, and if any are nan try to derive them from photometry
+    spixs = np.array(data['alpha'][select], dtype=np.float)
+    keep = np.ones(len(select), dtype=np.bool)
+    nan_spix = np.where(np.isnan(spixs))[0]
+    if len(nan_spix) > 0:
+        if a.exclude_nan_spix:
+            keep[nan_spix] = False
+        else:
+            spixs[nan_spix], valid = fit_spix(data, select[nan_spix], fstr)
+            # skip sources b/c all but 1 bins are negative or nan...
+            keep[nan_spix[~valid]] = False
+
+    # exclude or include if fed regions
+    if a.regions is not None and len(select) > 0:
+        mask_dists = np.sqrt((mask_ra[None, :] - data['RAJ2000'][select][:, None])**2
+                             + (mask_dec[None, :] - data['DEJ2000'][select][:, None])**2).min(axis=1)
+        if a.exclude:
+            keep &= mask_dists >= mask_rad
+        else:
+            keep &= mask_dists < mask_rad
+
+    # get source info of all kept sources
+    select, spixs = select[keep], spixs[keep]
+    src_flux = np.asarray(fluxes[select], dtype=np.float)
+    src_ra = np.asarray(data['RAJ2000'][select], dtype=np.float)
+    src_dec = np.asarray(data['DEJ2000'][select], dtype=np.float)
+    src_name = ["GLEAM {}".format(deg2eq(s_ra, s_dec)) for s_ra, s_dec in zip(src_ra, src_dec)]
+
+    # create component list in a single call
+    if len(select) > 0:
+        cl.fromrecord(cl_record(src_name, src_flux, spixs, src_ra, src_dec, ref_freq=ref_freq))
+    Ngleam = cl.length()
 
     # add other components if requested
     if a.complists is not None:
@@ -170,10 +233,13 @@ if __name__ == "__main__":
             else:
                 exec(complist)
 
-    # iterate over sources and get metadata and append to list
-    source = "{name:s}\t{flux:06.2f}\t{spix:02.2f}\t{ra:07.3f}\t{dec:07.3f}"
-    sources = []
-    for i in range(cl.length()):
+    # get metadata of GLEAM sources directly from arrays, at full precision for rasterizing
+    source = "{name:s}\t{flux:.6g}\t{spix:.6g}\t{ra:.6f}\t{dec:.6f}"
+    sources = [source.format(name=name, flux=flux, spix=spix, ra=s_ra, dec=s_dec)
+               for name, flux, spix, s_ra, s_dec in zip(src_name, src_flux, spixs, src_ra, src_dec)]
+
+    # iterate over any additional components and get metadata and append to list
+    for i in range(Ngleam, cl.length()):
         comp = cl.getcomponent(i)
         name = comp.get('label', None)
         flux = comp.get('flux', None).get('value', None)[0]
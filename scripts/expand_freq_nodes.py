@@ -0,0 +1,43 @@
+#!/usr/bin/env python2.7
+"""
+expand_freq_nodes.py
+====================
+
+Interpolate a FITS image cube made at a
+small number of frequency nodes (Ex. from
+srcs2cube.py --freq_nodes) onto full-resolution
+frequency channels.
+"""
+import numpy as np
+import argparse
+import os
+from casa_imaging import sky_model
+
+args = argparse.ArgumentParser(description="Interpolate a frequency node FITS image cube onto full-resolution frequencies.")
+
+args.add_argument("nodefile", type=str, help="Path to FITS image cube sampled at frequency nodes")
+args.add_argument("--freqs", type=str, help="Comma-separated values [MHz] for input into np.linspace({},{},{},endpoint=False)", required=True)
+args.add_argument("--outfile", default=None, type=str, help="Output FITS filepath. Default is nodefile with .fits replaced by .full.fits")
+args.add_argument("--chunk_size", default=64, type=int, help="Number of frequency channels to compute and write at a time.")
+args.add_argument("--validate", default=None, type=str, help="Path to a full-resolution FITS image cube to report node interpolation error against.")
+args.add_argument("--overwrite", default=False, action='store_true', help="Overwrite output FITS file.")
+
+if __name__ == "__main__":
+    a = args.parse_args()
+
+    # get output filename
+    if a.outfile is None:
+        a.outfile = a.nodefile.replace('.fits', '') + '.full.fits'
+
+    # get frequencies
+    start, stop, Nfreqs = a.freqs.split(',')
+    freqs = np.linspace(float(start), float(stop), int(Nfreqs), endpoint=False) * 1e6
+
+    # expand
+    print("...saving {}".format(a.outfile))
+    sky_model.expand_freq_nodes(a.nodefile, a.outfile, freqs, chunk_size=a.chunk_size, overwrite=a.overwrite)
+
+    # validate
+    if a.validate is not None:
+        abs_err, rel_err = sky_model.freq_node_error(a.nodefile, a.validate, chunk_size=a.chunk_size)
+        print("...max node interpolation error: {:.3e}, {:.3e} of channel peak".format(abs_err, rel_err))
@@ -0,0 +1,30 @@
+#!/usr/bin/env python2.7
+"""
+make_sidereal_table.py
+======================
+
+Tabulate LST and J2000 zenith RA for an observer
+over a range of Julian Dates, for fast interpolation
+in casa_imaging.coord_convs time conversions.
+"""
+import argparse
+from casa_imaging import coord_convs as cc
+
+args = argparse.ArgumentParser(description="Tabulate LST and J2000 zenith RA for an observer over a range of Julian Dates.")
+
+args.add_argument("--start_jd", type=float, help="Starting Julian Date of table.", required=True)
+args.add_argument("--end_jd", type=float, help="Ending Julian Date of table.", required=True)
+args.add_argument("--cadence", default=10.0, type=float, help="Spacing of table entries in minutes.")
+args.add_argument("--lon", default=21.42830, type=float, help="longitude of observer in degrees East")
+args.add_argument("--lat", default=-30.72152, type=float, help="latitude of observer in degrees North")
+args.add_argument("--outfile", default="sidereal_table.npz", type=str, help="Output .npz filepath.")
+args.add_argument("--overwrite", default=False, action='store_true', help="Overwrite output file.")
+
+if __name__ == "__main__":
+    a = args.parse_args()
+    cc.set_iers_policy_from_env()
+
+    print("...tabulating {} -- {} every {} minutes".format(a.start_jd, a.end_jd, a.cadence))
+    table = cc.make_sidereal_table(a.start_jd, a.end_jd, cadence=a.cadence, longitude=a.lon, latitude=a.lat,
+                                   outfile=a.outfile, overwrite=a.overwrite)
+    print("...saved {} entries to {}".format(len(table['jd']), a.outfile))
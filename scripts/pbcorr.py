@@ -24,6 +24,7 @@ import copy
 import healpy
 import scipy.stats as stats
 from casa_imaging import casa_utils
+from casa_imaging import coord_convs
 from scipy import interpolate
 from astropy.time import Time
 from astropy import coordinates as crd
@@ -65,6 +66,7 @@ if __name__ == "__main__":
 
     # parse args
     a = args.parse_args()
+    coord_convs.set_iers_policy_from_env()
     verbose = a.silence == False
 
     # load pb
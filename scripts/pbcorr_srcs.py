@@ -0,0 +1,110 @@
+#!/usr/bin/env python2.7
+"""
+pbcorr_srcs.py
+==============
+
+Primary Beam attenuation of a point
+source table output from complist_gleam.py,
+evaluating the beam only at each source.
+Writes an .npz table of apparent source fluxes
+for input into srcs2complist.py.
+"""
+import numpy as np
+from pyuvdata import UVBeam, utils as uvutils
+import os
+import argparse
+import warnings
+from casa_imaging import sky_model
+from casa_imaging import coord_convs
+
+
+args = argparse.ArgumentParser(description="Primary beam attenuation of a complist_gleam.py *.srcs.tab source table, given primary beam model")
+
+args.add_argument("srcfile", type=str, help='Path to tab-delimited source table output from complist_gleam.py')
+
+# PB args
+args.add_argument("--lon", default=21.42830, type=float, help="longitude of observer in degrees east")
+args.add_argument("--lat", default=-30.72152, type=float, help="latitude of observer in degrees north")
+args.add_argument("--time", type=float, help='time of middle of observation in Julian Date', required=True)
+args.add_argument("--freqs", default=None, type=str, help="Comma-separated values [MHz] for input into np.linspace({},{},{},endpoint=False)")
+args.add_argument("--ref_freq", default=151.0, type=float, help="Reference frequency [MHz] of source fluxes.")
+args.add_argument("--min_flux", default=0.0, type=float, help="Exclude sources whose apparent flux [Jy] is below this across all freqs and pols.")
+
+# beam args
+args.add_argument("--beamfile", type=str, help="path to primary beam in pyuvdata.uvbeam format", required=True)
+args.add_argument("--pols", type=int, nargs='*', default=[-5, -6], help="Polarization integers of beam models to use.")
+args.add_argument("--image_x_orientation", default='east', type=str, help='x_orientation of pols, either ["east", "north"]. default is "east"')
+args.add_argument("--freq_interp_kind", type=str, default='cubic', help="Interpolation method across frequency")
+
+# IO args
+args.add_argument("--outfile", type=str, default=None, help="Output .npz filepath. Default is srcfile with .srcs.tab replaced by .pbcorr.srcs.npz")
+args.add_argument("--overwrite", default=False, action='store_true', help='overwrite output file')
+args.add_argument("--silence", default=False, action='store_true', help='silence output to stdout')
+
+def echo(message, type=0):
+    if verbose:
+        if type == 0:
+            print(message)
+        elif type == 1:
+            print('\n{}\n{}'.format(message, '-'*40))
+
+if __name__ == "__main__":
+
+    # parse args
+    a = args.parse_args()
+    coord_convs.set_iers_policy_from_env()
+    verbose = a.silence == False
+
+    # get output filename
+    if a.outfile is None:
+        a.outfile = a.srcfile.replace('.srcs.tab', '') + '.pbcorr.srcs.npz'
+    if os.path.exists(a.outfile) and a.overwrite is False:
+        raise IOError("{} exists, not overwriting".format(a.outfile))
+
+    # get frequencies
+    if a.freqs is None:
+        freqs = np.array([151.0])
+    else:
+        start, stop, Nfreqs = a.freqs.split(',')
+        freqs = np.linspace(float(start), float(stop), int(Nfreqs), endpoint=False)
+    freqs *= 1e6
+
+    # load beam
+    echo("...loading beamfile {}".format(a.beamfile))
+    uvb = UVBeam()
+    uvb.read_beamfits(a.beamfile)
+    if uvb.pixel_coordinate_system == 'healpix':
+        uvb.interpolation_function = 'healpix_simple'
+    else:
+        uvb.interpolation_function = 'az_za_simple'
+    if uvb.x_orientation is None:
+        # assume default is east
+        warnings.warn("no x_orientation found in beam: assuming 'east' by default")
+        uvb.x_orientation = 'east'
+    beam_pols = [uvutils.polnum2str(p, x_orientation=uvb.x_orientation) for p in uvb.polarization_array]
+
+    # make sure required pols exist in beam
+    pols = [uvutils.polnum2str(pol, x_orientation=a.image_x_orientation) for pol in a.pols]
+    if not np.all([p in beam_pols for p in pols]):
+        raise ValueError("Required polarizationns {} not all found in beam polarization array".format(pols))
+
+    # load sources
+    echo("...loading {}".format(a.srcfile))
+    names, flux, spix, ra, dec = sky_model.load_srcs(a.srcfile)
+
+    # evaluate primary beam at each source
+    echo("...evaluating PB at {} sources".format(len(names)))
+    pb = sky_model.source_beam_response(uvb, ra, dec, freqs, a.time, longitude=a.lon, latitude=a.lat,
+                                        pols=pols, freq_interp_kind=a.freq_interp_kind)
+
+    # get apparent fluxes of shape (Npols, Nsources, Nfreqs)
+    apparent = pb * sky_model.source_spectra(flux, spix, freqs, ref_freq=a.ref_freq * 1e6)[None, :, :]
+
+    # exclude faint sources
+    keep = np.max(apparent, axis=(0, 2)) > a.min_flux
+    echo("...keeping {} of {} sources above apparent flux of {} Jy".format(keep.sum(), len(keep), a.min_flux))
+
+    echo("...saving {}".format(a.outfile))
+    np.savez(a.outfile, names=np.array(names)[keep], ra=ra[keep], dec=dec[keep], flux=flux[keep],
+             spix=spix[keep], freqs=freqs, pols=np.array(a.pols), apparent=apparent[:, keep],
+             ref_freq=a.ref_freq * 1e6, time=a.time)
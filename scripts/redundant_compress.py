@@ -0,0 +1,41 @@
+#!/usr/bin/env python2.7
+"""
+redundant_compress.py
+=====================
+
+Average calibrated visibilities within
+redundant baseline groups, weighting by
+nsamples and respecting flags, and write
+a compressed uvfits file for imaging.
+"""
+from pyuvdata import UVData
+import argparse
+import os
+from casa_imaging import uvdata_utils
+
+args = argparse.ArgumentParser(description="Average a uvfits file over redundant baseline groups.")
+
+args.add_argument("uvfile", type=str, help="Path to input uvfits file (Ex. from CASA exportuvfits of CORRECTED data)")
+args.add_argument("--outfile", default=None, type=str, help="Output uvfits filepath. Default is uvfile with .uvfits replaced by .red.uvfits")
+args.add_argument("--tol", default=1.0, type=float, help="Redundancy tolerance of baseline vectors [meters].")
+args.add_argument("--overwrite", default=False, action='store_true', help="Overwrite output uvfits file.")
+
+if __name__ == "__main__":
+    a = args.parse_args()
+
+    # get output filename
+    if a.outfile is None:
+        a.outfile = a.uvfile.replace('.uvfits', '') + '.red.uvfits'
+    if os.path.exists(a.outfile) and not a.overwrite:
+        raise IOError("{} exists, not overwriting".format(a.outfile))
+
+    print("...loading {}".format(a.uvfile))
+    uvd = UVData()
+    uvd.read_uvfits(a.uvfile)
+
+    # average redundant groups
+    red = uvdata_utils.redundant_average(uvd, tol=a.tol)
+    print("...redundant averaging reduced {} baselines to {}, and {} baseline-times to {}".format(uvd.Nbls, red.Nbls, uvd.Nblts, red.Nblts))
+
+    print("...saving {}".format(a.outfile))
+    red.write_uvfits(a.outfile, spoof_nonessential=True)
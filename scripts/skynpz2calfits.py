@@ -26,6 +26,7 @@ import scipy.signal as signal
 from sklearn import gaussian_process as gp
 import copy
 import hera_cal as hc
+from casa_imaging import trace
 import copy
 
 a = argparse.ArgumentParser(description="Turn CASA calibration solutions in {}.npz files from sky_image.py script into .calfits files")
@@ -341,11 +342,12 @@ def skynpz2calfits(fname, uv_file, dly_files=None, amp_files=None, bp_files=None
                     # stack real and imag into separate features
                     ydata = np.vstack([yreal, yimag]).T
 
-                    # fit for GP covariance
-                    GP.fit(xdata, ydata)
+                    with trace.span('gp_smooth', 'loop', ant=int(a), pol=str(p)):
+                        # fit for GP covariance
+                        GP.fit(xdata, ydata)
 
-                    # make predictions across full freq band and then add ymedian back in
-                    ypred = GP.predict(X)
+                        # make predictions across full freq band and then add ymedian back in
+                        ypred = GP.predict(X)
 
                     # append
                     ant_gain_real.append(ypred[:, 0])
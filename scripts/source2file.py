@@ -13,18 +13,25 @@ import argparse
 from astropy.time import Time
 from pyuvdata import UVData
 import sys
+import json
 import casa_imaging.coord_convs as cc
+from casa_imaging import file_index
 
 ap = argparse.ArgumentParser(description='')
 
-ap.add_argument("--ra", type=float, help="RA of the source in degrees (J2000)", required=True)
+ap.add_argument("--ra", type=float, nargs='+', help="RA of the source(s) in degrees (J2000)", required=True)
+ap.add_argument("--names", type=str, nargs='*', default=None, help="Name of each source in --ra for batch mode output")
 ap.add_argument("--lon", default=21.428305555, type=float, help="longitude of observer on Earth in degrees East")
+ap.add_argument("--lat", default=-30.72152, type=float, help="latitude of observer on Earth in degrees North")
 ap.add_argument("--start_jd", type=int, help="starting JD of interest")
+ap.add_argument("--end_jd", type=int, default=None, help="If provided, plan transits of all sources on every night from start_jd to end_jd inclusive")
 ap.add_argument("--duration", default=2.0, type=float, help="duration in minutes of calibrator integration")
 ap.add_argument("--offset", default=0.0, type=float, help="offset from closest approach in minutes")
 ap.add_argument("--jd_files", default=None, type=str, nargs='*', help="glob-parsable search of files to isolate calibrator within.")
 ap.add_argument("--get_filetimes", default=False, action='store_true', help="open source files and get more accurate duration timerange")
 ap.add_argument("--filetype", default='uvh5', type=str, help="filetypes")
+ap.add_argument("--index_file", default=None, type=str, help="Path to a JSON file index of jd_files metadata, created or updated as needed.")
+ap.add_argument("--outfile", default=None, type=str, help="If provided, write batch mode transit plan to this JSON file")
 
 def echo(message, type=0, verbose=True):
     if verbose:
@@ -35,7 +42,7 @@ def echo(message, type=0, verbose=True):
 
 
 def source2file(ra, lon=21.428305555, lat=-30.72152, duration=2.0, offset=0.0, start_jd=None,
-                    jd_files=None, get_filetimes=False, filetype='uvh5', verbose=False):
+                    jd_files=None, get_filetimes=False, filetype='uvh5', index_file=None, verbose=False):
     """
     """
     # get LST of source
@@ -76,19 +83,26 @@ def source2file(ra, lon=21.428305555, lat=-30.72152, duration=2.0, offset=0.0, s
         if len(files) == 0:
             raise AttributeError("length of jd_files is zero")
 
-        # try getting start JD of file from filename, otherwise open file
+        # get start JD of files from the file index
         file_jds = []
         file_uvs = []
-        for i, f in enumerate(files):
-            if str(start_jd) not in f:
-                uv = UVData()
-                uv.read(f, read_data=filetype.lower()=='miriad')
-                file_jds.append(uv.time_array.min())
-                file_uvs.append(uv)
-            else:
-                fjd = os.path.basename(f).split('.')
-                findex = fjd.index(str(start_jd))
-                file_jds.append(float('.'.join(fjd[findex:findex+2])))
+        file_infos = None
+        if index_file is not None:
+            file_infos = dict(zip(files, file_index.index_files(files, index_file=index_file, filetype=filetype,
+                                                                verbose=verbose)))
+            file_jds = [file_infos[f]['time_range'][0] for f in files]
+        else:
+            # try getting start JD of file from filename, otherwise open file
+            for i, f in enumerate(files):
+                if str(start_jd) not in f:
+                    uv = UVData()
+                    uv.read(f, read_data=filetype.lower()=='miriad')
+                    file_jds.append(uv.time_array.min())
+                    file_uvs.append(uv)
+                else:
+                    fjd = os.path.basename(f).split('.')
+                    findex = fjd.index(str(start_jd))
+                    file_jds.append(float('.'.join(fjd[findex:findex+2])))
 
         files = np.array(files)[np.argsort(file_jds)]
         if len(file_uvs) > 0:
@@ -123,6 +137,10 @@ def source2file(ra, lon=21.428305555, lat=-30.72152, duration=2.0, offset=0.0, s
             # Get UTC timerange of source in files
             file_jds = []
             for i, sf in enumerate(source_files):
+                # get times from file index
+                if file_infos is not None:
+                    file_jds.extend(file_infos[sf]['times'])
+                    continue
                 # check if file was already opened
                 if len(file_uvs) > 0:
                     uv = file_uvs[list(files).index(sf)]
@@ -154,12 +172,102 @@ def source2file(ra, lon=21.428305555, lat=-30.72152, duration=2.0, offset=0.0, s
 
     return (lst, jd, utc_range, utc_center, source_files, source_utc_range)
 
+
+def utc_str(time):
+    """
+    Format a datetime as a CASA UTC time string
+    """
+    return '{:04d}/{:02d}/{:02d}/{:02d}:{:02d}:{:02d}'.format(time.year, time.month, time.day,
+                                                              time.hour, time.minute, time.second)
+
+
+def plan_transits(ras, start_jd, end_jd=None, names=None, lon=21.428305555, lat=-30.72152, duration=2.0,
+                  offset=0.0, jd_files=None, filetype='uvh5', index_file=None, verbose=False):
+    """
+    Plan calibrator transits of many sources over many nights, with vectorized time conversions.
+
+    Args:
+        ras : list of source right ascensions in degrees (J2000)
+        start_jd : integer Julian Date of first night
+        end_jd : integer Julian Date of last night (inclusive). Default is start_jd.
+        names : list of source names, default is source index
+        lon : longitude of observer on Earth in degrees East
+        lat : latitude of observer on Earth in degrees North
+        duration : duration in minutes of calibrator integration
+        offset : offset from closest approach in minutes
+        jd_files : list of data files to search for each transit
+        filetype : filetype of jd_files
+        index_file : path to JSON file index of jd_files metadata, see casa_imaging.file_index
+        verbose : bool, if True report progress
+
+    Returns:
+        plan : list of dicts for each (night, source) holding 'name', 'ra', 'night', 'lst' [hours],
+            'transit_jd', 'utc_range', 'utc_center' and the 'files' of jd_files that overlap
+            the utc_range (None if jd_files is None)
+    """
+    ras = np.atleast_1d(ras).astype(np.float64)
+    if names is None:
+        names = [str(i) for i in range(len(ras))]
+    if end_jd is None:
+        end_jd = start_jd
+    nights = np.arange(int(start_jd), int(end_jd) + 1)
+
+    # get transit LST and JD of every source on every night: shape (Nnights, Nsources)
+    echo("...planning {} transits".format(len(nights) * len(ras)), type=1, verbose=verbose)
+    lst = cc.RA2Time(ras[None, :], nights[:, None], longitude=lon, latitude=lat, return_lst=True) * 12.0 / np.pi
+    lst += offset / 60.
+    jd = cc.LST2JD(lst * np.pi / 12., nights[:, None], longitude=lon)
+
+    # get UTC times
+    jd_duration = duration / (60. * 24 + 4.0)
+    time1 = Time((jd - jd_duration / 2).ravel(), format='jd').to_datetime()
+    time2 = Time((jd + jd_duration / 2).ravel(), format='jd').to_datetime()
+    time3 = Time(jd.ravel(), format='jd').to_datetime()
+
+    # get time ranges of files from the file index
+    if jd_files is not None:
+        infos = file_index.index_files(jd_files, index_file=index_file, filetype=filetype, verbose=verbose)
+        file_start = np.array([info['time_range'][0] for info in infos])
+        file_end = np.array([info['time_range'][1] for info in infos])
+        jd_files = np.array(jd_files)
+
+        # find files that overlap each transit: shape (Nnights * Nsources, Nfiles)
+        overlap = (file_start[None, :] <= (jd.ravel() + jd_duration / 2)[:, None]) \
+                  & (file_end[None, :] >= (jd.ravel() - jd_duration / 2)[:, None])
+
+    plan = []
+    for k, (i, j) in enumerate(np.ndindex(*jd.shape)):
+        plan.append(dict(name=names[j], ra=ras[j], night=int(nights[i]), lst=lst[i, j], transit_jd=jd[i, j],
+                         utc_range='"{}~{}"'.format(utc_str(time1[k]), utc_str(time2[k])),
+                         utc_center=utc_str(time3[k]),
+                         files=None if jd_files is None else sorted(jd_files[overlap[k]].tolist())))
+
+    return plan
+
+
 if __name__ == "__main__":
     # parse arge
     a = ap.parse_args()
+    cc.set_iers_policy_from_env()
     kwargs = dict(vars(a))
     ra = a.ra
-    kwargs.pop('ra')
+    for k in ['ra', 'names', 'end_jd', 'outfile']:
+        kwargs.pop(k)
     kwargs['verbose'] = True
-    output = source2file(ra, **kwargs)
+
+    if len(ra) == 1 and a.end_jd is None and a.outfile is None:
+        output = source2file(ra[0], **kwargs)
+
+    else:
+        # batch mode
+        if a.start_jd is None:
+            ap.error("--start_jd is required in batch mode")
+        for k in ['get_filetimes', 'start_jd']:
+            kwargs.pop(k)
+        plan = plan_transits(ra, a.start_jd, end_jd=a.end_jd, names=a.names, **kwargs)
+        for p in plan:
+            echo("{name}\t{night}\t{transit_jd:.5f}\t{utc_range}\t{files}".format(**p))
+        if a.outfile is not None:
+            with open(a.outfile, 'w') as f:
+                json.dump(plan, f, indent=1)
 
@@ -20,6 +20,7 @@ from astropy.wcs import WCS
 import pyuvdata.utils as uvutils
 import copy
 from casa_imaging import casa_utils
+from casa_imaging import trace
 
 try:
     from mpl_toolkits.mplot3d import Axes3D
@@ -284,7 +285,8 @@ if __name__ == "__main__":
     freqs = []
     for i, fname in enumerate(files):
         try:
-            output = source_extract(fname, source, source_ra, source_dec, **kwargs)
+            with trace.span('source_extract', 'loop', file=fname):
+                output = source_extract(fname, source, source_ra, source_dec, **kwargs)
         except:
             print(sys.exc_info())
             continue
@@ -0,0 +1,108 @@
+"""
+srcs2complist.py
+----------------
+
+Make a CASA component list of apparent
+(primary beam attenuated) source fluxes from
+the .npz output of pbcorr_srcs.py, where each
+component has a tabular spectrum.
+
+XX and YY apparent fluxes are stored as Stokes
+I = (XX + YY) / 2 and Q = (XX - YY) / 2, each
+with its own tabular spectrum.
+
+Run with casa as: casa -c srcs2complist.py <args>
+"""
+import os
+import numpy as np
+import argparse
+import shutil
+import sys
+
+args = argparse.ArgumentParser(description="Run with casa as: casa -c srcs2complist.py <args>")
+args.add_argument("-c", type=str, help="Name of this script")
+args.add_argument("--srcfile", type=str, help="Path to .npz output from pbcorr_srcs.py", required=True)
+args.add_argument("--outfile", type=str, default=None, help="Output component list. Default is srcfile with .srcs.npz replaced by .cl")
+args.add_argument("--ref_freq", type=float, default=None, help="Reference frequency [MHz] of component fluxes. Default is center of band.")
+args.add_argument("--overwrite", default=False, action='store_true', help="Overwrite output component list.")
+
+
+def cl_record(labels, stokesI, stokesQ, ras, decs, freqs, ref_chan):
+    """
+    Build a CASA componentlist record of point sources with
+    tabular spectra, for bulk insertion via cl.fromrecord().
+
+    Args:
+        labels : list of component labels
+        stokesI : ndarray of Stokes I fluxes [Jy] of shape (Nsources, Nfreqs)
+        stokesQ : ndarray of Stokes Q fluxes [Jy] of shape (Nsources, Nfreqs)
+        ras : ndarray of J2000 right ascensions [deg]
+        decs : ndarray of J2000 declinations [deg]
+        freqs : ndarray of tabular frequencies [Hz]
+        ref_chan : index of the reference frequency in freqs
+
+    Returns:
+        rec : componentlist record
+    """
+    rec = {'nelements': len(labels)}
+    for i, (label, ra, dec) in enumerate(zip(labels, ras, decs)):
+        rec['component{}'.format(i)] = {
+            'label': label,
+            'flux': {'value': np.array([stokesI[i, ref_chan], stokesQ[i, ref_chan], 0.0, 0.0]), 'unit': 'Jy',
+                     'polarisation': 'Stokes', 'error': np.zeros(4)},
+            'shape': {'type': 'Point',
+                      'direction': {'type': 'direction', 'refer': 'J2000',
+                                    'm0': {'value': ra * np.pi / 180, 'unit': 'rad'},
+                                    'm1': {'value': dec * np.pi / 180, 'unit': 'rad'}}},
+            'spectrum': {'type': 'Tabular Spectrum',
+                         'frequency': {'type': 'frequency', 'refer': 'LSRK',
+                                       'm0': {'value': float(freqs[ref_chan]), 'unit': 'Hz'}},
+                         'freqRef': 'LSRK', 'tabFreqVal': np.asarray(freqs, dtype=float),
+                         'ival': np.asarray(stokesI[i], dtype=float), 'qval': np.asarray(stokesQ[i], dtype=float),
+                         'uval': np.zeros(len(freqs)), 'vval': np.zeros(len(freqs))}}
+
+    return rec
+
+
+if __name__ == "__main__":
+    a = args.parse_args()
+
+    if a.outfile is None:
+        a.outfile = a.srcfile.replace('.srcs.npz', '') + '.cl'
+    if os.path.exists(a.outfile) and not a.overwrite:
+        print("{} already exists, not writing...".format(a.outfile))
+        sys.exit()
+
+    # load apparent fluxes of shape (Npols, Nsources, Nfreqs)
+    srcs = np.load(a.srcfile)
+    freqs = srcs['freqs']
+    pols = list(srcs['pols'])
+    apparent = srcs['apparent']
+
+    # convert to Stokes
+    if -5 in pols and -6 in pols:
+        xx, yy = apparent[pols.index(-5)], apparent[pols.index(-6)]
+        stokesI = (xx + yy) / 2.0
+        stokesQ = (xx - yy) / 2.0
+    else:
+        stokesI = apparent.mean(axis=0)
+        stokesQ = np.zeros_like(stokesI)
+
+    # get reference channel
+    if a.ref_freq is None:
+        ref_chan = len(freqs) // 2
+    else:
+        ref_chan = np.argmin(np.abs(freqs - a.ref_freq * 1e6))
+
+    # skip sources with no apparent flux at the reference frequency, and add the rest at once
+    keep = np.where(stokesI[:, ref_chan] > 0)[0]
+    cl.fromrecord(cl_record([str(srcs['names'][i]) for i in keep], stokesI[keep], stokesQ[keep],
+                            srcs['ra'][keep], srcs['dec'][keep], freqs, ref_chan))
+
+    # save
+    print("...including {} sources".format(cl.length()))
+    print("...saving {}".format(a.outfile))
+    if os.path.exists(a.outfile):
+        shutil.rmtree(a.outfile)
+    cl.rename(a.outfile)
+    cl.close()
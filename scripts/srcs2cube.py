@@ -0,0 +1,76 @@
+#!/usr/bin/env python2.7
+"""
+srcs2cube.py
+============
+
+Rasterize a point source table output
+from complist_gleam.py into a FITS image
+cube, without the use of CASA's ia.modify().
+"""
+import numpy as np
+import argparse
+import os
+from casa_imaging import sky_model
+
+args = argparse.ArgumentParser(description="Rasterize a complist_gleam.py *.srcs.tab source table into a FITS image cube.")
+
+# IO Arguments
+args.add_argument("srcfile", type=str, help="Path to tab-delimited source table output from complist_gleam.py")
+args.add_argument("--outfile", default=None, type=str, help="Output FITS filepath. Default is srcfile with .srcs.tab replaced by .fits")
+args.add_argument("--overwrite", default=False, action='store_true', help="Overwrite output FITS file.")
+
+# Image Arguments
+args.add_argument("--point_ra", type=float, help="Pointing RA in degrees 0 < ra < 360.", required=True)
+args.add_argument("--point_dec", type=float, help="Pointing Dec in degrees -90 < dec < 90.", required=True)
+args.add_argument("--freqs", default=None, type=str, help="Comma-separated values [MHz] for input into np.linspace({},{},{},endpoint=False)")
+args.add_argument("--ref_freq", default=151.0, type=float, help="Reference frequency [MHz] of source fluxes.")
+args.add_argument("--cell", default='200arcsec', type=str, help="Image pixel size in arcsec")
+args.add_argument("--imsize", default=512, type=int, help="Image side-length in pixels.")
+args.add_argument("--chunk_size", default=64, type=int, help="Number of frequency channels to compute and write at a time.")
+args.add_argument("--Nproc", default=1, type=int, help="Number of processes to use in computing channel chunks.")
+args.add_argument("--freq_nodes", default=None, type=int, help="If provided, make the cube at this many uniformly spaced frequency nodes "
+                  "spanning the first and last of --freqs, for interpolation with expand_freq_nodes.py.")
+args.add_argument("--validate", default=False, action='store_true', help="If --freq_nodes, also make the full-resolution cube "
+                  "and report the maximum error of the node interpolation.")
+
+if __name__ == "__main__":
+    a = args.parse_args()
+
+    # get output filename
+    if a.outfile is None:
+        a.outfile = a.srcfile.replace('.srcs.tab', '') + '.fits'
+
+    # get frequencies
+    if a.freqs is None:
+        freqs = np.array([151.0])
+    else:
+        start, stop, Nfreqs = a.freqs.split(',')
+        freqs = np.linspace(float(start), float(stop), int(Nfreqs), endpoint=False)
+
+    # load sources
+    names, flux, spix, ra, dec = sky_model.load_srcs(a.srcfile)
+    print("...loaded {} sources from {}".format(len(names), a.srcfile))
+
+    # get frequency nodes
+    freqs *= 1e6
+    if a.freq_nodes is not None:
+        full_freqs = freqs
+        freqs = sky_model.node_freqs(full_freqs, a.freq_nodes)
+        print("...making cube at {} frequency nodes".format(a.freq_nodes))
+
+    # rasterize
+    print("...saving {}".format(a.outfile))
+    Nsrcs = sky_model.rasterize_sources(a.outfile, flux, spix, ra, dec, a.point_ra, a.point_dec, a.cell,
+                                        a.imsize, freqs, ref_freq=a.ref_freq * 1e6,
+                                        chunk_size=a.chunk_size, Nproc=a.Nproc, overwrite=a.overwrite)
+    print("...{} sources fell within the image".format(Nsrcs))
+
+    # compare node interpolation against full-resolution cube
+    if a.freq_nodes is not None and a.validate:
+        reffile = a.outfile.replace('.fits', '') + '.ref.fits'
+        sky_model.rasterize_sources(reffile, flux, spix, ra, dec, a.point_ra, a.point_dec, a.cell,
+                                    a.imsize, full_freqs, ref_freq=a.ref_freq * 1e6,
+                                    chunk_size=a.chunk_size, Nproc=a.Nproc, overwrite=True)
+        abs_err, rel_err = sky_model.freq_node_error(a.outfile, reffile, chunk_size=a.chunk_size)
+        print("...max node interpolation error: {:.3e} Jy/pixel, {:.3e} of channel peak".format(abs_err, rel_err))
+        os.remove(reffile)
@@ -29,7 +29,10 @@ setup_args = {
     'scripts': ['scripts/pbcorr.py', 'scripts/source2file.py', 'scripts/make_model_cube.py',
                 'scripts/skynpz2calfits.py', 'scripts/source_extract.py',
                 'scripts/find_sources.py', 'scripts/calfits_to_Bcal.py',
-                'pipelines/skycal_pipe.py', 'scripts/get_model_vis.py', 'scripts/plot_fits.py'],
+                'pipelines/skycal_pipe.py', 'scripts/get_model_vis.py', 'scripts/plot_fits.py',
+                'scripts/srcs2cube.py', 'scripts/pbcorr_srcs.py',
+                'scripts/expand_freq_nodes.py', 'scripts/make_sidereal_table.py',
+                'scripts/redundant_compress.py'],
     'version': '0.1',
     'package_data': {'casa_imaging': data_files},
     'zip_safe': False,